@@ -3,7 +3,7 @@
 
 from services.pbiembedservice import PbiEmbedService
 from utils import Utils
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, render_template, request, send_from_directory
 import json
 import os
 
@@ -33,6 +33,35 @@ def get_embed_info():
     except Exception as ex:
         return json.dumps({'errorMsg': str(ex)}), 500
 
+@app.route('/refreshtoken', methods=['POST'])
+def refresh_token():
+    '''Returns a new Embed token for the reports and datasets already embedded by the client'''
+
+    config_result = Utils.check_config(app)
+    if config_result is not None:
+        return json.dumps({'errorMsg': config_result}), 500
+
+    try:
+        request_data = request.get_json(silent=True) or {}
+        report_ids = request_data.get('reportIds') or [app.config['REPORT_ID']]
+        dataset_ids = request_data.get('datasetIds') or []
+
+        if not dataset_ids:
+            return json.dumps({'errorMsg': 'Dataset IDs are not provided in the request'}), 400
+
+        # Only refresh the token for the configured report and the datasets it is bound to.
+        # In a real world application, verify that the user is allowed to access the requested reports and datasets
+        pbi_embed_service = PbiEmbedService()
+        allowed_dataset_ids = {pbi_embed_service.get_report_dataset_id(app.config['WORKSPACE_ID'], app.config['REPORT_ID'])}
+
+        if not set(report_ids) <= {app.config['REPORT_ID']} or not set(dataset_ids) <= allowed_dataset_ids:
+            return json.dumps({'errorMsg': 'The requested reports or datasets are not allowed'}), 403
+
+        embed_token = pbi_embed_service.get_embed_token_for_multiple_reports_single_workspace(report_ids, dataset_ids, app.config['WORKSPACE_ID'])
+        return json.dumps(embed_token.__dict__)
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
 @app.route('/favicon.ico', methods=['GET'])
 def getfavicon():
     '''Returns path of the favicon to be rendered'''
@@ -31,4 +31,10 @@ class BaseConfig(object):
     POWER_BI_USER = ''
     
     # Master user email password. Required only for MasterUser authentication mode.
-    POWER_BI_PASS = ''
\ No newline at end of file
+    POWER_BI_PASS = ''
+
+    # Minimum remaining validity (in minutes) for a cached Embed token to be handed out again
+    EMBED_TOKEN_MIN_VALIDITY_MINUTES = 10
+
+    # Number of minutes the dataset bound to a report is cached for, to check token refresh requests without fetching the report again
+    REPORT_DATASET_CACHE_MINUTES = 60
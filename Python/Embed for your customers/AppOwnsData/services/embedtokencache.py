@@ -0,0 +1,124 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from datetime import datetime, timedelta, timezone
+from flask import current_app as app
+from threading import Lock
+
+class EmbedTokenCache:
+
+    # Embed tokens keyed by the set of reports, datasets and target workspaces they were generated for
+    tokens = {}
+    lock = Lock()
+
+    # Dataset Id and fetch time of each report keyed by workspace and report Id
+    report_datasets = {}
+
+    def get_cache_key(request_body):
+        '''Returns the cache key for an Embed token request
+
+        Args:
+            request_body (EmbedTokenRequestBody): Embed token request body
+
+        Returns:
+            tuple: Cache key
+        '''
+
+        return (frozenset(dataset['id'] for dataset in request_body.datasets),
+                frozenset(report['id'] for report in request_body.reports),
+                frozenset(workspace['id'] for workspace in request_body.targetWorkspaces))
+
+    def get_token(request_body):
+        '''Returns a cached Embed token if it is valid for long enough to be handed out
+
+        Args:
+            request_body (EmbedTokenRequestBody): Embed token request body
+
+        Returns:
+            EmbedToken: Embed token or None
+        '''
+
+        cache_key = EmbedTokenCache.get_cache_key(request_body)
+        min_validity = timedelta(minutes=app.config['EMBED_TOKEN_MIN_VALIDITY_MINUTES'])
+
+        with EmbedTokenCache.lock:
+            embed_token = EmbedTokenCache.tokens.get(cache_key)
+            if embed_token is None:
+                return None
+
+            # Do not hand out a token which the client would have to refresh again right away
+            if EmbedTokenCache.parse_expiry(embed_token.tokenExpiry) - datetime.now(timezone.utc) <= min_validity:
+                del EmbedTokenCache.tokens[cache_key]
+                return None
+
+            return embed_token
+
+    def set_token(request_body, embed_token):
+        '''Stores an Embed token in the cache
+
+        Args:
+            request_body (EmbedTokenRequestBody): Embed token request body
+            embed_token (EmbedToken): Embed token generated for the request body
+        '''
+
+        cache_key = EmbedTokenCache.get_cache_key(request_body)
+
+        now = datetime.now(timezone.utc)
+
+        with EmbedTokenCache.lock:
+            # Evict the expired tokens so that the cache does not keep growing with every combination requested
+            for expired_key in [key for key, token in EmbedTokenCache.tokens.items() if EmbedTokenCache.parse_expiry(token.tokenExpiry) <= now]:
+                del EmbedTokenCache.tokens[expired_key]
+
+            EmbedTokenCache.tokens[cache_key] = embed_token
+
+    def get_report_dataset_id(workspace_id, report_id):
+        '''Returns the cached Id of the dataset bound to a report
+
+        Args:
+            workspace_id (str): Workspace Id
+            report_id (str): Report Id
+
+        Returns:
+            str: Dataset Id or None if it is not cached or too old
+        '''
+
+        max_age = timedelta(minutes=app.config['REPORT_DATASET_CACHE_MINUTES'])
+
+        with EmbedTokenCache.lock:
+            report_dataset = EmbedTokenCache.report_datasets.get((workspace_id, report_id))
+            if report_dataset is None or datetime.now(timezone.utc) - report_dataset[1] > max_age:
+                return None
+
+            return report_dataset[0]
+
+    def set_report_dataset_id(workspace_id, report_id, dataset_id):
+        '''Stores the Id of the dataset bound to a report
+
+        Args:
+            workspace_id (str): Workspace Id
+            report_id (str): Report Id
+            dataset_id (str): Dataset Id
+        '''
+
+        with EmbedTokenCache.lock:
+            EmbedTokenCache.report_datasets[(workspace_id, report_id)] = (dataset_id, datetime.now(timezone.utc))
+
+    def parse_expiry(token_expiry):
+        '''Parses the expiration returned by the Generate Token API
+
+        Args:
+            token_expiry (str): Expiration in ISO 8601 format (i.e. 2021-01-01T10:00:00Z)
+
+        Returns:
+            datetime: Timezone aware expiration
+        '''
+
+        # Trim fractional seconds as older Python versions cannot parse more than 6 digits
+        token_expiry = token_expiry.replace('Z', '+00:00')
+        if '.' in token_expiry:
+            timestamp, offset = token_expiry.split('.', 1)
+            offset = offset[offset.find('+'):] if '+' in offset else '+00:00'
+            token_expiry = timestamp + offset
+
+        return datetime.fromisoformat(token_expiry)
@@ -2,6 +2,7 @@
 # Licensed under the MIT license.
 
 from services.aadservice import AadService
+from services.embedtokencache import EmbedTokenCache
 from models.reportconfig import ReportConfig
 from models.embedtoken import EmbedToken
 from models.embedconfig import EmbedConfig
@@ -31,8 +32,9 @@ class PbiEmbedService:
             abort(api_response.status_code, description=f'Error while retrieving Embed URL\n{api_response.reason}:\t{api_response.text}\nRequestId:\t{api_response.headers.get("RequestId")}')
 
         api_response = json.loads(api_response.text)
-        report = ReportConfig(api_response['id'], api_response['name'], api_response['embedUrl'])
+        report = ReportConfig(api_response['id'], api_response['name'], api_response['embedUrl'], api_response['datasetId'])
         dataset_ids = [api_response['datasetId']]
+        EmbedTokenCache.set_report_dataset_id(workspace_id, report_id, api_response['datasetId'])
 
         # Append additional dataset to the list to achieve dynamic binding later
         if additional_dataset_id is not None:
@@ -42,6 +44,31 @@ class PbiEmbedService:
         embed_config = EmbedConfig(embed_token.tokenId, embed_token.token, embed_token.tokenExpiry, [report.__dict__])
         return json.dumps(embed_config.__dict__)
 
+    def get_report_dataset_id(self, workspace_id, report_id):
+        '''Get the Id of the dataset bound to a report, from the cache when it was fetched recently
+
+        Args:
+            workspace_id (str): Workspace Id
+            report_id (str): Report Id
+
+        Returns:
+            str: Dataset Id
+        '''
+
+        dataset_id = EmbedTokenCache.get_report_dataset_id(workspace_id, report_id)
+        if dataset_id is not None:
+            return dataset_id
+
+        report_url = f'https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/reports/{report_id}'
+        api_response = requests.get(report_url, headers=self.get_request_header())
+
+        if api_response.status_code != 200:
+            abort(api_response.status_code, description=f'Error while retrieving report\n{api_response.reason}:\t{api_response.text}\nRequestId:\t{api_response.headers.get("RequestId")}')
+
+        dataset_id = json.loads(api_response.text)['datasetId']
+        EmbedTokenCache.set_report_dataset_id(workspace_id, report_id, dataset_id)
+        return dataset_id
+
     def get_embed_params_for_multiple_reports(self, workspace_id, report_ids, additional_dataset_ids=None):
         '''Get embed params for multiple reports for a single workspace
 
@@ -69,7 +96,7 @@ class PbiEmbedService:
                 abort(api_response.status_code, description=f'Error while retrieving Embed URL\n{api_response.reason}:\t{api_response.text}\nRequestId:\t{api_response.headers.get("RequestId")}')
 
             api_response = json.loads(api_response.text)
-            report_config = ReportConfig(api_response['id'], api_response['name'], api_response['embedUrl'])
+            report_config = ReportConfig(api_response['id'], api_response['name'], api_response['embedUrl'], api_response['datasetId'])
             reports.append(report_config.__dict__)
             dataset_ids.append(api_response['datasetId'])
 
@@ -103,16 +130,7 @@ class PbiEmbedService:
         if target_workspace_id is not None:
             request_body.targetWorkspaces.append({'id': target_workspace_id})
 
-        # Generate Embed token for multiple workspaces, datasets, and reports. Refer https://aka.ms/MultiResourceEmbedToken
-        embed_token_api = 'https://api.powerbi.com/v1.0/myorg/GenerateToken'
-        api_response = requests.post(embed_token_api, data=json.dumps(request_body.__dict__), headers=self.get_request_header())
-
-        if api_response.status_code != 200:
-            abort(api_response.status_code, description=f'Error while retrieving Embed token\n{api_response.reason}:\t{api_response.text}\nRequestId:\t{api_response.headers.get("RequestId")}')
-
-        api_response = json.loads(api_response.text)
-        embed_token = EmbedToken(api_response['tokenId'], api_response['token'], api_response['expiration'])
-        return embed_token
+        return self.generate_embed_token(request_body)
 
     def get_embed_token_for_multiple_reports_single_workspace(self, report_ids, dataset_ids, target_workspace_id=None):
         '''Get Embed token for multiple reports, multiple dataset, and an optional target workspace
@@ -139,16 +157,7 @@ class PbiEmbedService:
         if target_workspace_id is not None:
             request_body.targetWorkspaces.append({'id': target_workspace_id})
 
-        # Generate Embed token for multiple workspaces, datasets, and reports. Refer https://aka.ms/MultiResourceEmbedToken
-        embed_token_api = 'https://api.powerbi.com/v1.0/myorg/GenerateToken'
-        api_response = requests.post(embed_token_api, data=json.dumps(request_body.__dict__), headers=self.get_request_header())
-
-        if api_response.status_code != 200:
-            abort(api_response.status_code, description=f'Error while retrieving Embed token\n{api_response.reason}:\t{api_response.text}\nRequestId:\t{api_response.headers.get("RequestId")}')
-        
-        api_response = json.loads(api_response.text)
-        embed_token = EmbedToken(api_response['tokenId'], api_response['token'], api_response['expiration'])
-        return embed_token
+        return self.generate_embed_token(request_body)
 
     def get_embed_token_for_multiple_reports_multiple_workspaces(self, report_ids, dataset_ids, target_workspace_ids=None):
         '''Get Embed token for multiple reports, multiple datasets, and optional target workspaces
@@ -176,6 +185,22 @@ class PbiEmbedService:
             for target_workspace_id in target_workspace_ids:
                 request_body.targetWorkspaces.append({'id': target_workspace_id})
 
+        return self.generate_embed_token(request_body)
+
+    def generate_embed_token(self, request_body):
+        '''Get Embed token from the shared token cache or generate a new one
+
+        Args:
+            request_body (EmbedTokenRequestBody): Embed token request body
+
+        Returns:
+            EmbedToken: Embed token
+        '''
+
+        embed_token = EmbedTokenCache.get_token(request_body)
+        if embed_token is not None:
+            return embed_token
+
         # Generate Embed token for multiple workspaces, datasets, and reports. Refer https://aka.ms/MultiResourceEmbedToken
         embed_token_api = 'https://api.powerbi.com/v1.0/myorg/GenerateToken'
         api_response = requests.post(embed_token_api, data=json.dumps(request_body.__dict__), headers=self.get_request_header())
@@ -185,6 +210,7 @@ class PbiEmbedService:
 
         api_response = json.loads(api_response.text)
         embed_token = EmbedToken(api_response['tokenId'], api_response['token'], api_response['expiration'])
+        EmbedTokenCache.set_token(request_body, embed_token)
         return embed_token
 
     def get_request_header(self):
@@ -18,6 +18,49 @@ $(function () {
         // }
     };
 
+    // Embed token is renewed when it is about to expire in the given number of minutes
+    var MINUTES_BEFORE_EXPIRATION = 10;
+
+    // Interval at which the Embed token expiry is checked
+    var TOKEN_CHECK_INTERVAL_MS = 30 * 1000;
+
+    var isRefreshingToken = false;
+
+    function refreshTokenIfNeeded(report, tokenRequest) {
+        var minutesToExpiration = (Date.parse(tokenExpiry) - Date.now()) / 60000;
+
+        if (isRefreshingToken || minutesToExpiration > MINUTES_BEFORE_EXPIRATION) {
+            return;
+        }
+
+        isRefreshingToken = true;
+        $.ajax({
+            type: "POST",
+            url: "/refreshtoken",
+            contentType: "application/json",
+            data: JSON.stringify(tokenRequest),
+            dataType: "json",
+            success: function (embedToken) {
+                tokenExpiry = embedToken.tokenExpiry;
+
+                // Set the new Embed token without reloading the report
+                report.setAccessToken(embedToken.token)
+                    .then(function () {
+                        console.log("Embed token refreshed");
+                    })
+                    .catch(function (error) {
+                        console.error(error);
+                    });
+            },
+            error: function (err) {
+                console.error(err.responseText);
+            },
+            complete: function () {
+                isRefreshingToken = false;
+            }
+        });
+    }
+
     $.ajax({
         type: "GET",
         url: "/getembedinfo",
@@ -36,6 +79,23 @@ $(function () {
             // Embed Power BI report when Access token and Embed URL are available
             var report = powerbi.embed(reportContainer, reportLoadConfig);
 
+            // Renew only the Embed token for the reports and datasets which are already embedded
+            var tokenRequest = {
+                reportIds: embedData.reportConfig.map(function (reportConfig) { return reportConfig.reportId; }),
+                datasetIds: embedData.reportConfig.map(function (reportConfig) { return reportConfig.datasetId; })
+            };
+
+            setInterval(function () {
+                refreshTokenIfNeeded(report, tokenRequest);
+            }, TOKEN_CHECK_INTERVAL_MS);
+
+            // Browsers throttle timers in background tabs, so check the token as soon as the tab is visible again
+            document.addEventListener("visibilitychange", function () {
+                if (!document.hidden) {
+                    refreshTokenIfNeeded(report, tokenRequest);
+                }
+            });
+
             // Triggers when a report schema is successfully loaded
             report.on("loaded", function () {
                 console.log("Report load successful")
@@ -1,22 +1,56 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from flask import Flask, json, render_template, request, Response, json
+from flask import Flask, json, render_template, request, Response, json, url_for
+from helper.asymmetrichigherkeyencryptionhelper import AsymmetricHigherKeyEncryptionHelper
 from services.aadservice import AadService
 from services.addcredentialsservice import AddCredentialsService
 from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from services.asyncpipelineservice import AsyncPipelineService
+from services.batchencryptionservice import BatchEncryptionService
+from services.cloudprofileregistry import CloudProfileConfig, CloudProfileRegistry
+from services.clusterencryptionservice import ClusterEncryptionService
+from services.credentialrotationservice import CredentialRotationService
+from services.datasourcehealthservice import DatasourceHealthService
+from services.datasourceinventoryservice import DatasourceInventoryService
 from services.datavalidationservice import DataValidationService
 from services.getdatasource import GetDatasourceService
+from services.jobqueueservice import JobQueueFullError, JobQueueService
 from services.updatecredentialsservice import UpdateCredentialsService
 from utils import Utils
 import requests
+import tempfile
+
+
+class MultiCloudFlask(Flask):
+
+    # Lets the cloud profile selected for a request override the configuration
+    config_class = CloudProfileConfig
+
 
 # Initialize the Flask app
-app = Flask(__name__)
+app = MultiCloudFlask(__name__)
 
 # Load configuration
 app.config.from_object('config.BaseConfig')
 
+# Load all the cloud profiles when one app serves every cloud
+if app.config['MULTI_CLOUD_ENABLED']:
+    CloudProfileRegistry.load(app)
+
+
+@app.before_request
+def select_cloud_profile():
+    ''' Routes the request to the cloud given by the cloud profile header or query parameter '''
+
+    if not app.config['MULTI_CLOUD_ENABLED']:
+        return None
+
+    try:
+        CloudProfileRegistry.select_cloud_profile(request.headers.get(app.config['CLOUD_PROFILE_HEADER']) or request.args.get('cloud'))
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+
 
 @app.route('/')
 def index():
@@ -52,21 +86,52 @@ def get_datasources_in_group():
 
 @app.route('/encryptcredential/updatedatasource', methods=['PUT'])
 def update_datasource():
-    ''' Updates the datasource with encrypted credentials '''
+    ''' Updates the datasource with encrypted credentials, as a background job when async=true is given '''
 
     try:
-        access_token = AadService.get_access_token()
-
         request_data = request.json['data']
+
+        # Validate the credentials data by the user
+        data_validation_service = DataValidationService()
+        data_validation_service.validate_creds(request_data) 
+
+        if request.args.get('async', '').lower() == 'true':
+            return queue_job('UpdateDatasource', update_datasource_operation, request_data)
+
+        return update_datasource_operation(request_data)
+
+    except JobQueueFullError as jx:
+        return json.dumps({'errorMsg': str(jx)}), 503, {'Retry-After': str(jx.retry_after_seconds)}
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+def update_datasource_operation(request_data):
+    ''' Updates the datasource with encrypted credentials
+
+    Args:
+        request_data (dict): Update data source request data
+
+    Returns:
+        Response: Endpoint response
+    '''
+
+    try:
         gateway_id = request_data['gatewayId']
         gateway = {
             'id': gateway_id,
             'publicKey': None,
         }
 
-        # Validate the credentials data by the user
-        data_validation_service = DataValidationService()
-        data_validation_service.validate_creds(request_data) 
+        if app.config['USE_ASYNC_PIPELINE']:
+            gateway_api_response, api_response = AsyncPipelineService().update_datasource(request_data)
+            return get_async_pipeline_response(gateway_api_response, api_response, gateway_id)
+
+        access_token = AadService.get_access_token()
 
         data_source_service = GetDatasourceService()
         gateway_api_response = data_source_service.get_gateway(access_token, gateway_id)
@@ -83,7 +148,17 @@ def update_datasource():
             access_token, request_data['credType'], request_data[
                 'privacyLevel'], request_data['credentialsArray'], gateway, request_data['datasourceId'])
 
+        # Retry once with the new public key if the cached one was stale
+        if not api_response.ok:
+            refreshed_gateway = data_source_service.refresh_gateway_after_rejection(access_token, gateway, api_response)
+            if refreshed_gateway is not None:
+                api_response = update_creds_service.update_datasource(
+                    access_token, request_data['credType'], request_data[
+                        'privacyLevel'], request_data['credentialsArray'], refreshed_gateway, request_data['datasourceId'])
+
         if api_response.ok:
+            # Check the data sources of the gateway again with the new credentials
+            DatasourceHealthService().invalidate_report(app.config['POWER_BI_API_URL'], gateway_id)
             return Response(api_response, api_response.status_code)
         else:
             return json.dumps({'errorMsg': str(f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')}), api_response.status_code
@@ -98,19 +173,49 @@ def update_datasource():
 
 @app.route('/encryptcredential/adddatasource', methods=['POST'])
 def add_datasource():
-    ''' Adds data source with encrypted credentials '''
+    ''' Adds data source with encrypted credentials, as a background job when async=true is given '''
 
     try:
-        access_token = AadService.get_access_token()
-
         request_data = request.json['data']
 
         # Validate the credentials data by the user
         data_validation_service = DataValidationService()
         data_validation_service.validate_add_data_source(request_data)
-        
+
+        if request.args.get('async', '').lower() == 'true':
+            return queue_job('AddDatasource', add_datasource_operation, request_data)
+
+        return add_datasource_operation(request_data)
+
+    except JobQueueFullError as jx:
+        return json.dumps({'errorMsg': str(jx)}), 503, {'Retry-After': str(jx.retry_after_seconds)}
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+def add_datasource_operation(request_data):
+    ''' Adds data source with encrypted credentials
+
+    Args:
+        request_data (dict): Add data source request data
+
+    Returns:
+        Response: Endpoint response
+    '''
+
+    try:
         gateway_id = request_data['gatewayId']
 
+        if app.config['USE_ASYNC_PIPELINE']:
+            gateway_api_response, api_response = AsyncPipelineService().add_datasource(request_data)
+            return get_async_pipeline_response(gateway_api_response, api_response, gateway_id)
+
+        access_token = AadService.get_access_token()
+
         data_source_service = GetDatasourceService()
         gateway_api_response = data_source_service.get_gateway(access_token, gateway_id)
 
@@ -130,7 +235,17 @@ def add_datasource():
             access_token, gateway, request_data['dataSourceType'], request_data['connectionDetails'], request_data[
                 'dataSourceName'], request_data['credType'], request_data['privacyLevel'], request_data['credentialsArray'])
 
+        # Retry once with the new public key if the cached one was stale
+        if not api_response.ok:
+            refreshed_gateway = data_source_service.refresh_gateway_after_rejection(access_token, gateway, api_response)
+            if refreshed_gateway is not None:
+                api_response = add_datasource_service.add_data_source(
+                    access_token, refreshed_gateway, request_data['dataSourceType'], request_data['connectionDetails'], request_data[
+                        'dataSourceName'], request_data['credType'], request_data['privacyLevel'], request_data['credentialsArray'])
+
         if api_response.ok:
+            # Check the data sources of the gateway again, including the new one
+            DatasourceHealthService().invalidate_report(app.config['POWER_BI_API_URL'], gateway_id)
             return Response(api_response, api_response.status_code)
         else:
             return json.dumps({'errorMsg': str(f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')}), api_response.status_code
@@ -148,13 +263,20 @@ def encrypt_credentials():
     ''' Encrypts the credentials for datasource '''
 
     try:
-        access_token = AadService.get_access_token()
-
         request_data = request.json['data']
 
         # Validate the credentials data by the user
         data_validation_service =  DataValidationService()
         data_validation_service.validate_encrypt_data(request_data)
+
+        if app.config['USE_ASYNC_PIPELINE']:
+            gateway_api_response, encrypted_credentials_string = AsyncPipelineService().encrypt_credentials(request_data)
+            if gateway_api_response is not None:
+                return json.dumps({'errorMsg' : str(f'Error {gateway_api_response.status_code} {gateway_api_response.reason}\nRequest Id:\t{gateway_api_response.headers.get("RequestId")}')}), gateway_api_response.status_code
+
+            return encrypted_credentials_string
+
+        access_token = AadService.get_access_token()
         gateway_id = request_data['gatewayId']
 
         data_source_service = GetDatasourceService()
@@ -187,5 +309,262 @@ def encrypt_credentials():
         return json.dumps({'errorMsg': str(ex)}), 500
 
 
+@app.route('/encryptcredential/encryptstream', methods=['POST'])
+def encrypt_credentials_stream():
+    ''' Encrypts the serialized credentials sent as the raw request body for the gatewayId gateway, without loading them in memory at once '''
+
+    try:
+        gateway_id = request.args.get('gatewayId')
+        if not gateway_id:
+            raise KeyError('Gateway ID')
+
+        access_token = AadService.get_access_token()
+
+        data_source_service = GetDatasourceService()
+        gateway_api_response = data_source_service.get_gateway(access_token, gateway_id)
+
+        if not gateway_api_response.ok:
+            return json.dumps({'errorMsg' : str(f'Error {gateway_api_response.status_code} {gateway_api_response.reason}\nRequest Id:\t{gateway_api_response.headers.get("RequestId")}')}), gateway_api_response.status_code
+
+        gateway = gateway_api_response.json()
+
+        # Cloud gateway does not contain name property and does not need encrypted credentials
+        if 'name' not in gateway:
+            reason = 'Stream encryption is not supported for cloud gateway.'
+            return json.dumps({'errorMsg': str(f'Error: {reason} ')}), 400
+
+        # Encrypt the request body chunk by chunk, the encrypted credentials are spilled to a temporary file when they are large
+        encrypted_credentials_stream = tempfile.SpooledTemporaryFile(max_size=AsymmetricHigherKeyEncryptionHelper.STREAM_SPOOL_MAX_SIZE, mode='w+')
+        try:
+            asymmetric_encryptor_service = AsymmetricKeyEncryptor(gateway['publicKey'])
+            asymmetric_encryptor_service.encode_credentials_stream(request.stream, encrypted_credentials_stream)
+        except Exception:
+            encrypted_credentials_stream.close()
+            raise
+
+        encrypted_credentials_stream.seek(0)
+
+        def read_encrypted_credentials():
+            with encrypted_credentials_stream:
+                yield from iter(lambda: encrypted_credentials_stream.read(AsymmetricHigherKeyEncryptionHelper.STREAM_CHUNK_SIZE), '')
+
+        return Response(read_encrypted_credentials(), 200, mimetype='text/plain')
+
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/encryptbatch', methods=['POST'])
+def encrypt_credentials_batch():
+    ''' Encrypts many credentials sets for one or more gateways and streams back the results as they finish '''
+
+    try:
+        access_token = AadService.get_access_token()
+
+        credentials_sets = request.json['data']
+        if not isinstance(credentials_sets, list) or not credentials_sets:
+            raise KeyError('Credentials sets')
+
+        # Validate the credentials data by the user
+        data_validation_service = DataValidationService()
+        for credentials_set in credentials_sets:
+            data_validation_service.validate_encrypt_data(credentials_set)
+
+        # Fetch each distinct gateway once for the whole batch
+        batch_encryption_service = BatchEncryptionService()
+        gateways, gateway_errors = batch_encryption_service.get_gateways(
+            access_token, [credentials_set['gatewayId'] for credentials_set in credentials_sets])
+
+        results = batch_encryption_service.encrypt_credentials(credentials_sets, gateways, gateway_errors)
+
+        # Stream one JSON object per line as soon as each credentials set is encrypted
+        return Response((json.dumps(result) + '\n' for result in results), 200, mimetype='application/x-ndjson')
+
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/encryptforcluster', methods=['POST'])
+def encrypt_credentials_for_cluster():
+    ''' Encrypts the credentials for every member gateway of a gateway cluster '''
+
+    try:
+        access_token = AadService.get_access_token()
+
+        request_data = request.json['data']
+
+        # Validate the credentials data by the user
+        data_validation_service = DataValidationService()
+        data_validation_service.validate_encrypt_cluster_data(request_data)
+
+        cluster_encryption_service = ClusterEncryptionService()
+        cluster_api_response = cluster_encryption_service.get_gateway_cluster(access_token, request_data['clusterId'])
+
+        if not cluster_api_response.ok:
+            return json.dumps({'errorMsg' : str(f'Error {cluster_api_response.status_code} {cluster_api_response.reason}\nRequest Id:\t{cluster_api_response.headers.get("RequestId")}')}), cluster_api_response.status_code
+
+        # Credential details for each member gateway, as expected by the gateway cluster data source APIs, and the members without a public key
+        credentials_details, skipped_member_gateways = cluster_encryption_service.get_cluster_credentials_details(
+            cluster_api_response.json(), request_data['credType'], request_data['privacyLevel'], request_data['credentialsArray'])
+
+        return json.dumps({'credentialDetails': credentials_details, 'skippedGateways': skipped_member_gateways})
+
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/rotatecredentials', methods=['POST'])
+def rotate_credentials():
+    ''' Updates the credentials of the data sources of a gateway selected by datasourceIds or connectionDetails and returns a per data source report '''
+
+    try:
+        access_token = AadService.get_access_token()
+
+        request_data = request.json['data']
+
+        # Validate the credentials data by the user
+        data_validation_service = DataValidationService()
+        data_validation_service.validate_encrypt_data(request_data)
+
+        credential_rotation_service = CredentialRotationService()
+        rotation_report = credential_rotation_service.rotate_credentials(
+            access_token, request_data['gatewayId'], request_data['credType'], request_data['privacyLevel'], request_data['credentialsArray'],
+            request_data.get('rotationId'), request_data.get('datasourceIds'), request_data.get('connectionDetails'))
+
+        return json.dumps(rotation_report)
+
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except ValueError as vx:
+        return json.dumps({'errorMsg': f'Invalid {str(vx)}'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/datasourcehealth', methods=['GET'])
+def check_datasource_health():
+    ''' Checks the connectivity of every data source of the gatewayId gateways and returns a report per gateway '''
+
+    try:
+        gateway_ids = [gateway_id for gateway_id in request.args.getlist('gatewayId') if gateway_id]
+        if not gateway_ids:
+            raise KeyError('Gateway ID')
+
+        access_token = AadService.get_access_token()
+
+        datasource_health_service = DatasourceHealthService()
+        health_reports = datasource_health_service.check_gateways(access_token, gateway_ids, request.args.get('refresh', '').lower() == 'true')
+
+        return json.dumps({'value': health_reports})
+
+    except KeyError as tx:
+        return json.dumps({'errorMsg': f'{str(tx)} not found'}), 400
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/inventory/refresh', methods=['POST'])
+def refresh_datasource_inventory():
+    ''' Crawls all the workspaces and datasets and updates the local data source inventory '''
+
+    try:
+        access_token = AadService.get_access_token()
+
+        request_data = (request.get_json(silent=True) or {}).get('data') or {}
+
+        datasource_inventory_service = DatasourceInventoryService()
+        refresh_summary = datasource_inventory_service.refresh(access_token, bool(request_data.get('fullRefresh')))
+
+        return json.dumps(refresh_summary)
+
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/inventory/datasources', methods=['GET'])
+def search_datasource_inventory():
+    ''' Returns the data sources of the local inventory matching the gatewayId, server, database, credType, datasourceType and groupId filters '''
+
+    try:
+        datasource_inventory_service = DatasourceInventoryService()
+        datasources = datasource_inventory_service.search(request.args)
+
+        return json.dumps({'value': datasources})
+
+    except Exception as ex:
+        return json.dumps({'errorMsg': str(ex)}), 500
+
+
+@app.route('/encryptcredential/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    ''' Returns the status of a background job, waiting for up to wait seconds for it to complete '''
+
+    try:
+        wait_seconds = float(request.args.get('wait', 0))
+    except ValueError:
+        return json.dumps({'errorMsg': 'Invalid wait'}), 400
+
+    job_queue_service = JobQueueService()
+    job = job_queue_service.get_job(job_id, wait_seconds)
+
+    if job is None:
+        return json.dumps({'errorMsg': f'Job {job_id} not found'}), 404
+
+    return json.dumps(job)
+
+
+def queue_job(operation, operation_function, request_data):
+    ''' Queues the operation as a background job and returns its status URL right away
+
+    Args:
+        operation (str): Name of the operation
+        operation_function (function): Function running the operation for the request data
+        request_data (dict): Request data
+
+    Returns:
+        Response: Endpoint response
+    '''
+
+    job_queue_service = JobQueueService()
+    job = job_queue_service.submit(operation, operation_function, request_data)
+
+    return json.dumps(job), 202, {'Location': url_for('get_job', job_id=job['jobId'])}
+
+
+def get_async_pipeline_response(gateway_api_response, api_response, gateway_id):
+    ''' Returns the endpoint response for the result of a data source request made on the async pipeline
+
+    Args:
+        gateway_api_response (AsyncApiResponse): Response of GET gateway API if it failed, otherwise None
+        api_response (AsyncApiResponse): Response of the data source API call
+        gateway_id (str): Gateway Id
+
+    Returns:
+        Response: Endpoint response
+    '''
+
+    if gateway_api_response is not None:
+        return json.dumps({'errorMsg' : str(f'Error {gateway_api_response.status_code} {gateway_api_response.reason}\nRequest Id:\t{gateway_api_response.headers.get("RequestId")}')}), gateway_api_response.status_code
+
+    if api_response.ok:
+        # Check the data sources of the gateway again with the new credentials
+        DatasourceHealthService().invalidate_report(app.config['POWER_BI_API_URL'], gateway_id)
+        return Response(api_response.text, api_response.status_code)
+    else:
+        return json.dumps({'errorMsg': str(f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')}), api_response.status_code
+
+
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,265 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Offline micro-benchmark for the credential encryption helpers.
+# Run from the Encryption sample folder:
+#   python -m benchmarks.encryptionbenchmark --save-baseline
+#   python -m benchmarks.encryptionbenchmark
+
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from helper.asymmetric1024keyencryptionhelper import Asymmetric1024KeyEncryptionHelper
+from helper.asymmetrichigherkeyencryptionhelper import AsymmetricHigherKeyEncryptionHelper
+from helper.authenticatedencryption import AuthenticatedEncryption
+from helper.publickeycache import PublicKeyCache
+from utils import Utils
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_PAYLOAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024]
+DEFAULT_KEY_SIZES = [1024, 2048, 4096]
+DEFAULT_THREAD_COUNTS = [1, 4]
+
+
+class BenchmarkCase:
+
+    def __init__(self, name, payload_size, key_size, operation):
+        self.name = name
+        self.payload_size = payload_size
+        self.key_size = key_size
+        self.operation = operation
+
+    def get_id(self):
+        ''' Returns the id used to match the case against the baseline
+
+        Returns:
+            String: Case id
+        '''
+
+        key_size = f'{self.key_size}bit' if self.key_size else 'nokey'
+        return f'{self.name}/{key_size}/{self.payload_size}B'
+
+
+class EncryptionBenchmark:
+
+    def __init__(self, duration, payload_sizes, key_sizes, thread_counts):
+        self.duration = duration
+        self.payload_sizes = payload_sizes
+        self.key_sizes = key_sizes
+        self.thread_counts = thread_counts
+
+    def get_public_key(self, key_size):
+        ''' Generates an RSA key and loads its public part the same way as a gateway public key
+
+        Args:
+            key_size (int): Key size in bits
+
+        Returns:
+            RSAPublicKey: Public key
+        '''
+
+        public_numbers = rsa.generate_private_key(65537, key_size, default_backend()).public_key().public_numbers()
+        gateway_public_key = {
+            'exponent': base64.b64encode(public_numbers.e.to_bytes(3, 'big')).decode(),
+            'modulus': base64.b64encode(public_numbers.n.to_bytes(key_size // 8, 'big')).decode()
+        }
+
+        return PublicKeyCache.load_public_key(gateway_public_key).public_key
+
+    def get_cases(self):
+        ''' Returns the benchmark cases for every helper, key size and payload size
+
+        Returns:
+            list: Benchmark cases
+        '''
+
+        cases = []
+        asymmetric_1024_key_encryption_helper = Asymmetric1024KeyEncryptionHelper()
+        asymmetric_higher_key_encryption_helper = AsymmetricHigherKeyEncryptionHelper()
+        authenticated_encryption = AuthenticatedEncryption()
+        public_keys = {key_size: self.get_public_key(key_size) for key_size in self.key_sizes}
+
+        for payload_size in self.payload_sizes:
+            payload = os.urandom(payload_size)
+
+            for key_size, public_key in public_keys.items():
+                # 1024 bit keys are encrypted segment by segment, higher keys use ephemeral AES and HMAC keys
+                if key_size == 1024:
+                    cases.append(BenchmarkCase('Asymmetric1024KeyEncryptionHelper.encrypt', payload_size, key_size,
+                                               lambda payload=payload, public_key=public_key: asymmetric_1024_key_encryption_helper.encrypt(payload, public_key)))
+                else:
+                    cases.append(BenchmarkCase('AsymmetricHigherKeyEncryptionHelper.encrypt', payload_size, key_size,
+                                               lambda payload=payload, public_key=public_key: asymmetric_higher_key_encryption_helper.encrypt(payload, public_key)))
+
+            key_enc = os.urandom(AsymmetricHigherKeyEncryptionHelper.AES_KEY_SIZE_BYTES)
+            key_mac = os.urandom(AsymmetricHigherKeyEncryptionHelper.HMAC_KEY_SIZE_BYTES)
+            cases.append(BenchmarkCase('AuthenticatedEncryption.encrypt', payload_size, None,
+                                       lambda payload=payload, key_enc=key_enc, key_mac=key_mac: authenticated_encryption.encrypt(key_enc, key_mac, payload)))
+
+            # Password of the payload size, serialized as Basic credentials
+            password = 'p' * payload_size
+            cases.append(BenchmarkCase('Utils.serialize_credentials', payload_size, None,
+                                       lambda password=password: Utils.serialize_credentials(['username', password], 'Basic')))
+
+        return cases
+
+    def measure_throughput(self, operation, thread_count):
+        ''' Runs the operation on the given number of threads for the benchmark duration
+
+        Args:
+            operation (function): Operation to run
+            thread_count (int): Number of threads
+
+        Returns:
+            float: Operations per second across all threads
+        '''
+
+        # Warm up caches and lazy initialization outside of the measurement
+        operation()
+
+        operation_counts = [0] * thread_count
+        barrier = threading.Barrier(thread_count + 1)
+        deadline = [0]
+
+        def run(thread_index):
+            barrier.wait()
+            count = 0
+            while time.perf_counter() < deadline[0]:
+                operation()
+                count += 1
+            operation_counts[thread_index] = count
+
+        threads = [threading.Thread(target=run, args=(thread_index,)) for thread_index in range(thread_count)]
+        for thread in threads:
+            thread.start()
+
+        start = time.perf_counter()
+        deadline[0] = start + self.duration
+        barrier.wait()
+
+        for thread in threads:
+            thread.join()
+
+        return sum(operation_counts) / (time.perf_counter() - start)
+
+    def measure_allocation(self, operation):
+        ''' Returns the peak number of bytes allocated by a single run of the operation
+
+        Args:
+            operation (function): Operation to run
+
+        Returns:
+            int: Bytes allocated
+        '''
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            current_before, _ = tracemalloc.get_traced_memory()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+            return peak - current_before
+        finally:
+            tracemalloc.stop()
+
+    def run(self):
+        ''' Runs all the benchmark cases
+
+        Returns:
+            dict: Results keyed by case id and thread count
+        '''
+
+        results = {}
+
+        for case in self.get_cases():
+            bytes_allocated = self.measure_allocation(case.operation)
+
+            for thread_count in self.thread_counts:
+                ops_per_second = self.measure_throughput(case.operation, thread_count)
+                result_id = f'{case.get_id()}/{thread_count}threads'
+                results[result_id] = {'opsPerSecond': ops_per_second, 'bytesAllocated': bytes_allocated}
+                print(f'{result_id:<70} {ops_per_second:>12.1f} ops/s {bytes_allocated:>12} bytes', flush=True)
+
+        return results
+
+
+def compare_with_baseline(results, baseline, throughput_threshold, allocation_threshold):
+    ''' Returns the regressions of the results against the baseline
+
+    Args:
+        results (dict): Benchmark results
+        baseline (dict): Baseline results
+        throughput_threshold (float): Allowed relative drop of operations per second
+        allocation_threshold (float): Allowed relative growth of bytes allocated
+
+    Returns:
+        list: Regression messages
+    '''
+
+    regressions = []
+
+    for result_id, result in results.items():
+        baseline_result = baseline.get(result_id)
+        if baseline_result is None:
+            continue
+
+        min_ops_per_second = baseline_result['opsPerSecond'] * (1 - throughput_threshold)
+        if result['opsPerSecond'] < min_ops_per_second:
+            regressions.append(f'{result_id}: {result["opsPerSecond"]:.1f} ops/s is below {min_ops_per_second:.1f} ops/s '
+                               f'(baseline {baseline_result["opsPerSecond"]:.1f} ops/s)')
+
+        max_bytes_allocated = baseline_result['bytesAllocated'] * (1 + allocation_threshold)
+        if result['bytesAllocated'] > max_bytes_allocated:
+            regressions.append(f'{result_id}: {result["bytesAllocated"]} bytes is above {max_bytes_allocated:.0f} bytes '
+                               f'(baseline {baseline_result["bytesAllocated"]} bytes)')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the credential encryption helpers and compares the results against a stored baseline')
+    parser.add_argument('--duration', type=float, default=1.0, help='Seconds each case runs for, per thread count')
+    parser.add_argument('--payload-sizes', type=int, nargs='+', default=DEFAULT_PAYLOAD_SIZES, help='Payload sizes in bytes')
+    parser.add_argument('--key-sizes', type=int, nargs='+', default=DEFAULT_KEY_SIZES, choices=DEFAULT_KEY_SIZES, help='RSA key sizes in bits')
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREAD_COUNTS, help='Thread counts')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Path of the baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline instead of comparing')
+    parser.add_argument('--throughput-threshold', type=float, default=0.2, help='Allowed relative drop of ops/s, i.e. 0.2 for 20%%')
+    parser.add_argument('--allocation-threshold', type=float, default=0.2, help='Allowed relative growth of bytes allocated, i.e. 0.2 for 20%%')
+    args = parser.parse_args()
+
+    results = EncryptionBenchmark(args.duration, args.payload_sizes, args.key_sizes, args.threads).run()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(results, baseline_file, indent=4, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline found at {args.baseline}, run with --save-baseline to create one')
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare_with_baseline(results, baseline, args.throughput_threshold, args.allocation_threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    if regressions:
+        return 1
+
+    print('No regressions against the baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
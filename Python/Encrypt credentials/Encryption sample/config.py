@@ -29,3 +29,98 @@ class BaseConfig(object):
 
     # Master user password. Required only for MasterUser authentication mode.
     POWER_BI_PASS = ''
+
+    # Path of the file Access tokens are cached in across restarts, i.e. tokencache.bin. Leave empty to cache tokens in memory only.
+    TOKEN_CACHE_FILE = ''
+
+    # Key the token cache file is encrypted with. Required only when TOKEN_CACHE_FILE is set.
+    # Generate one with: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+    TOKEN_CACHE_ENCRYPTION_KEY = ''
+
+    # Number of seconds gateway information, including its public key, is cached for
+    GATEWAY_CACHE_TTL_SECONDS = 900
+
+    # Number of seconds a gateway which is not found (i.e. cloud gateway) is cached for
+    GATEWAY_NEGATIVE_CACHE_TTL_SECONDS = 300
+
+    # Directory in which credential rotation journals are written, used to resume interrupted rotations
+    ROTATION_JOURNAL_DIRECTORY = 'rotationjournals'
+
+    # Maximum number of data sources updated concurrently during a credential rotation
+    ROTATION_MAX_CONCURRENCY = 8
+
+    # Maximum number of member gateways of a cluster the credentials are encrypted for concurrently
+    CLUSTER_ENCRYPTION_MAX_WORKERS = 8
+
+    # Run the update, add and encrypt endpoints on the async pipeline, which overlaps token acquisition, gateway lookup and encryption
+    USE_ASYNC_PIPELINE = False
+
+    # Maximum number of pooled connections the async pipeline keeps open to the Power BI API
+    ASYNC_PIPELINE_MAX_CONNECTIONS = 100
+
+    # Maximum number of threads the async pipeline runs token acquisition and encryption on
+    ASYNC_PIPELINE_MAX_WORKERS = 8
+
+    # Path of the SQLite database the data sources of all the workspaces are indexed in
+    DATASOURCE_INVENTORY_DATABASE = 'datasourceinventory.db'
+
+    # Number of seconds after which a dataset is crawled again by an inventory refresh
+    DATASOURCE_INVENTORY_MAX_AGE_SECONDS = 86400
+
+    # Maximum number of requests sent concurrently while crawling the inventory
+    DATASOURCE_INVENTORY_MAX_CONCURRENCY = 8
+
+    # Number of workspaces requested per page while crawling the inventory
+    DATASOURCE_INVENTORY_PAGE_SIZE = 1000
+
+    # Number of seconds to wait for a connection to, and a response from, the Power BI API
+    REST_CLIENT_CONNECT_TIMEOUT_SECONDS = 10
+    REST_CLIENT_READ_TIMEOUT_SECONDS = 60
+
+    # Number of times throttled requests, transient server errors and connection failures are retried
+    REST_CLIENT_MAX_RETRIES = 4
+
+    # Base and maximum number of seconds of the exponential backoff between retries, Retry-After is honored up to the maximum
+    REST_CLIENT_BACKOFF_BASE_SECONDS = 1
+    REST_CLIENT_MAX_BACKOFF_SECONDS = 60
+
+    # Maximum number of pooled connections kept open to the Power BI API
+    REST_CLIENT_POOL_SIZE = 32
+
+    # Serve every cloud of the CloudConfigs folder from this app. Requests are routed by the cloud profile header or the cloud
+    # query parameter, i.e. cloud=power-bi-us-government, and use the cloud of this configuration when neither is given.
+    MULTI_CLOUD_ENABLED = False
+
+    # Folder containing a folder with a config.py for each cloud, relative to the Encryption sample folder
+    CLOUD_PROFILES_DIRECTORY = '../CloudConfigs'
+
+    # Header the cloud profile of a request is given in
+    CLOUD_PROFILE_HEADER = 'X-PowerBI-Cloud'
+
+    # Settings which differ per cloud keyed by cloud profile folder name, i.e. the AAD app of each cloud:
+    # {'Power BI US Government': {'TENANT_ID': '', 'CLIENT_ID': '', 'CLIENT_SECRET': ''}}
+    CLOUD_PROFILE_SETTINGS = {}
+
+    # Maximum number of data source status requests sent concurrently by a health check, across all the gateways checked
+    DATASOURCE_HEALTH_MAX_CONCURRENCY = 16
+
+    # Number of seconds a health check waits for the status of the data sources in total, the ones without a status by then are reported as timed out
+    DATASOURCE_HEALTH_TIMEOUT_SECONDS = 30
+
+    # Number of seconds the health report of a gateway is cached for
+    DATASOURCE_HEALTH_CACHE_TTL_SECONDS = 60
+
+    # Maximum number of background jobs, queued with async=true on the add and update data source endpoints, running at the same time
+    JOB_QUEUE_MAX_WORKERS = 8
+
+    # Maximum number of background jobs waiting or running, further jobs are rejected until some complete
+    JOB_QUEUE_MAX_PENDING_JOBS = 1000
+
+    # Number of seconds clients are asked to wait, with the Retry-After header, before queuing a job again when the queue is full
+    JOB_QUEUE_RETRY_AFTER_SECONDS = 30
+
+    # Maximum number of seconds a job status request waits for the job to complete
+    JOB_QUEUE_MAX_WAIT_SECONDS = 60
+
+    # Number of seconds the result of a completed job is kept for
+    JOB_QUEUE_RETENTION_SECONDS = 3600
@@ -2,9 +2,8 @@
 # Licensed under the MIT license.
 
 import base64
-from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import padding
 from time import sleep
 
 
@@ -17,66 +16,89 @@ class Asymmetric1024KeyEncryptionHelper:
     ENCRYPTED_LENGTH = 128
     MAX_ATTEMPTS = 3
 
-    def encrypt(self, plain_text_bytes, modulus_bytes, exponent_bytes):
+    # Segments read at once when encrypting a stream. A multiple of 3 keeps the encrypted length of a chunk
+    # a multiple of 3 bytes, so that the base64 encoded chunks can be concatenated.
+    STREAM_SEGMENTS_PER_CHUNK = 3 * 64
+
+    # Padding algorithm, mask generation function and hashing algorithm are the same for every segment
+    OAEP_PADDING = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                                algorithm=hashes.SHA256(),
+                                label=None)
+
+    def encrypt(self, plain_text_bytes, public_key):
         ''' Encrypts the message with RSA, MGF and SHA hashes
 
         Args:
             plain_text_bytes (bytes): Message to be encrypted
-            modulus_bytes (bytes): Modulus bytes returned from GET gateway API
-            exponent_bytes (bytes): Exponent bytes returned from GET gateway API
+            public_key (RSAPublicKey): Public key loaded from the modulus and exponent returned from GET gateway API
 
         Returns:
             String: Encrypted credentials
         '''
 
         # Split the message into different segments, each segment's length is 60. So the result may be 60, 60, 60, ...
-        has_incomplete_segment = len(
-            plain_text_bytes) % self.SEGMENT_LENGTH != 0
+        plain_text_view = memoryview(plain_text_bytes)
 
         # Number of segments plain text bytes is sliced into
-        segment_number = (len(plain_text_bytes) / self.SEGMENT_LENGTH) if not has_incomplete_segment else (
-            (len(plain_text_bytes) / self.SEGMENT_LENGTH) + 1)
-
-        # Convert to integer
-        segment_number = int(segment_number)
+        segment_number = -(-len(plain_text_view) // self.SEGMENT_LENGTH)
 
         # Create a byte array for encrypted bytes
-        encrypted_bytes = bytearray(
-            [0] * (segment_number * self.ENCRYPTED_LENGTH))
+        encrypted_bytes = bytearray(segment_number * self.ENCRYPTED_LENGTH)
 
         # For loop to run the encryption
         for i in range(0, segment_number):
-            length_to_copy = None
-            if i == segment_number - 1 and has_incomplete_segment:
-                length_to_copy = len(plain_text_bytes) % self.SEGMENT_LENGTH
-            else:
-                length_to_copy = self.SEGMENT_LENGTH
 
-            # Initialize segment byte array
-            segment = bytearray([0] * length_to_copy)
-
-            # Copy the array from src to dest array
-            for k in range(length_to_copy):
-                segment[k] = plain_text_bytes[k + (i * self.SEGMENT_LENGTH)]
+            # Slice the segment without copying, the last segment may be shorter than 60 bytes
+            segment = plain_text_view[i * self.SEGMENT_LENGTH:(i + 1) * self.SEGMENT_LENGTH]
 
             # Result of encryption
             segment_encrypted_result = self.encrypt_segment(
-                modulus_bytes, exponent_bytes, segment)
+                public_key, segment)
 
-            for j in range(0, len(segment_encrypted_result)):
-                encrypted_bytes[(i * self.ENCRYPTED_LENGTH) +
-                                j] = segment_encrypted_result[j]
+            # Copy the encrypted segment into its slot in the result
+            encrypted_offset = i * self.ENCRYPTED_LENGTH
+            encrypted_bytes[encrypted_offset:encrypted_offset + len(segment_encrypted_result)] = segment_encrypted_result
 
         # Returns the decoded string message
         return base64.b64encode(encrypted_bytes).decode()
 
-    def encrypt_segment(self, modulus_bytes, exponent_bytes, data):
+    def encrypt_stream(self, plain_text_stream, public_key, output_stream):
+        ''' Encrypts a message read from a stream with RSA, MGF and SHA hashes, using constant memory
+
+        Args:
+            plain_text_stream (BinaryIO): Stream the message to be encrypted is read from
+            public_key (RSAPublicKey): Public key loaded from the modulus and exponent returned from GET gateway API
+            output_stream (TextIO): Stream the encrypted credentials are written to
+        '''
+
+        chunk_size = self.SEGMENT_LENGTH * self.STREAM_SEGMENTS_PER_CHUNK
+        is_empty = True
+
+        while True:
+            chunk = plain_text_stream.read(chunk_size)
+
+            # Segments must stay aligned with the start of the message, so fill short reads up to a whole chunk
+            while chunk and len(chunk) < chunk_size:
+                remaining = plain_text_stream.read(chunk_size - len(chunk))
+                if not remaining:
+                    break
+                chunk += remaining
+
+            if not chunk:
+                break
+
+            is_empty = False
+            output_stream.write(self.encrypt(chunk, public_key))
+
+        if is_empty:
+            raise TypeError('Data is null')
+
+    def encrypt_segment(self, public_key, data):
         ''' Encrypts the message segment with RSA, MGF and SHA hashes
 
         Args:
-            plain_text_bytes (bytes): Message to be encrypted
-            modulus_bytes (bytes): Modulus bytes returned from GET gateway API
-            exponent_bytes (bytes): Exponent bytes returned from GET gateway API
+            public_key (RSAPublicKey): Public key loaded from the modulus and exponent returned from GET gateway API
+            data (memoryview): Message segment to be encrypted
 
         Returns:
             String: Encrypted credentials
@@ -92,20 +114,8 @@ class Asymmetric1024KeyEncryptionHelper:
         for attempt in range(0, self.MAX_ATTEMPTS):
             try:
 
-                # Convert exponent and modulus byte arrays to integer
-                exponent = int.from_bytes(exponent_bytes, 'big')
-                modulus = int.from_bytes(modulus_bytes, 'big')
-
-                # Generate public key based on modulus and exponent returned by the API
-                public_key = rsa.RSAPublicNumbers(
-                    exponent, modulus).public_key(default_backend())
-
                 # Encrypt the data using encrypt method
-                # Pass padding algorithm, mask generation function and hashing algorithm
-                encrypted_bytes = public_key.encrypt(bytes(data),
-                                                     padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                                                                  algorithm=hashes.SHA256(),
-                                                                  label=None))
+                encrypted_bytes = public_key.encrypt(bytes(data), self.OAEP_PADDING)
 
                 return encrypted_bytes
 
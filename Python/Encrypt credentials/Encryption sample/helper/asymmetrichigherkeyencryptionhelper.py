@@ -3,9 +3,9 @@
 
 import base64
 import os
-from cryptography.hazmat.backends import default_backend
+import tempfile
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import padding
 from helper.authenticatedencryption import AuthenticatedEncryption
 
 
@@ -20,13 +20,26 @@ class AsymmetricHigherKeyEncryptionHelper:
     KEY_LENGTH_32 = 0
     KEY_LENGTH_64 = 1
 
-    def encrypt(self, plain_text_bytes, modulus_bytes, exponent_bytes):
+    # Plain text is read in chunks of this size when encrypting a stream
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    # Cipher text of a stream is kept in memory up to this size and spilled to a temporary file beyond it
+    STREAM_SPOOL_MAX_SIZE = 1024 * 1024
+
+    # Cipher text is base64 encoded in chunks which are a multiple of 3 bytes, so that no chunk but the last one is padded
+    STREAM_ENCODE_CHUNK_SIZE = 3 * 16 * 1024
+
+    # Padding algorithm, mask generation function and hashing algorithm used to encrypt the ephemeral keys
+    OAEP_PADDING = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                                algorithm=hashes.SHA256(),
+                                label=None)
+
+    def encrypt(self, plain_text_bytes, public_key):
         ''' Encrypts the message with RSA, MGF and SHA hashes
 
         Args:
             plain_text_bytes (bytes): Message to be encrypted
-            modulus_bytes (bytes): Modulus bytes returned from GET gateway API
-            exponent_bytes (bytes): Exponent bytes returned from GET gateway API
+            public_key (RSAPublicKey): Public key loaded from the modulus and exponent returned from GET gateway API
 
         Returns:
             String: Encrypted credentials
@@ -44,8 +57,7 @@ class AsymmetricHigherKeyEncryptionHelper:
             key_enc, key_mac, plain_text_bytes)
 
         # Encrypt ephemeral keys using RSA
-        keys = bytearray(
-            [0] * (len(key_enc) + len(key_mac) + self.KEY_LENGTHS_PREFIX))
+        keys = bytearray(len(key_enc) + len(key_mac) + self.KEY_LENGTHS_PREFIX)
 
         # Prefixing length of Keys. Symmetric Key length followed by HMAC key length
         keys[0] = self.KEY_LENGTH_32
@@ -55,20 +67,43 @@ class AsymmetricHigherKeyEncryptionHelper:
         keys[2: len(key_enc) + 2] = key_enc[0: len(key_enc)]
         keys[len(key_enc) + 2: len(key_enc) + len(key_mac) + 2] = key_mac[0: len(key_mac)]
 
-        # Convert exponent and modulus byte arrays to integers
-        exponent = int.from_bytes(exponent_bytes, 'big')
-        modulus = int.from_bytes(modulus_bytes, 'big')
-
-        # Generate public key based on modulus and exponent returned by the API
-        public_key = rsa.RSAPublicNumbers(
-            exponent, modulus).public_key(default_backend())
-
         # Encrypt the data
-        # Pass padding algorithm, mask generation function and hashing algorithm
-        encrypted_bytes = public_key.encrypt(bytes(keys),
-                                             padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                                                          algorithm=hashes.SHA256(),
-                                                          label=None))
+        encrypted_bytes = public_key.encrypt(bytes(keys), self.OAEP_PADDING)
 
         # Return final output
         return base64.b64encode(encrypted_bytes).decode() + base64.b64encode(cipher_text).decode()
+
+    def encrypt_stream(self, plain_text_stream, public_key, output_stream):
+        ''' Encrypts a message read from a stream with RSA, MGF and SHA hashes, using constant memory
+
+        Args:
+            plain_text_stream (BinaryIO): Stream the message to be encrypted is read from
+            public_key (RSAPublicKey): Public key loaded from the modulus and exponent returned from GET gateway API
+            output_stream (TextIO): Stream the encrypted credentials are written to
+        '''
+
+        # Generate ephemeral random keys for encryption (32 bytes), hmac (64 bytes)
+        key_enc = os.urandom(self.AES_KEY_SIZE_BYTES)
+        key_mac = os.urandom(self.HMAC_KEY_SIZE_BYTES)
+
+        authenticated_encryption = AuthenticatedEncryption()
+
+        with tempfile.SpooledTemporaryFile(max_size=self.STREAM_SPOOL_MAX_SIZE) as cipher_text_stream:
+
+            # Encrypt message chunk by chunk using ephemeral keys and Authenticated Encryption
+            encryptor = authenticated_encryption.encryptor(key_enc, key_mac, cipher_text_stream)
+            for chunk in iter(lambda: plain_text_stream.read(self.STREAM_CHUNK_SIZE), b''):
+                encryptor.update(chunk)
+            encryptor.finalize()
+
+            # Prefixing length of Keys. Symmetric Key length followed by HMAC key length
+            keys = bytes([self.KEY_LENGTH_32, self.KEY_LENGTH_64]) + key_enc + key_mac
+
+            # Encrypt ephemeral keys using RSA
+            encrypted_bytes = public_key.encrypt(keys, self.OAEP_PADDING)
+            output_stream.write(base64.b64encode(encrypted_bytes).decode())
+
+            # Base64 encode the cipher text back from the spooled file
+            cipher_text_stream.seek(0)
+            for chunk in iter(lambda: cipher_text_stream.read(self.STREAM_ENCODE_CHUNK_SIZE), b''):
+                output_stream.write(base64.b64encode(chunk).decode())
@@ -3,7 +3,7 @@
 
 import os
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, hmac, padding
+from cryptography.hazmat.primitives import hashes, hmac
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 
@@ -16,6 +16,23 @@ class AuthenticatedEncryption:
 
     algorithm_choices = [Aes256CbcPkcs7, HMACSHA256]
 
+    # Length of the HMAC SHA256 digest
+    MAC_SIZE_BYTES = 32
+
+    def encryptor(self, key_enc, key_mac, sink):
+        ''' Returns an incremental encryptor which writes the same output as encrypt to a seekable sink
+
+        Args:
+            key_enc (bytes): Encryption Key
+            key_mac (bytes): MAC Key
+            sink (BinaryIO): Seekable binary stream the output is written to
+
+        Returns:
+            AuthenticatedEncryptionStream: Incremental encryptor
+        '''
+
+        return AuthenticatedEncryptionStream(key_enc, key_mac, sink)
+
     def encrypt(self, key_enc, key_mac, message):
         ''' Encrypts the message with AES, CBC padding and PKCS7
 
@@ -41,19 +58,32 @@ class AuthenticatedEncryption:
         # Initialization vector
         iv = os.urandom(16)
 
-        # PKC7 Padding
-        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        # Number of PKCS7 padding bytes, a full block is added when the message is already block aligned
+        block_size_bytes = algorithms.AES.block_size // 8
+        padding_length = block_size_bytes - (len(message) % block_size_bytes)
+        cipher_text_length = len(message) + padding_length
+
+        # The final result is the concatenation of the algorithm choices, MAC, IV and cipher text.
+        # Preallocate it once and let the encryptor write the cipher text directly into it.
+        # update_into needs block_size - 1 spare bytes at the end, they are trimmed once encryption is done.
+        mac_offset = len(self.algorithm_choices)
+        iv_offset = mac_offset + self.MAC_SIZE_BYTES
+        cipher_text_offset = iv_offset + len(iv)
+        output = bytearray(cipher_text_offset + cipher_text_length + block_size_bytes - 1)
+        output_view = memoryview(output)
 
-        # Apply padding to the test data
-        padded_data = padder.update(message) + padder.finalize()
+        output[0:mac_offset] = self.algorithm_choices
+        output[iv_offset:cipher_text_offset] = iv
 
         # Cipher object with CBC mode
         cipher = Cipher(algorithms.AES(key_enc), modes.CBC(iv),
                         backend=default_backend())
         encryptor = cipher.encryptor()
 
-        # Cipher text
-        cipher_text = encryptor.update(padded_data) + encryptor.finalize()
+        # Encrypt the message followed by its PKCS7 padding, without building a padded copy of the message
+        written = encryptor.update_into(message, output_view[cipher_text_offset:])
+        written += encryptor.update_into(bytes([padding_length]) * padding_length, output_view[cipher_text_offset + written:])
+        encryptor.finalize()
 
         # The IV and ciphertest both need to be included in the MAC to prevent
         # tampering.
@@ -64,50 +94,109 @@ class AuthenticatedEncryption:
         # MAC, it becomes harder for an attacker to change them as an attempt to
         # perform a downgrade attack.
 
-        # Prepare the data on which MAC will be executed
-        tag_data = bytearray(
-            [0] * (len(self.algorithm_choices) + len(iv) + len(cipher_text)))
-        tag_data_offset = 0
+        # Pass random generated key and hash algorithm to calculate authentication code
+        hmac_instance = hmac.HMAC(
+            key_mac, hashes.SHA256(), backend=default_backend())
 
-        # Copy algorithm choices array in tag_data
-        tag_data[0:len(self.algorithm_choices)
-                 ] = self.algorithm_choices[0:len(self.algorithm_choices)]
-        tag_data_offset = len(self.algorithm_choices) + tag_data_offset
+        # Pass the algorithm choices, IV and cipher text to hash and authenticate, straight from the output buffer
+        hmac_instance.update(output_view[0:mac_offset])
+        hmac_instance.update(output_view[iv_offset:cipher_text_offset + written])
 
-        # Copy initialization vector in tag_data
-        tag_data[tag_data_offset:len(iv) + tag_data_offset] = iv[0:len(iv)]
-        tag_data_offset = len(iv) + tag_data_offset
+        # Finalize the current context and write the message digest in its slot
+        output[mac_offset:iv_offset] = hmac_instance.finalize()
 
-        # Copy cipher text vector in tag_data
-        tag_data[tag_data_offset:len(
-            cipher_text) + tag_data_offset] = cipher_text[0:len(cipher_text)]
-        tag_data_offset = len(cipher_text) + tag_data_offset
+        # Release the view before resizing the buffer and drop the spare bytes
+        output_view.release()
+        del output[cipher_text_offset + written:]
 
-        # Pass random generated key and hash algorithm to calculate authentication code
-        hmac_instance = hmac.HMAC(
+        return output
+
+
+class AuthenticatedEncryptionStream:
+
+    # Size of the AES block in bytes
+    BLOCK_SIZE_BYTES = algorithms.AES.block_size // 8
+
+    def __init__(self, key_enc, key_mac, sink):
+        if len(key_enc) < 32:
+            raise ValueError(
+                'Encryption Key must be at least 256 bits (32 bytes)')
+
+        if len(key_mac) < 32:
+            raise ValueError('Mac Key must be at least 256 bits (32 bytes)')
+
+        self.sink = sink
+        self.message_length = 0
+
+        # Position of the output in the sink, the MAC is written back here once it is known
+        self.output_offset = sink.tell()
+
+        # Initialization vector
+        iv = os.urandom(16)
+
+        algorithm_choices = bytes(AuthenticatedEncryption.algorithm_choices)
+
+        # Output layout is the same as AuthenticatedEncryption.encrypt: algorithm choices, MAC, IV and cipher text.
+        # Reserve the space of the MAC which can only be computed after the last chunk.
+        sink.write(algorithm_choices)
+        sink.write(bytes(AuthenticatedEncryption.MAC_SIZE_BYTES))
+        sink.write(iv)
+
+        # Cipher object with CBC mode
+        cipher = Cipher(algorithms.AES(key_enc), modes.CBC(iv),
+                        backend=default_backend())
+        self.encryptor = cipher.encryptor()
+
+        # Algorithm choices, IV and cipher text are authenticated in a single pass along with the encryption
+        self.hmac_instance = hmac.HMAC(
             key_mac, hashes.SHA256(), backend=default_backend())
+        self.hmac_instance.update(algorithm_choices)
+        self.hmac_instance.update(iv)
+
+    def update(self, data):
+        ''' Encrypts a chunk of the message and writes the cipher text to the sink
 
-        # Pass the bytes to hash and authenticate
-        hmac_instance.update(tag_data)
+        Args:
+            data (bytes): Next chunk of the message
+        '''
 
-        # Finalize the current context and return the message digest as bytes
-        mac = hmac_instance.finalize()
+        self.message_length += len(data)
 
-        # Build the final result as the concatenation of everything except the keys
-        output = bytearray(
-            [0] * (len(self.algorithm_choices) + len(mac) + len(iv) + len(cipher_text)))
-        output_offset = 0
+        # Encryptor keeps any incomplete block until more data or the padding arrives
+        self.write_cipher_text(self.encryptor.update(data))
 
-        output[0: len(self.algorithm_choices)] = self.algorithm_choices[0:len(self.algorithm_choices)]
-        output_offset = len(self.algorithm_choices) + output_offset
+    def finalize(self):
+        ''' Pads and encrypts the rest of the message and writes the MAC in its reserved slot
 
-        output[output_offset:len(mac) + output_offset] = mac[0:len(mac)]
-        output_offset = len(mac) + output_offset
+        Returns:
+            int: Number of bytes written to the sink
+        '''
 
-        output[output_offset:len(iv) + output_offset] = iv[0:len(iv)]
-        output_offset = len(iv) + output_offset
+        if self.message_length == 0:
+            raise TypeError('Credentials cannot be null')
 
-        output[output_offset:len(cipher_text) + output_offset] = cipher_text[0:len(cipher_text)]
-        output_offset = len(cipher_text) + output_offset
+        # PKCS7 padding, a full block is added when the message is already block aligned
+        padding_length = self.BLOCK_SIZE_BYTES - (self.message_length % self.BLOCK_SIZE_BYTES)
+        self.write_cipher_text(self.encryptor.update(bytes([padding_length]) * padding_length))
+        self.write_cipher_text(self.encryptor.finalize())
 
-        return output
+        mac = self.hmac_instance.finalize()
+
+        # Write the MAC after the algorithm choices and move back to the end of the output
+        output_end = self.sink.tell()
+        self.sink.seek(self.output_offset + len(AuthenticatedEncryption.algorithm_choices))
+        self.sink.write(mac)
+        self.sink.seek(output_end)
+
+        return output_end - self.output_offset
+
+    def write_cipher_text(self, cipher_text):
+        ''' Writes cipher text to the sink and adds it to the MAC
+
+        Args:
+            cipher_text (bytes): Cipher text returned by the encryptor
+        '''
+
+        if cipher_text:
+            self.hmac_instance.update(cipher_text)
+            self.sink.write(cipher_text)
@@ -0,0 +1,105 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import base64
+import hashlib
+from collections import OrderedDict
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from helper.asymmetric1024keyencryptionhelper import Asymmetric1024KeyEncryptionHelper
+from helper.asymmetrichigherkeyencryptionhelper import AsymmetricHigherKeyEncryptionHelper
+from threading import Lock
+
+
+class CachedPublicKey:
+
+    def __init__(self, public_key, modulus_size, encryption_helper):
+        self.public_key = public_key
+        self.modulus_size = modulus_size
+        self.encryption_helper = encryption_helper
+
+
+class PublicKeyCache:
+
+    # Modulus size in bytes of 1024 bit keys, which are encrypted segment by segment
+    MODULUS_SIZE_1024 = 128
+
+    # Maximum number of gateway public keys kept in memory
+    MAX_ENTRIES = 256
+
+    # Loaded public keys keyed by fingerprint of the gateway's publicKey, least recently used first
+    entries = OrderedDict()
+    lock = Lock()
+
+    # Encryption helpers are stateless, so a single instance of each is shared by all gateways
+    asymmetric_1024_key_encryption_helper = Asymmetric1024KeyEncryptionHelper()
+    asymmetric_higher_key_encryption_helper = AsymmetricHigherKeyEncryptionHelper()
+
+    def get_fingerprint(gateway_public_key):
+        ''' Returns the fingerprint of a gateway public key
+
+        Args:
+            gateway_public_key (dict): Public key returned from GET gateway API
+
+        Returns:
+            String: SHA256 hex digest of the exponent and modulus
+        '''
+
+        key_material = f'{gateway_public_key["exponent"]}.{gateway_public_key["modulus"]}'
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+    def get_public_key(gateway_public_key):
+        ''' Returns the loaded public key and encryption helper for a gateway public key
+
+        Args:
+            gateway_public_key (dict): Public key returned from GET gateway API
+
+        Returns:
+            CachedPublicKey: Loaded public key, modulus size and encryption helper
+        '''
+
+        fingerprint = PublicKeyCache.get_fingerprint(gateway_public_key)
+
+        with PublicKeyCache.lock:
+            cached_public_key = PublicKeyCache.entries.get(fingerprint)
+            if cached_public_key is not None:
+                PublicKeyCache.entries.move_to_end(fingerprint)
+                return cached_public_key
+
+        cached_public_key = PublicKeyCache.load_public_key(gateway_public_key)
+
+        with PublicKeyCache.lock:
+            PublicKeyCache.entries[fingerprint] = cached_public_key
+            if len(PublicKeyCache.entries) > PublicKeyCache.MAX_ENTRIES:
+                PublicKeyCache.entries.popitem(last=False)
+
+        return cached_public_key
+
+    def load_public_key(gateway_public_key):
+        ''' Decodes a gateway public key and loads it as an RSA public key
+
+        Args:
+            gateway_public_key (dict): Public key returned from GET gateway API
+
+        Returns:
+            CachedPublicKey: Loaded public key, modulus size and encryption helper
+        '''
+
+        # Convert strings to bytes object
+        modulus_bytes = base64.b64decode(gateway_public_key['modulus'])
+        exponent_bytes = base64.b64decode(gateway_public_key['exponent'])
+
+        # Convert exponent and modulus byte arrays to integers
+        exponent = int.from_bytes(exponent_bytes, 'big')
+        modulus = int.from_bytes(modulus_bytes, 'big')
+
+        # Generate public key based on modulus and exponent returned by the API
+        public_key = rsa.RSAPublicNumbers(exponent, modulus).public_key(default_backend())
+
+        # Select the encryption helper based on the modulus size
+        if len(modulus_bytes) == PublicKeyCache.MODULUS_SIZE_1024:
+            encryption_helper = PublicKeyCache.asymmetric_1024_key_encryption_helper
+        else:
+            encryption_helper = PublicKeyCache.asymmetric_higher_key_encryption_helper
+
+        return CachedPublicKey(public_key, len(modulus_bytes), encryption_helper)
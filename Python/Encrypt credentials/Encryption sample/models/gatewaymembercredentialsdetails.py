@@ -0,0 +1,13 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from models.credentialsdetails import CredentialsDetails
+
+class GatewayMemberCredentialsDetails(CredentialsDetails):
+
+    # Camel casing is used for the member variables as they are going to be serialized and camel case is standard for JSON keys
+    gatewayId = None
+
+    def __init__(self, gateway_id, cred_type, serialized_credentials, encrypted_connection, privacy_level):
+        super().__init__(cred_type, serialized_credentials, encrypted_connection, privacy_level)
+        self.gatewayId = gateway_id
@@ -2,12 +2,19 @@
 # Licensed under the MIT license.
 
 import msal
+import os
+from cryptography.fernet import Fernet, InvalidToken
 from flask import current_app as app
+from threading import Lock
 from utils import Utils
 
 
 class AadService:
 
+    # Long-lived MSAL client applications keyed by their configuration, each one holding its own token cache
+    client_apps = {}
+    lock = Lock()
+
     def get_access_token():
         ''' Generates and returns Access token
 
@@ -20,31 +27,39 @@ class AadService:
             raise Exception(config_result)
 
         authenticate_mode = app.config['AUTHENTICATION_MODE']
-        tenant_id = app.config['TENANT_ID']
-        client_id = app.config['CLIENT_ID']
         username = app.config['POWER_BI_USER']
         password = app.config['POWER_BI_PASS']
-        client_secret = app.config['CLIENT_SECRET']
         scope = app.config['SCOPE_BASE']
-        authority = app.config['AUTHORITY_URL']
         response = None
 
         try:
+            # MSAL client applications and token caches are thread safe, only creating and saving them is serialized
+            # so that concurrent requests do not wait for each other's network token acquisition
+            with AadService.lock:
+                clientapp, token_cache = AadService.get_client_app()
+
             if authenticate_mode.lower() == 'masteruser':
+                accounts = clientapp.get_accounts(username=username)
 
-                # Create a public client to authorize the app with the AAD app
-                clientapp = msal.PublicClientApplication(client_id, authority=authority)
+                if accounts:
+                    # Retrieve Access token from cache, it is refreshed silently if it is about to expire
+                    response = clientapp.acquire_token_silent(scope, account=accounts[0])
 
-                # Make a client call if Access token is not available in cache
-                response = clientapp.acquire_token_by_username_password(username, password, scopes=scope)
+                if not response:
+                    # Make a client call if Access token is not available in cache
+                    response = clientapp.acquire_token_by_username_password(username, password, scopes=scope)
 
             # Service Principal auth is recommended by Microsoft to achieve App Owns Data Power BI embedding
             else:
-                authority = authority.replace('organizations', tenant_id)
-                clientapp = msal.ConfidentialClientApplication(client_id, client_credential=client_secret, authority=authority)
+                # Retrieve Access token from cache if it is not about to expire
+                response = clientapp.acquire_token_silent(scope, account=None)
 
-                # Make a client call if Access token is not available in cache
-                response = clientapp.acquire_token_for_client(scopes=scope)
+                if not response:
+                    # Make a client call if Access token is not available in cache
+                    response = clientapp.acquire_token_for_client(scopes=scope)
+
+            with AadService.lock:
+                AadService.save_token_cache(token_cache)
 
             return response['access_token']
 
@@ -52,3 +67,81 @@ class AadService:
             raise Exception(response['error_description'])
         except Exception as ex:
             raise Exception('Error retrieving Access token\n' + str(ex))
+
+    def get_client_app():
+        ''' Returns the MSAL client application for the current configuration, creating it on first use
+
+        Returns:
+            tuple: MSAL client application and its token cache
+        '''
+
+        authenticate_mode = app.config['AUTHENTICATION_MODE']
+        tenant_id = app.config['TENANT_ID']
+        client_id = app.config['CLIENT_ID']
+        client_secret = app.config['CLIENT_SECRET']
+        authority = app.config['AUTHORITY_URL']
+
+        client_app_key = (authenticate_mode.lower(), tenant_id, client_id, client_secret, authority)
+        if client_app_key in AadService.client_apps:
+            return AadService.client_apps[client_app_key]
+
+        token_cache = AadService.load_token_cache()
+
+        if authenticate_mode.lower() == 'masteruser':
+
+            # Create a public client to authorize the app with the AAD app
+            clientapp = msal.PublicClientApplication(client_id, authority=authority, token_cache=token_cache)
+
+        else:
+            authority = authority.replace('organizations', tenant_id)
+            clientapp = msal.ConfidentialClientApplication(client_id, client_credential=client_secret, authority=authority, token_cache=token_cache)
+
+        AadService.client_apps[client_app_key] = (clientapp, token_cache)
+        return AadService.client_apps[client_app_key]
+
+    def load_token_cache():
+        ''' Returns a token cache, restored from the encrypted token cache file when one is configured
+
+        Returns:
+            SerializableTokenCache: Token cache
+        '''
+
+        token_cache = msal.SerializableTokenCache()
+        token_cache_file = app.config['TOKEN_CACHE_FILE']
+
+        if not token_cache_file or not os.path.exists(token_cache_file):
+            return token_cache
+
+        with open(token_cache_file, 'rb') as cache_file:
+            encrypted_token_cache = cache_file.read()
+
+        try:
+            token_cache.deserialize(Fernet(app.config['TOKEN_CACHE_ENCRYPTION_KEY']).decrypt(encrypted_token_cache).decode('utf-8'))
+        except InvalidToken:
+            # Token cache was written with another key, start with an empty cache which overwrites it
+            pass
+
+        return token_cache
+
+    def save_token_cache(token_cache):
+        ''' Writes the token cache encrypted to the token cache file when it has changed
+
+        Args:
+            token_cache (SerializableTokenCache): Token cache
+        '''
+
+        token_cache_file = app.config['TOKEN_CACHE_FILE']
+
+        if not token_cache_file or not token_cache.has_state_changed:
+            return
+
+        encrypted_token_cache = Fernet(app.config['TOKEN_CACHE_ENCRYPTION_KEY']).encrypt(token_cache.serialize().encode('utf-8'))
+
+        # Write to a temporary file readable only by the current user and swap it in, so a crash never leaves a partial cache
+        temp_file = f'{token_cache_file}.tmp'
+        file_descriptor = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, 'wb') as cache_file:
+            cache_file.write(encrypted_token_cache)
+        os.replace(temp_file, token_cache_file)
+
+        token_cache.has_state_changed = False
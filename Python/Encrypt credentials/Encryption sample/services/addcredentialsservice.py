@@ -1,19 +1,16 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import requests
 from flask import current_app as app
-from flask import json
 from models.credentialsdetails import CredentialsDetails
 from models.publishdatasourcetogatewayrequest import PublishDatasourceToGatewayRequest
 from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from services.restclient import RestClient
 from utils import Utils
 
 
 class AddCredentialsService:
 
-    headers = None
-
     def add_data_source(self, access_token, gateway, data_source_type, connection_details, data_source_name, cred_type, privacy_level, credentials_array):
         ''' Adds data source with encrypted credentials
 
@@ -62,12 +59,43 @@ class AddCredentialsService:
             Response: Response from the API call
         '''
 
-        self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
-
         # Gateways - Create Datasource Power BI REST API
         # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/createdatasource
         endpoint_url = f'{app.config["POWER_BI_API_URL"]}v1.0/myorg/gateways/{gateway_id}/datasources'
 
-        api_response = requests.post(endpoint_url, data=json.dumps(request_body.__dict__), headers=self.headers)
+        def get_previously_added_datasource(failed_api_response):
+            # A throttled request was not processed, any other failed attempt may have added the data source before failing
+            if failed_api_response is not None and failed_api_response.status_code == 429:
+                return None
+
+            return self.get_datasource_by_name(gateway_id, request_body.datasourceName, access_token)
+
+        api_response = RestClient.execute('POST', endpoint_url, access_token, request_body.__dict__, get_previously_added_datasource)
 
         return api_response
+
+    def get_datasource_by_name(self, gateway_id, data_source_name, access_token):
+        ''' Returns the data source of the gateway with the given name, so that a retried add does not create a duplicate
+
+        Args:
+            gateway_id (str): Gateway Id
+            data_source_name (str): Name of the data source
+            access_token (str): Access token to call API
+
+        Returns:
+            Response: Response from GET gateway data source API, None if the gateway has no data source with the name
+        '''
+
+        # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasources
+        endpoint_url = f'{app.config["POWER_BI_API_URL"]}v1.0/myorg/gateways/{gateway_id}/datasources'
+
+        datasources_api_response = RestClient.execute('GET', endpoint_url, access_token)
+        if not datasources_api_response.ok:
+            return None
+
+        for datasource in datasources_api_response.json()['value']:
+            if datasource.get('datasourceName') == data_source_name:
+                # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasource
+                return RestClient.execute('GET', f'{endpoint_url}/{datasource["id"]}', access_token)
+
+        return None
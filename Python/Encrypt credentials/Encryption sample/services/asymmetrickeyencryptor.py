@@ -1,14 +1,11 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import base64
-from helper.asymmetric1024keyencryptionhelper import Asymmetric1024KeyEncryptionHelper
-from helper.asymmetrichigherkeyencryptionhelper import AsymmetricHigherKeyEncryptionHelper
+from helper.publickeycache import PublicKeyCache
 
 
 class AsymmetricKeyEncryptor:
 
-    MODULUS_SIZE = 128
     public_key = None
 
     def __init__(self, public_key):
@@ -38,15 +35,23 @@ class AsymmetricKeyEncryptor:
 
         plain_text_bytes = bytes(credentails_data, 'utf-8')
 
-        # Convert strings to bytes object
-        modulus_bytes = base64.b64decode(self.public_key['modulus'])
-        exponent_bytes = base64.b64decode(self.public_key['exponent'])
+        # Reuse the public key loaded for the gateway along with the encryption helper for its modulus size
+        cached_public_key = PublicKeyCache.get_public_key(self.public_key)
 
-        # Call the encryption helper based on the modulus size
-        asymmetric_1024_key_encryptor_helper = Asymmetric1024KeyEncryptionHelper()
-        asymmetric_higher_key_encryptor_helper = AsymmetricHigherKeyEncryptionHelper()
+        return cached_public_key.encryption_helper.encrypt(plain_text_bytes, cached_public_key.public_key)
 
-        if len(modulus_bytes) == self.MODULUS_SIZE:
-            return asymmetric_1024_key_encryptor_helper.encrypt(plain_text_bytes, modulus_bytes, exponent_bytes)
-        else:
-            return asymmetric_higher_key_encryptor_helper.encrypt(plain_text_bytes, modulus_bytes, exponent_bytes)
+    def encode_credentials_stream(self, credentials_stream, output_stream):
+        ''' Encodes the credentials read from a stream based on modulus size, without loading them in memory at once
+
+        Args:
+            credentials_stream (BinaryIO): Stream the UTF-8 encoded credentials data is read from
+            output_stream (TextIO): Stream the encrypted credentials are written to
+        '''
+
+        if credentials_stream is None:
+            raise TypeError('credentials data')
+
+        # Reuse the public key loaded for the gateway along with the encryption helper for its modulus size
+        cached_public_key = PublicKeyCache.get_public_key(self.public_key)
+
+        cached_public_key.encryption_helper.encrypt_stream(credentials_stream, cached_public_key.public_key, output_stream)
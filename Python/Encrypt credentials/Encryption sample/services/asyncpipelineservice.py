@@ -0,0 +1,398 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import aiohttp
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app as app
+from flask import json
+from models.credentialsdetails import CredentialsDetails
+from models.credentialsdetailsrequest import CredentialsDetailsRequest
+from models.publishdatasourcetogatewayrequest import PublishDatasourceToGatewayRequest
+from requests.structures import CaseInsensitiveDict
+from services.aadservice import AadService
+from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from services.cloudprofileregistry import CloudProfileRegistry
+from services.gatewaycache import GatewayCache
+from services.restclient import RestClient
+from threading import Lock, Thread
+from utils import Utils
+
+
+class AsyncApiResponse:
+
+    # Exposes the members of requests.Response used by the app, so that both can be handled the same way
+
+    def __init__(self, status_code, reason, headers, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.text = text
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncPipelineService:
+
+    # Event loop running on a background thread, shared by all requests along with its pooled HTTP session
+    loop = None
+    session = None
+
+    # Executor for the blocking steps, i.e. AAD token acquisition and RSA encryption
+    executor = None
+    lock = Lock()
+
+    def __init__(self):
+        # Steps running on the executor need the app context to read the configuration of the cloud of the request
+        self.flask_app = app._get_current_object()
+        self.app_context = CloudProfileRegistry.copy_app_context()
+        self.api_url = app.config['POWER_BI_API_URL']
+
+        with AsyncPipelineService.lock:
+            if AsyncPipelineService.loop is None:
+                AsyncPipelineService.executor = ThreadPoolExecutor(max_workers=app.config['ASYNC_PIPELINE_MAX_WORKERS'])
+                AsyncPipelineService.loop = asyncio.new_event_loop()
+                Thread(target=AsyncPipelineService.loop.run_forever, name='async-pipeline', daemon=True).start()
+
+    def run(self, coroutine):
+        ''' Runs a coroutine on the pipeline event loop and waits for its result
+
+        Args:
+            coroutine (Coroutine): Coroutine to run
+
+        Returns:
+            object: Result of the coroutine
+        '''
+
+        return asyncio.run_coroutine_threadsafe(coroutine, AsyncPipelineService.loop).result()
+
+    def update_datasource(self, request_data):
+        ''' Updates the datasource with encrypted credentials
+
+        Args:
+            request_data (dict): Update data source request data
+
+        Returns:
+            tuple: Gateway response if the gateway could not be retrieved, otherwise None, and response from the update API call
+        '''
+
+        return self.run(self.update_datasource_async(request_data))
+
+    def add_datasource(self, request_data):
+        ''' Adds data source with encrypted credentials
+
+        Args:
+            request_data (dict): Add data source request data
+
+        Returns:
+            tuple: Gateway response if the gateway could not be retrieved, otherwise None, and response from the add API call
+        '''
+
+        return self.run(self.add_datasource_async(request_data))
+
+    def encrypt_credentials(self, request_data):
+        ''' Encrypts the credentials for datasource
+
+        Args:
+            request_data (dict): Encrypt credentials request data
+
+        Returns:
+            tuple: Gateway response if the gateway could not be retrieved, otherwise None, and encrypted credentials
+        '''
+
+        return self.run(self.encrypt_credentials_async(request_data))
+
+    async def update_datasource_async(self, request_data):
+        gateway_id = request_data['gatewayId']
+        access_token_task = self.start_access_token_acquisition()
+        try:
+            gateway_api_response = await self.get_gateway_async(access_token_task, gateway_id)
+
+            # Gateway is not found for cloud gateways
+            if gateway_api_response.ok:
+                gateway = gateway_api_response.json()
+            elif gateway_api_response.reason == 'Not Found':
+                gateway = {'id': gateway_id, 'publicKey': None}
+            else:
+                return gateway_api_response, None
+
+            credentials_details_req = await self.get_credentials_details_request_async(request_data, gateway)
+            api_response = await self.send_async('PATCH', f'{self.api_url}v1.0/myorg/gateways/{gateway_id}/datasources/{request_data["datasourceId"]}',
+                                                 await access_token_task, credentials_details_req.__dict__)
+
+            # Retry once with the new public key if the cached one was stale
+            refreshed_gateway = await self.refresh_gateway_after_rejection_async(access_token_task, gateway, api_response)
+            if refreshed_gateway is not None:
+                credentials_details_req = await self.get_credentials_details_request_async(request_data, refreshed_gateway)
+                api_response = await self.send_async('PATCH', f'{self.api_url}v1.0/myorg/gateways/{gateway_id}/datasources/{request_data["datasourceId"]}',
+                                                     await access_token_task, credentials_details_req.__dict__)
+
+            return None, api_response
+        finally:
+            self.release_access_token_task(access_token_task)
+
+    async def add_datasource_async(self, request_data):
+        gateway_id = request_data['gatewayId']
+        access_token_task = self.start_access_token_acquisition()
+        try:
+            gateway_api_response = await self.get_gateway_async(access_token_task, gateway_id)
+            if not gateway_api_response.ok:
+                return gateway_api_response, None
+
+            gateway = gateway_api_response.json()
+
+            # If cloud gateway is used, return error
+            if 'name' not in gateway:
+                raise ValueError('gateway, add data source is not supported for cloud gateway')
+
+            publish_data_source_request_body = await self.get_publish_datasource_request_async(request_data, gateway)
+            api_response = await self.post_datasource_async(gateway_id, publish_data_source_request_body, await access_token_task)
+
+            # Retry once with the new public key if the cached one was stale
+            refreshed_gateway = await self.refresh_gateway_after_rejection_async(access_token_task, gateway, api_response)
+            if refreshed_gateway is not None:
+                publish_data_source_request_body = await self.get_publish_datasource_request_async(request_data, refreshed_gateway)
+                api_response = await self.post_datasource_async(gateway_id, publish_data_source_request_body, await access_token_task)
+
+            return None, api_response
+        finally:
+            self.release_access_token_task(access_token_task)
+
+    async def encrypt_credentials_async(self, request_data):
+        access_token_task = self.start_access_token_acquisition()
+        try:
+            gateway_api_response = await self.get_gateway_async(access_token_task, request_data['gatewayId'])
+            if not gateway_api_response.ok:
+                return gateway_api_response, None
+
+            gateway = gateway_api_response.json()
+
+            # Serialize credentials for encryption
+            serialized_credentials = Utils.serialize_credentials(request_data['credentialsArray'], request_data['credType'])
+
+            # Cloud gateway does not contain name property
+            if 'name' not in gateway:
+                return None, serialized_credentials
+
+            return None, await self.encrypt_async(gateway['publicKey'], serialized_credentials)
+        finally:
+            self.release_access_token_task(access_token_task)
+
+    def start_access_token_acquisition(self):
+        ''' Starts acquiring the Access token on the executor, so that it overlaps with the other steps
+
+        Returns:
+            Future: Access token
+        '''
+
+        def get_access_token():
+            with self.app_context():
+                return AadService.get_access_token()
+
+        return asyncio.get_running_loop().run_in_executor(AsyncPipelineService.executor, get_access_token)
+
+    def release_access_token_task(self, access_token_task):
+        ''' Cancels the Access token acquisition when a request returned without needing it, or retrieves its failure otherwise
+
+        Args:
+            access_token_task (Future): Access token
+        '''
+
+        if not access_token_task.done():
+            access_token_task.cancel()
+        elif not access_token_task.cancelled():
+            # Retrieving the exception keeps an unused failure from being logged as never retrieved
+            access_token_task.exception()
+
+    async def get_gateway_async(self, access_token_task, gateway_id):
+        ''' Returns the gateway information from the gateway cache, or from the API once the Access token is available
+
+        Args:
+            access_token_task (Future): Access token
+            gateway_id (str): Gateway Id
+
+        Returns:
+            AsyncApiResponse: Response from the API call
+        '''
+
+        # A cached gateway lets encryption start while the Access token is still being acquired
+        gateway_api_response = GatewayCache.get(self.api_url, gateway_id)
+        if gateway_api_response is not None:
+            return gateway_api_response
+
+        gateway_api_response = await self.send_async('GET', f'{self.api_url}v1.0/myorg/gateways/{gateway_id}', await access_token_task)
+
+        if gateway_api_response.ok:
+            GatewayCache.set(self.api_url, gateway_id, gateway_api_response, self.flask_app.config['GATEWAY_CACHE_TTL_SECONDS'])
+        elif gateway_api_response.status_code == 404:
+            GatewayCache.set(self.api_url, gateway_id, gateway_api_response, self.flask_app.config['GATEWAY_NEGATIVE_CACHE_TTL_SECONDS'])
+
+        return gateway_api_response
+
+    async def refresh_gateway_after_rejection_async(self, access_token_task, gateway, api_response):
+        ''' Invalidates the cached gateway when a request with credentials encrypted for it was rejected
+
+        Args:
+            access_token_task (Future): Access token
+            gateway (dict): Gateway the credentials were encrypted for
+            api_response (AsyncApiResponse): Response of the request
+
+        Returns:
+            dict: Gateway with a new public key to retry the request with, None if the public key did not change
+        '''
+
+        if api_response.status_code != 400 or 'name' not in gateway:
+            return None
+
+        GatewayCache.invalidate(self.api_url, gateway['id'])
+
+        gateway_api_response = await self.get_gateway_async(access_token_task, gateway['id'])
+        if not gateway_api_response.ok:
+            return None
+
+        refreshed_gateway = gateway_api_response.json()
+        if refreshed_gateway.get('publicKey') == gateway['publicKey']:
+            return None
+
+        return refreshed_gateway
+
+    async def encrypt_async(self, public_key, serialized_credentials):
+        ''' Encrypts the credentials on the executor, so that RSA never blocks the event loop
+
+        Args:
+            public_key (dict): Public key returned from GET gateway API
+            serialized_credentials (str): Serialized credentials
+
+        Returns:
+            String: Encrypted credentials
+        '''
+
+        asymmetric_encryptor_service = AsymmetricKeyEncryptor(public_key)
+        return await asyncio.get_running_loop().run_in_executor(
+            AsyncPipelineService.executor, asymmetric_encryptor_service.encode_credentials, serialized_credentials)
+
+    async def get_credentials_details_request_async(self, request_data, gateway):
+        ''' Returns the update data source request body with credentials encrypted for the gateway
+
+        Args:
+            request_data (dict): Update data source request data
+            gateway (dict): Gateway response
+
+        Returns:
+            CredentialsDetailsRequest: Credentials update request body
+        '''
+
+        serialized_credentials = Utils.serialize_credentials(request_data['credentialsArray'], request_data['credType'])
+
+        # On-premises gateway contains name property
+        if 'name' in gateway:
+            encrypted_data = await self.encrypt_async(gateway['publicKey'], serialized_credentials)
+            encrypted_connection = 'Encrypted'
+        else:
+            encrypted_data = serialized_credentials
+            encrypted_connection = 'NotEncrypted'
+
+        credentials_details = CredentialsDetails(request_data['credType'], encrypted_data, encrypted_connection, request_data['privacyLevel'])
+        return CredentialsDetailsRequest(credentials_details.__dict__)
+
+    async def get_publish_datasource_request_async(self, request_data, gateway):
+        ''' Returns the add data source request body with credentials encrypted for the gateway
+
+        Args:
+            request_data (dict): Add data source request data
+            gateway (dict): Gateway response
+
+        Returns:
+            PublishDatasourceToGatewayRequest: Add data source request body
+        '''
+
+        serialized_credentials = Utils.serialize_credentials(request_data['credentialsArray'], request_data['credType'])
+        encrypted_credentials_string = await self.encrypt_async(gateway['publicKey'], serialized_credentials)
+
+        credentials_details = CredentialsDetails(request_data['credType'], encrypted_credentials_string, 'Encrypted', request_data['privacyLevel'])
+        return PublishDatasourceToGatewayRequest(
+            request_data['dataSourceType'], request_data['connectionDetails'], credentials_details.__dict__, request_data['dataSourceName'])
+
+    async def post_datasource_async(self, gateway_id, request_body, access_token):
+        ''' Adds the data source, without creating a duplicate when a failed attempt added it before the request is retried
+
+        Args:
+            gateway_id (str): Gateway Id
+            request_body (PublishDatasourceToGatewayRequest): API request body
+            access_token (str): Access token to call API
+
+        Returns:
+            AsyncApiResponse: Response from the API call
+        '''
+
+        endpoint_url = f'{self.api_url}v1.0/myorg/gateways/{gateway_id}/datasources'
+
+        async def get_previously_added_datasource(failed_api_response):
+            # A throttled request was not processed, any other failed attempt may have added the data source before failing
+            if failed_api_response is not None and failed_api_response.status_code == 429:
+                return None
+
+            datasources_api_response = await self.send_async('GET', endpoint_url, access_token)
+            if not datasources_api_response.ok:
+                return None
+
+            for datasource in datasources_api_response.json()['value']:
+                if datasource.get('datasourceName') == request_body.datasourceName:
+                    return await self.send_async('GET', f'{endpoint_url}/{datasource["id"]}', access_token)
+
+            return None
+
+        return await self.send_async('POST', endpoint_url, access_token, request_body.__dict__, get_previously_added_datasource)
+
+    async def send_async(self, method, endpoint_url, access_token, request_body=None, before_retry=None):
+        ''' Makes the API call on the pooled HTTP session, retrying throttled requests, transient server errors and connection
+        failures with backoff the same way as RestClient.execute
+
+        Args:
+            method (str): HTTP method
+            endpoint_url (str): API endpoint URL
+            access_token (str): Access token to call API
+            request_body (dict, optional): API request body. Defaults to None.
+            before_retry (function, optional): Coroutine function awaited before each retry with the failed response, None if the
+                request failed without a response. Returning a response stops retrying and returns it. Defaults to None.
+
+        Returns:
+            AsyncApiResponse: Response from the API call
+        '''
+
+        # Session is created on the event loop thread on first use and reused by all requests
+        if AsyncPipelineService.session is None:
+            AsyncPipelineService.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.flask_app.config['ASYNC_PIPELINE_MAX_CONNECTIONS']))
+
+        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
+        data = json.dumps(request_body) if request_body is not None else None
+
+        with self.app_context():
+            timeout = aiohttp.ClientTimeout(sock_connect=app.config['REST_CLIENT_CONNECT_TIMEOUT_SECONDS'], sock_read=app.config['REST_CLIENT_READ_TIMEOUT_SECONDS'])
+            max_retries = app.config['REST_CLIENT_MAX_RETRIES']
+
+        for attempt in range(max_retries + 1):
+            try:
+                async with AsyncPipelineService.session.request(method, endpoint_url, data=data, headers=headers, timeout=timeout) as response:
+                    text = await response.text()
+                    api_response = AsyncApiResponse(response.status, response.reason, CaseInsensitiveDict(response.headers), text)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == max_retries:
+                    raise
+                api_response = None
+            else:
+                if api_response.status_code not in RestClient.RETRY_STATUS_CODES or attempt == max_retries:
+                    return api_response
+
+            with self.app_context():
+                delay = RestClient.get_retry_delay(attempt, api_response)
+
+            await asyncio.sleep(delay)
+
+            if before_retry is not None:
+                previous_api_response = await before_retry(api_response)
+                if previous_api_response is not None:
+                    return previous_api_response
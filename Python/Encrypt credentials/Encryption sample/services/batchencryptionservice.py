@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from services.getdatasource import GetDatasourceService
+from threading import Lock
+from utils import Utils
+
+
+def encrypt_serialized_credentials(public_key, serialized_credentials):
+    ''' Encrypts serialized credentials in a worker process
+
+    Args:
+        public_key (dict): Public key returned from GET gateway API
+        serialized_credentials (str): Serialized credentials
+
+    Returns:
+        String: Encrypted credentials
+    '''
+
+    return AsymmetricKeyEncryptor(public_key).encode_credentials(serialized_credentials)
+
+
+class BatchEncryptionService:
+
+    # Process pool shared by all batch requests, RSA encryption is CPU bound and would otherwise hold the GIL
+    executor = None
+    executor_lock = Lock()
+
+    def get_executor():
+        ''' Returns the process pool used for encryption, sized to the available cores
+
+        Returns:
+            ProcessPoolExecutor: Process pool
+        '''
+
+        with BatchEncryptionService.executor_lock:
+            if BatchEncryptionService.executor is None:
+                BatchEncryptionService.executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+            return BatchEncryptionService.executor
+
+    def get_gateways(self, access_token, gateway_ids):
+        ''' Fetches each distinct gateway once
+
+        Args:
+            access_token (str): Access token to call API
+            gateway_ids (list): Gateway Ids, may contain duplicates
+
+        Returns:
+            tuple: Gateways keyed by Gateway Id, and error messages keyed by Gateway Id for the gateways which could not be fetched
+        '''
+
+        gateways = {}
+        gateway_errors = {}
+        data_source_service = GetDatasourceService()
+
+        for gateway_id in dict.fromkeys(gateway_ids):
+            gateway_api_response = data_source_service.get_gateway(access_token, gateway_id)
+
+            if gateway_api_response.ok:
+                gateways[gateway_id] = gateway_api_response.json()
+            else:
+                gateway_errors[gateway_id] = f'Error {gateway_api_response.status_code} {gateway_api_response.reason}\nRequest Id:\t{gateway_api_response.headers.get("RequestId")}'
+
+        return gateways, gateway_errors
+
+    def encrypt_credentials(self, credentials_sets, gateways, gateway_errors):
+        ''' Encrypts the credentials sets across the process pool and yields the results as they finish
+
+        Args:
+            credentials_sets (list): Credentials sets with gatewayId, credType and credentialsArray
+            gateways (dict): Gateways keyed by Gateway Id
+            gateway_errors (dict): Error messages keyed by Gateway Id
+
+        Returns:
+            Generator: Result for each credentials set with its index in the request
+        '''
+
+        futures = {}
+
+        for index, credentials_set in enumerate(credentials_sets):
+            gateway_id = credentials_set['gatewayId']
+
+            if gateway_id in gateway_errors:
+                yield {'index': index, 'gatewayId': gateway_id, 'errorMsg': gateway_errors[gateway_id]}
+                continue
+
+            gateway = gateways[gateway_id]
+
+            try:
+                # Serialize credentials for encryption
+                serialized_credentials = Utils.serialize_credentials(credentials_set['credentialsArray'], credentials_set['credType'])
+            except Exception as ex:
+                yield {'index': index, 'gatewayId': gateway_id, 'errorMsg': str(ex)}
+                continue
+
+            # Cloud gateway does not contain name property and its credentials are not encrypted
+            if 'name' not in gateway:
+                yield {'index': index, 'gatewayId': gateway_id, 'encryptedCredentials': serialized_credentials}
+                continue
+
+            future = BatchEncryptionService.get_executor().submit(encrypt_serialized_credentials, gateway['publicKey'], serialized_credentials)
+            futures[future] = (index, gateway_id)
+
+        for future in as_completed(futures):
+            index, gateway_id = futures[future]
+
+            try:
+                yield {'index': index, 'gatewayId': gateway_id, 'encryptedCredentials': future.result()}
+            except Exception as ex:
+                yield {'index': index, 'gatewayId': gateway_id, 'errorMsg': str(ex)}
@@ -0,0 +1,124 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import importlib.util
+import os
+import re
+from contextlib import contextmanager
+from flask import Config, g, has_app_context
+from flask import current_app as app
+
+
+class CloudProfileConfig(Config):
+
+    # Settings of the cloud profile selected for the current request take precedence over the app configuration
+
+    def __getitem__(self, key):
+        if has_app_context():
+            cloud_profile = g.get('cloud_profile')
+            if cloud_profile is not None and key in cloud_profile['settings']:
+                return cloud_profile['settings'][key]
+
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class CloudProfileRegistry:
+
+    # Cloud profiles keyed by their normalized name
+    profiles = {}
+
+    # Files are kept apart for each cloud, so that token caches and inventories of different clouds never overwrite each other
+    PER_CLOUD_FILE_SETTINGS = ['TOKEN_CACHE_FILE', 'DATASOURCE_INVENTORY_DATABASE']
+
+    def load(flask_app):
+        ''' Loads the config.py of every cloud profile folder, along with the per cloud settings of the app configuration
+
+        Args:
+            flask_app (Flask): Flask app object
+        '''
+
+        profiles_directory = os.path.join(flask_app.root_path, flask_app.config['CLOUD_PROFILES_DIRECTORY'])
+        profile_settings = flask_app.config['CLOUD_PROFILE_SETTINGS']
+        profiles = {}
+
+        for profile_name in sorted(os.listdir(profiles_directory)):
+            config_path = os.path.join(profiles_directory, profile_name, 'config.py')
+            if not os.path.isfile(config_path):
+                continue
+
+            spec = importlib.util.spec_from_file_location(f'cloudprofile_{len(profiles)}', config_path)
+            config_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(config_module)
+
+            profile_key = CloudProfileRegistry.normalize_name(profile_name)
+            settings = {key: value for key, value in vars(config_module.BaseConfig).items() if key.isupper()}
+
+            for setting in CloudProfileRegistry.PER_CLOUD_FILE_SETTINGS:
+                file_path = flask_app.config[setting]
+                if file_path:
+                    root, extension = os.path.splitext(file_path)
+                    settings[setting] = f'{root}.{profile_key}{extension}'
+
+            # Settings which differ per cloud, i.e. the AAD app, can be given by profile folder name
+            for name, overrides in profile_settings.items():
+                if CloudProfileRegistry.normalize_name(name) == profile_key:
+                    settings.update(overrides)
+
+            profiles[profile_key] = {'name': profile_name, 'settings': settings}
+
+        if not profiles:
+            raise Exception(f'No cloud profiles found in {profiles_directory}')
+
+        CloudProfileRegistry.profiles = profiles
+
+    def normalize_name(name):
+        ''' Returns the name a cloud profile is looked up by, i.e. power-bi-us-government for the Power BI US Government folder
+
+        Args:
+            name (str): Cloud profile folder name or its normalized name
+
+        Returns:
+            str: Normalized name
+        '''
+
+        return re.sub('[^a-z0-9]+', '-', name.lower()).strip('-')
+
+    def select_cloud_profile(cloud):
+        ''' Routes the rest of the current request to the given cloud
+
+        Args:
+            cloud (str): Cloud profile name, None to use the app configuration
+        '''
+
+        if not cloud:
+            return
+
+        cloud_profile = CloudProfileRegistry.profiles.get(CloudProfileRegistry.normalize_name(cloud))
+        if cloud_profile is None:
+            raise ValueError('cloud')
+
+        g.cloud_profile = cloud_profile
+
+    def copy_app_context():
+        ''' Returns a function creating app contexts routed to the cloud of the current request, for use on worker threads
+
+        Returns:
+            function: App context factory
+        '''
+
+        flask_app = app._get_current_object()
+        cloud_profile = g.get('cloud_profile')
+
+        @contextmanager
+        def app_context():
+            with flask_app.app_context():
+                g.cloud_profile = cloud_profile
+                yield
+
+        return app_context
@@ -0,0 +1,80 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app as app
+from models.gatewaymembercredentialsdetails import GatewayMemberCredentialsDetails
+from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from utils import Utils
+
+
+class ClusterEncryptionService:
+
+    headers = None
+
+    def get_gateway_cluster(self, access_token, cluster_id):
+        ''' Returns the gateway cluster information along with its member gateways
+
+        Args:
+            access_token (str): Access token to call API
+            cluster_id (str): Gateway cluster Id
+
+        Returns:
+            Response: Response from the API call
+        '''
+
+        self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
+
+        # Member gateways are expanded so that all the member public keys are returned by a single call
+        endpoint_url = f'{app.config["POWER_BI_API_URL"]}v2.0/myorg/gatewayClusters/{cluster_id}?$expand=memberGateways'
+
+        api_response = requests.get(endpoint_url, headers=self.headers)
+
+        return api_response
+
+    def get_cluster_credentials_details(self, cluster, cred_type, privacy_level, credentials_array):
+        ''' Encrypts the credentials for every member gateway of the cluster which reports a public key concurrently
+
+        Args:
+            cluster (dict): Gateway cluster response with member gateways
+            cred_type (str): Type of the credentials (i.e. Basic, Windows, OAuth2)
+            privacy_level (str): Privacy level
+            credentials_array (dict): Credentials based on the user input of the credentials type
+
+        Returns:
+            tuple: Credentials details for each member gateway with a public key, in the order of the member gateways,
+                and the member gateways skipped as they report no public key, i.e. offline members
+        '''
+
+        member_gateways = cluster.get('memberGateways') or []
+        if not member_gateways:
+            raise ValueError('gateway cluster, no member gateways found')
+
+        skipped_member_gateways = []
+        encryptable_member_gateways = []
+        for member_gateway in member_gateways:
+            public_key = member_gateway.get('publicKey') or {}
+            if public_key.get('exponent') and public_key.get('modulus'):
+                encryptable_member_gateways.append(member_gateway)
+            else:
+                skipped_member_gateways.append({'gatewayId': member_gateway.get('id'), 'errorMsg': 'Member gateway reports no public key'})
+
+        if not encryptable_member_gateways:
+            raise ValueError('gateway cluster, none of its member gateways reports a public key')
+
+        # Serialize credentials once for all the member gateways
+        serialized_credentials = Utils.serialize_credentials(credentials_array, cred_type)
+
+        def encrypt_for_member(member_gateway):
+            # Each member has its own key, loaded keys are reused across requests through the public key cache
+            asymmetric_encryptor_service = AsymmetricKeyEncryptor(member_gateway['publicKey'])
+            encrypted_credentials_string = asymmetric_encryptor_service.encode_credentials(serialized_credentials)
+
+            credentials_details = GatewayMemberCredentialsDetails(
+                member_gateway['id'], cred_type, encrypted_credentials_string, 'Encrypted', privacy_level)
+            return credentials_details.__dict__
+
+        max_workers = min(len(encryptable_member_gateways), app.config['CLUSTER_ENCRYPTION_MAX_WORKERS'])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(encrypt_for_member, encryptable_member_gateways)), skipped_member_gateways
@@ -0,0 +1,267 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import base64
+import hashlib
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app as app
+from flask import json
+from services.cloudprofileregistry import CloudProfileRegistry
+from services.datasourcehealthservice import DatasourceHealthService
+from services.gatewaycache import GatewayCache
+from services.getdatasource import GetDatasourceService
+from services.updatecredentialsservice import UpdateCredentialsService
+from threading import Lock
+from utils import Utils
+
+rotation_statuses = {
+    'SUCCEEDED': 'Succeeded',
+    'FAILED': 'Failed',
+    'SKIPPED': 'Skipped'
+}
+
+
+class RotationJournal:
+
+    # Rotation Id is used as the journal file name
+    ROTATION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+    def __init__(self, directory, rotation_id):
+        if not self.ROTATION_ID_PATTERN.match(rotation_id):
+            raise ValueError('rotation Id')
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{rotation_id}.jsonl')
+        self.lock = Lock()
+
+    # Iterations of the salted hash the credentials fingerprint is derived with, so that it does not reveal the credentials
+    FINGERPRINT_ITERATIONS = 100000
+
+    def start(self, gateway_id, credentials):
+        ''' Writes the header of a new rotation, or checks that a resumed rotation is for the same gateway and credentials
+
+        Args:
+            gateway_id (str): Gateway Id
+            credentials (str): Serialized credentials along with their type and privacy level
+
+        Returns:
+            set: Data source Ids already rotated by a previous run of the same rotation
+        '''
+
+        header, succeeded_datasource_ids = self.read()
+
+        if header is None:
+            if succeeded_datasource_ids:
+                raise ValueError('rotation Id, the journal was written without a gateway and credentials fingerprint')
+
+            salt = os.urandom(16)
+            self.record({
+                'gatewayId': gateway_id,
+                'salt': base64.b64encode(salt).decode(),
+                'credentialFingerprint': self.get_fingerprint(credentials, salt)
+            })
+            return succeeded_datasource_ids
+
+        if header['gatewayId'] != gateway_id or header['credentialFingerprint'] != self.get_fingerprint(credentials, base64.b64decode(header['salt'])):
+            raise ValueError('rotation Id, it was started for another gateway or other credentials')
+
+        return succeeded_datasource_ids
+
+    def read(self):
+        ''' Returns the header and the data sources already rotated by a previous run of the same rotation
+
+        Returns:
+            tuple: Header or None and set of data source Ids
+        '''
+
+        header = None
+        succeeded_datasource_ids = set()
+
+        if not os.path.exists(self.path):
+            return header, succeeded_datasource_ids
+
+        with open(self.path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line may be incomplete if the process stopped while writing it
+                    continue
+
+                if 'credentialFingerprint' in entry:
+                    header = entry
+                elif entry['status'] == rotation_statuses['SUCCEEDED']:
+                    succeeded_datasource_ids.add(entry['datasourceId'])
+
+        return header, succeeded_datasource_ids
+
+    def get_fingerprint(self, credentials, salt):
+        ''' Returns the fingerprint of the credentials of a rotation
+
+        Args:
+            credentials (str): Serialized credentials along with their type and privacy level
+            salt (bytes): Random salt of the rotation
+
+        Returns:
+            str: Hex encoded fingerprint
+        '''
+
+        return hashlib.pbkdf2_hmac('sha256', credentials.encode('utf-8'), salt, self.FINGERPRINT_ITERATIONS).hex()
+
+    def record(self, result):
+        ''' Appends the result of a data source to the journal
+
+        Args:
+            result (dict): Result of the data source rotation
+        '''
+
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as journal_file:
+                journal_file.write(json.dumps(result) + '\n')
+                journal_file.flush()
+
+
+class CredentialRotationService:
+
+    def rotate_credentials(self, access_token, gateway_id, cred_type, privacy_level, credentials_array, rotation_id=None, datasource_ids=None, connection_details=None):
+        ''' Updates the credentials of the selected data sources of a gateway, encrypting them once for the gateway key
+
+        Args:
+            access_token (str): Access token to call API
+            gateway_id (str): Gateway Id
+            cred_type (str): Type of the credentials (i.e. Basic, Windows, OAuth2)
+            privacy_level (str): Privacy level
+            credentials_array (dict): Credentials based on the user input of the credentials type
+            rotation_id (str, optional): Id of a previous rotation to resume. Defaults to a new rotation.
+            datasource_ids (list, optional): Data sources to rotate
+            connection_details (dict, optional): Server and database the data sources to rotate connect to, used when no data source Ids are given
+
+        Returns:
+            dict: Rotation Id, summary and per data source results
+        '''
+
+        connection_details = {key: value for key, value in (connection_details or {}).items() if key in ['server', 'database'] and value}
+        if not datasource_ids and not connection_details:
+            raise ValueError('data source selection, provide the datasourceIds or the server and database connectionDetails of the data sources to rotate')
+
+        rotation_id = rotation_id or str(uuid.uuid4())
+        journal = RotationJournal(app.config['ROTATION_JOURNAL_DIRECTORY'], rotation_id)
+
+        data_source_service = GetDatasourceService()
+
+        # Always encrypt a rotation with the current gateway key
+        GatewayCache.invalidate(app.config['POWER_BI_API_URL'], gateway_id)
+        gateway_api_response = data_source_service.get_gateway(access_token, gateway_id)
+        if not gateway_api_response.ok:
+            raise Exception(f'Error {gateway_api_response.status_code} {gateway_api_response.reason}\nRequest Id:\t{gateway_api_response.headers.get("RequestId")}')
+
+        gateway = gateway_api_response.json()
+
+        datasources_api_response = data_source_service.get_gateway_datasources(access_token, gateway_id)
+        if not datasources_api_response.ok:
+            raise Exception(f'Error {datasources_api_response.status_code} {datasources_api_response.reason}\nRequest Id:\t{datasources_api_response.headers.get("RequestId")}')
+
+        datasources = datasources_api_response.json()['value']
+        if datasource_ids:
+            datasource_ids = set(datasource_ids)
+            datasources = [datasource for datasource in datasources if datasource['id'] in datasource_ids]
+        else:
+            datasources = [datasource for datasource in datasources
+                           if datasource.get('credentialType') == cred_type and self.matches_connection_details(datasource, connection_details)]
+
+        if not datasources:
+            raise ValueError('data source selection, no data source of the gateway matches it')
+
+        succeeded_datasource_ids = journal.start(gateway_id, json.dumps([cred_type, privacy_level, Utils.serialize_credentials(credentials_array, cred_type)]))
+
+        # Encrypt the credentials once, the same request body is sent for every data source of the gateway
+        update_creds_service = UpdateCredentialsService()
+        credentials_details_req = update_creds_service.get_credentials_details_request(cred_type, privacy_level, credentials_array, gateway)
+
+        results = []
+        pending_datasources = []
+
+        for datasource in datasources:
+            if datasource['id'] in succeeded_datasource_ids:
+                results.append(self.get_result(datasource, rotation_statuses['SKIPPED']))
+            else:
+                pending_datasources.append(datasource)
+
+        # Worker threads need the app context to read the configuration of the cloud of the request
+        app_context = CloudProfileRegistry.copy_app_context()
+
+        def rotate_datasource(datasource):
+            with app_context():
+                try:
+                    api_response = UpdateCredentialsService().make_update_datasource_patch_request(
+                        credentials_details_req, gateway_id, datasource['id'], access_token)
+
+                    if api_response.ok:
+                        result = self.get_result(datasource, rotation_statuses['SUCCEEDED'], api_response.status_code)
+                    else:
+                        result = self.get_result(datasource, rotation_statuses['FAILED'], api_response.status_code,
+                                                 f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')
+                except Exception as ex:
+                    result = self.get_result(datasource, rotation_statuses['FAILED'], error_msg=str(ex))
+
+                journal.record(result)
+                return result
+
+        # Bound the number of concurrent PATCH requests sent to the gateway
+        with ThreadPoolExecutor(max_workers=app.config['ROTATION_MAX_CONCURRENCY']) as executor:
+            results.extend(executor.map(rotate_datasource, pending_datasources))
+
+        # Check the data sources again with the new credentials, a report cached while the PATCH requests ran would be stale
+        DatasourceHealthService().invalidate_report(app.config['POWER_BI_API_URL'], gateway_id)
+
+        summary = {status: 0 for status in rotation_statuses.values()}
+        for result in results:
+            summary[result['status']] += 1
+
+        return {'rotationId': rotation_id, 'gatewayId': gateway_id, 'summary': summary, 'results': results}
+
+    def matches_connection_details(self, datasource, connection_details):
+        ''' Returns whether a data source connects to the given server and database
+
+        Args:
+            datasource (dict): Data source returned from GET gateway data sources API
+            connection_details (dict): Server and database to match, case insensitively
+
+        Returns:
+            bool: True if every given connection detail matches
+        '''
+
+        datasource_connection_details = datasource.get('connectionDetails') or {}
+        if isinstance(datasource_connection_details, str):
+            try:
+                datasource_connection_details = json.loads(datasource_connection_details)
+            except ValueError:
+                return False
+
+        return all(str(datasource_connection_details.get(key, '')).lower() == str(value).lower() for key, value in connection_details.items())
+
+    def get_result(self, datasource, status, status_code=None, error_msg=None):
+        ''' Returns the result of a data source rotation
+
+        Args:
+            datasource (dict): Data source returned from GET gateway data sources API
+            status (str): Rotation status
+            status_code (int, optional): Status code of the PATCH request. Defaults to None.
+            error_msg (str, optional): Error details. Defaults to None.
+
+        Returns:
+            dict: Result of the data source rotation
+        '''
+
+        return {
+            'datasourceId': datasource['id'],
+            'datasourceName': datasource.get('datasourceName'),
+            'status': status,
+            'statusCode': status_code,
+            'errorMsg': error_msg,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
@@ -0,0 +1,243 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app as app
+from services.restclient import RestClient
+from threading import Lock
+
+health_statuses = {
+    'HEALTHY': 'Healthy',
+    'UNHEALTHY': 'Unhealthy',
+    'TIMED_OUT': 'TimedOut'
+}
+
+
+class DatasourceHealthService:
+
+    # Health reports keyed by Power BI API URL and Gateway Id, along with their expiry time
+    reports = {}
+    lock = Lock()
+
+    def check_gateways(self, access_token, gateway_ids, refresh=False):
+        ''' Checks the connectivity of every data source of the given gateways concurrently
+
+        Args:
+            access_token (str): Access token to call API
+            gateway_ids (list): Gateway Ids
+            refresh (bool, optional): Ignore the cached reports. Defaults to False.
+
+        Returns:
+            list: Health report of each gateway, in the order of the Gateway Ids
+        '''
+
+        api_url = app.config['POWER_BI_API_URL']
+        ttl_seconds = app.config['DATASOURCE_HEALTH_CACHE_TTL_SECONDS']
+        timeout = app.config['DATASOURCE_HEALTH_TIMEOUT_SECONDS']
+        gateway_ids = list(dict.fromkeys(gateway_ids))
+
+        reports = {}
+        if not refresh:
+            for gateway_id in gateway_ids:
+                report = self.get_cached_report(api_url, gateway_id)
+                if report is not None:
+                    reports[gateway_id] = report
+
+        pending_gateway_ids = [gateway_id for gateway_id in gateway_ids if gateway_id not in reports]
+        if pending_gateway_ids:
+            session = RestClient.get_session()
+            headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
+
+            # The requests timeout only bounds each socket operation, a gateway answering slowly could run well past it.
+            # The whole check is bounded by a deadline instead, data sources without a status by then are reported as timed out.
+            deadline = time.monotonic() + timeout
+
+            # Bound the number of concurrent requests sent to the gateways, the data sources of all the gateways share the cap
+            executor = ThreadPoolExecutor(max_workers=app.config['DATASOURCE_HEALTH_MAX_CONCURRENCY'])
+            try:
+                datasource_futures = {}
+
+                for gateway_id, future in [(gateway_id, executor.submit(self.get_datasources, session, headers, api_url, gateway_id, timeout))
+                                           for gateway_id in pending_gateway_ids]:
+                    try:
+                        datasources = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    except FutureTimeoutError:
+                        reports[gateway_id] = {'gatewayId': gateway_id, 'errorMsg': f'No data sources returned within {timeout} seconds'}
+                        continue
+                    except Exception as ex:
+                        reports[gateway_id] = {'gatewayId': gateway_id, 'errorMsg': str(ex)}
+                        continue
+
+                    datasource_futures[gateway_id] = [
+                        (datasource, executor.submit(self.get_datasource_status, session, headers, api_url, gateway_id, datasource['id'], timeout))
+                        for datasource in datasources]
+
+                for gateway_id, futures in datasource_futures.items():
+                    results = [self.get_result(datasource, *self.get_status_result(future, deadline, timeout)) for datasource, future in futures]
+
+                    summary = {status: 0 for status in health_statuses.values()}
+                    for result in results:
+                        summary[result['status']] += 1
+
+                    reports[gateway_id] = {
+                        'gatewayId': gateway_id,
+                        'summary': summary,
+                        'datasources': results,
+                        'checkedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                    }
+
+                    self.set_cached_report(api_url, gateway_id, reports[gateway_id], ttl_seconds)
+            finally:
+                # Do not wait for the requests still running past the deadline, they end with their own socket timeout
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        return [reports[gateway_id] for gateway_id in gateway_ids]
+
+    def get_status_result(self, future, deadline, timeout):
+        ''' Waits for the status of a data source until the deadline of the health check
+
+        Args:
+            future (Future): Status of the data source
+            deadline (float): Monotonic time by which the health check completes
+            timeout (float): Number of seconds the health check is allowed to take
+
+        Returns:
+            tuple: Health status, status code and error details
+        '''
+
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            return health_statuses['TIMED_OUT'], None, f'No response within {timeout} seconds'
+
+    def get_datasources(self, session, headers, api_url, gateway_id, timeout):
+        ''' Returns all the data sources of the given gateway
+
+        Args:
+            session (Session): HTTP session
+            headers (dict): Request headers
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+            timeout (float): Number of seconds to wait for the response
+
+        Returns:
+            list: Data sources
+        '''
+
+        # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasources
+        api_response = session.get(f'{api_url}v1.0/myorg/gateways/{gateway_id}/datasources', headers=headers, timeout=timeout)
+
+        if not api_response.ok:
+            raise Exception(f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')
+
+        return api_response.json()['value']
+
+    def get_datasource_status(self, session, headers, api_url, gateway_id, datasource_id, timeout):
+        ''' Checks the connectivity of the data source from the gateway
+
+        Args:
+            session (Session): HTTP session
+            headers (dict): Request headers
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+            datasource_id (str): Data source Id
+            timeout (float): Number of seconds to wait for the gateway to connect to the data source
+
+        Returns:
+            tuple: Health status, status code and error details
+        '''
+
+        # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasourcestatus
+        endpoint_url = f'{api_url}v1.0/myorg/gateways/{gateway_id}/datasources/{datasource_id}/status'
+
+        try:
+            api_response = session.get(endpoint_url, headers=headers, timeout=timeout)
+        except requests.Timeout:
+            return health_statuses['TIMED_OUT'], None, f'No response within {timeout} seconds'
+        except requests.RequestException as ex:
+            return health_statuses['UNHEALTHY'], None, str(ex)
+
+        if api_response.ok:
+            return health_statuses['HEALTHY'], api_response.status_code, None
+
+        # Error details returned by the gateway, i.e. invalid credentials or unreachable server
+        error_msg = f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}'
+        if api_response.text:
+            error_msg = f'Error {api_response.status_code} {api_response.reason}\n{api_response.text}\nRequest Id:\t{api_response.headers.get("RequestId")}'
+
+        return health_statuses['UNHEALTHY'], api_response.status_code, error_msg
+
+    def get_result(self, datasource, status, status_code, error_msg):
+        ''' Returns the health check result of a data source
+
+        Args:
+            datasource (dict): Data source returned from GET gateway data sources API
+            status (str): Health status
+            status_code (int): Status code of the status request
+            error_msg (str): Error details
+
+        Returns:
+            dict: Result of the data source health check
+        '''
+
+        return {
+            'datasourceId': datasource['id'],
+            'datasourceName': datasource.get('datasourceName'),
+            'datasourceType': datasource.get('datasourceType'),
+            'status': status,
+            'statusCode': status_code,
+            'errorMsg': error_msg
+        }
+
+    def get_cached_report(self, api_url, gateway_id):
+        ''' Returns the cached health report of the gateway if it has not expired
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+
+        Returns:
+            dict: Health report or None
+        '''
+
+        with DatasourceHealthService.lock:
+            entry = DatasourceHealthService.reports.get((api_url, gateway_id))
+            if entry is None:
+                return None
+
+            report, expires_at = entry
+            if expires_at <= time.monotonic():
+                del DatasourceHealthService.reports[(api_url, gateway_id)]
+                return None
+
+            return report
+
+    def set_cached_report(self, api_url, gateway_id, report, ttl_seconds):
+        ''' Stores the health report of the gateway
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+            report (dict): Health report
+            ttl_seconds (int): Number of seconds the report stays valid
+        '''
+
+        if ttl_seconds <= 0:
+            return
+
+        with DatasourceHealthService.lock:
+            DatasourceHealthService.reports[(api_url, gateway_id)] = (report, time.monotonic() + ttl_seconds)
+
+    def invalidate_report(self, api_url, gateway_id):
+        ''' Removes the cached health report of the gateway, i.e. after its credentials were changed
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+        '''
+
+        with DatasourceHealthService.lock:
+            DatasourceHealthService.reports.pop((api_url, gateway_id), None)
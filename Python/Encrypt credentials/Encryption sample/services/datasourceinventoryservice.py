@@ -0,0 +1,326 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from flask import current_app as app
+from flask import json
+from services.cloudprofileregistry import CloudProfileRegistry
+from services.restclient import RestClient
+from threading import Lock
+
+
+class DatasourceInventory:
+
+    # Columns the inventory can be searched by, mapped to the search arguments
+    SEARCH_COLUMNS = {
+        'gatewayId': 'gateway_id',
+        'server': 'server',
+        'database': 'database',
+        'credType': 'credential_type',
+        'datasourceType': 'datasource_type',
+        'groupId': 'group_id'
+    }
+
+    def __init__(self, path):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self.connect()) as connection, connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS datasets (
+                    group_id TEXT NOT NULL,
+                    dataset_id TEXT NOT NULL,
+                    dataset_name TEXT,
+                    crawled_at REAL,
+                    PRIMARY KEY (group_id, dataset_id)
+                );
+
+                CREATE TABLE IF NOT EXISTS datasources (
+                    group_id TEXT NOT NULL,
+                    dataset_id TEXT NOT NULL,
+                    datasource_id TEXT,
+                    gateway_id TEXT,
+                    datasource_type TEXT,
+                    server TEXT COLLATE NOCASE,
+                    database TEXT COLLATE NOCASE,
+                    url TEXT,
+                    path TEXT,
+                    credential_type TEXT,
+                    connection_details TEXT
+                );
+
+                CREATE INDEX IF NOT EXISTS datasources_dataset ON datasources (group_id, dataset_id);
+                CREATE INDEX IF NOT EXISTS datasources_gateway ON datasources (gateway_id, datasource_id);
+                CREATE INDEX IF NOT EXISTS datasources_server ON datasources (server, database);
+                CREATE INDEX IF NOT EXISTS datasources_credential_type ON datasources (credential_type);
+            ''')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def get_crawled_datasets(self):
+        ''' Returns when each dataset of the inventory was last crawled
+
+        Returns:
+            dict: Crawl time keyed by Group Id and Dataset Id
+        '''
+
+        with closing(self.connect()) as connection:
+            rows = connection.execute('SELECT group_id, dataset_id, crawled_at FROM datasets').fetchall()
+
+        return {(group_id, dataset_id): crawled_at for group_id, dataset_id, crawled_at in rows}
+
+    def remove_datasets(self, dataset_keys):
+        ''' Removes datasets which no longer exist along with their data sources
+
+        Args:
+            dataset_keys (list): Group Id and Dataset Id pairs
+        '''
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany('DELETE FROM datasources WHERE group_id = ? AND dataset_id = ?', dataset_keys)
+            connection.executemany('DELETE FROM datasets WHERE group_id = ? AND dataset_id = ?', dataset_keys)
+
+    def set_dataset_datasources(self, group_id, dataset, datasources):
+        ''' Replaces the data sources of a dataset
+
+        Args:
+            group_id (str): Group Id
+            dataset (dict): Dataset returned from GET datasets in group API
+            datasources (list): Data sources returned from GET datasources in group API
+        '''
+
+        rows = []
+        for datasource in datasources:
+            connection_details = datasource.get('connectionDetails') or {}
+            rows.append((
+                group_id, dataset['id'], datasource.get('datasourceId'), datasource.get('gatewayId'), datasource.get('datasourceType'),
+                connection_details.get('server'), connection_details.get('database'), connection_details.get('url'),
+                connection_details.get('path'), json.dumps(connection_details)))
+
+        with closing(self.connect()) as connection, connection:
+            connection.execute('DELETE FROM datasources WHERE group_id = ? AND dataset_id = ?', (group_id, dataset['id']))
+            connection.executemany('''
+                INSERT INTO datasources (group_id, dataset_id, datasource_id, gateway_id, datasource_type, server, database, url, path, connection_details)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            connection.execute('INSERT OR REPLACE INTO datasets (group_id, dataset_id, dataset_name, crawled_at) VALUES (?, ?, ?, ?)',
+                               (group_id, dataset['id'], dataset.get('name'), time.time()))
+
+    def get_gateway_ids(self):
+        ''' Returns the gateways the data sources of the inventory are bound to
+
+        Returns:
+            list: Gateway Ids
+        '''
+
+        with closing(self.connect()) as connection:
+            rows = connection.execute('SELECT DISTINCT gateway_id FROM datasources WHERE gateway_id IS NOT NULL').fetchall()
+
+        return [gateway_id for gateway_id, in rows]
+
+    def set_credential_types(self, gateway_id, gateway_datasources):
+        ''' Stores the credentials type of the data sources of a gateway
+
+        Args:
+            gateway_id (str): Gateway Id
+            gateway_datasources (list): Data sources returned from GET gateway data sources API
+        '''
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany('UPDATE datasources SET credential_type = ? WHERE gateway_id = ? AND datasource_id = ?',
+                                   [(datasource.get('credentialType'), gateway_id, datasource['id']) for datasource in gateway_datasources])
+
+    def search(self, filters):
+        ''' Returns the data sources matching all the given filters
+
+        Args:
+            filters (dict): Values keyed by search argument, server and database are matched case insensitively
+
+        Returns:
+            list: Data sources
+        '''
+
+        conditions = []
+        parameters = []
+        for argument, column in self.SEARCH_COLUMNS.items():
+            if filters.get(argument):
+                conditions.append(f'datasources.{column} = ?')
+                parameters.append(filters[argument])
+
+        query = '''
+            SELECT datasources.group_id, datasources.dataset_id, datasets.dataset_name, datasources.datasource_id, datasources.gateway_id,
+                datasources.datasource_type, datasources.server, datasources.database, datasources.url, datasources.path,
+                datasources.credential_type, datasources.connection_details, datasets.crawled_at
+            FROM datasources JOIN datasets ON datasets.group_id = datasources.group_id AND datasets.dataset_id = datasources.dataset_id
+        '''
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        with closing(self.connect()) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+
+        return [{
+            'groupId': row[0],
+            'datasetId': row[1],
+            'datasetName': row[2],
+            'datasourceId': row[3],
+            'gatewayId': row[4],
+            'datasourceType': row[5],
+            'server': row[6],
+            'database': row[7],
+            'url': row[8],
+            'path': row[9],
+            'credentialType': row[10],
+            'connectionDetails': json.loads(row[11]) if row[11] else None,
+            'crawledAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(row[12]))
+        } for row in rows]
+
+
+class DatasourceInventoryService:
+
+    # Only one crawl writes to the inventory at a time
+    refresh_lock = Lock()
+
+    def __init__(self):
+        self.inventory = DatasourceInventory(app.config['DATASOURCE_INVENTORY_DATABASE'])
+
+        # Worker threads need the app context to read the configuration of the cloud of the request
+        self.app_context = CloudProfileRegistry.copy_app_context()
+
+    def refresh(self, access_token, full_refresh=False):
+        ''' Crawls all the workspaces and datasets and updates the inventory with their data sources
+
+        Only datasets which are new, or were crawled longer than the configured maximum age ago, are crawled again unless a full refresh is requested.
+
+        Args:
+            access_token (str): Access token to call API
+            full_refresh (bool, optional): Crawl every dataset. Defaults to False.
+
+        Returns:
+            dict: Summary of the crawl along with the requests which failed
+        '''
+
+        api_url = app.config['POWER_BI_API_URL']
+        max_age_seconds = app.config['DATASOURCE_INVENTORY_MAX_AGE_SECONDS']
+        errors = []
+
+        with DatasourceInventoryService.refresh_lock:
+
+            # Bound the number of concurrent requests sent to the Power BI API
+            with ThreadPoolExecutor(max_workers=app.config['DATASOURCE_INVENTORY_MAX_CONCURRENCY']) as executor:
+                groups = self.get_groups(access_token, api_url)
+
+                # https://docs.microsoft.com/en-us/rest/api/power-bi/datasets/getdatasetsingroup
+                datasets = []
+                dataset_futures = {executor.submit(self.get_values, access_token, f'{api_url}v1.0/myorg/groups/{group["id"]}/datasets'): group for group in groups}
+                for future in as_completed(dataset_futures):
+                    group = dataset_futures[future]
+                    try:
+                        datasets.extend((group['id'], dataset) for dataset in future.result())
+                    except Exception as ex:
+                        errors.append({'groupId': group['id'], 'errorMsg': str(ex)})
+
+                # Datasets of workspaces which failed to list are kept as they are
+                failed_group_ids = {error['groupId'] for error in errors}
+                crawled_datasets = self.inventory.get_crawled_datasets()
+                current_dataset_keys = {(group_id, dataset['id']) for group_id, dataset in datasets}
+                removed_dataset_keys = [dataset_key for dataset_key in crawled_datasets
+                                        if dataset_key not in current_dataset_keys and dataset_key[0] not in failed_group_ids]
+                self.inventory.remove_datasets(removed_dataset_keys)
+
+                stale_before = time.time() - max_age_seconds
+                pending_datasets = [(group_id, dataset) for group_id, dataset in datasets
+                                    if full_refresh or (crawled_datasets.get((group_id, dataset['id'])) or 0) <= stale_before]
+
+                # https://docs.microsoft.com/en-us/rest/api/power-bi/datasets/getdatasourcesingroup
+                datasource_futures = {executor.submit(self.get_values, access_token, f'{api_url}v1.0/myorg/groups/{group_id}/datasets/{dataset["id"]}/datasources'): (group_id, dataset)
+                                      for group_id, dataset in pending_datasets}
+                for future in as_completed(datasource_futures):
+                    group_id, dataset = datasource_futures[future]
+                    try:
+                        self.inventory.set_dataset_datasources(group_id, dataset, future.result())
+                    except Exception as ex:
+                        errors.append({'groupId': group_id, 'datasetId': dataset['id'], 'errorMsg': str(ex)})
+
+                # Credentials type is only returned by the gateway, fetch the data sources of each gateway once
+                # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasources
+                gateway_ids = self.inventory.get_gateway_ids()
+                gateway_futures = {executor.submit(self.get_values, access_token, f'{api_url}v1.0/myorg/gateways/{gateway_id}/datasources'): gateway_id for gateway_id in gateway_ids}
+                for future in as_completed(gateway_futures):
+                    gateway_id = gateway_futures[future]
+                    try:
+                        self.inventory.set_credential_types(gateway_id, future.result())
+                    except Exception as ex:
+                        # Cloud gateways are not returned by the API, their data sources keep no credentials type
+                        errors.append({'gatewayId': gateway_id, 'errorMsg': str(ex)})
+
+        return {
+            'groups': len(groups),
+            'datasets': len(datasets),
+            'datasetsCrawled': len(pending_datasets),
+            'datasetsRemoved': len(removed_dataset_keys),
+            'gateways': len(gateway_ids),
+            'errors': errors
+        }
+
+    def search(self, filters):
+        ''' Returns the data sources of the inventory matching all the given filters
+
+        Args:
+            filters (dict): Values keyed by gatewayId, server, database, credType, datasourceType or groupId
+
+        Returns:
+            list: Data sources
+        '''
+
+        return self.inventory.search(filters)
+
+    def get_groups(self, access_token, api_url):
+        ''' Returns all the workspaces, page by page
+
+        Args:
+            access_token (str): Access token to call API
+            api_url (str): Power BI API URL
+
+        Returns:
+            list: Workspaces
+        '''
+
+        groups = []
+        page_size = app.config['DATASOURCE_INVENTORY_PAGE_SIZE']
+
+        # https://docs.microsoft.com/en-us/rest/api/power-bi/groups/getgroups
+        while True:
+            page = self.get_values(access_token, f'{api_url}v1.0/myorg/groups?$top={page_size}&$skip={len(groups)}')
+            groups.extend(page)
+
+            if len(page) < page_size:
+                return groups
+
+    def get_values(self, access_token, endpoint_url):
+        ''' Returns the values of a collection returned by the API
+
+        Args:
+            access_token (str): Access token to call API
+            endpoint_url (str): API endpoint URL
+
+        Returns:
+            list: Values of the collection
+        '''
+
+        # The timeouts and the retries of throttled or failed requests keep a hung call from holding the refresh lock
+        with self.app_context():
+            api_response = RestClient.execute('GET', endpoint_url, access_token)
+
+        if not api_response.ok:
+            raise Exception(f'Error {api_response.status_code} {api_response.reason}\nRequest Id:\t{api_response.headers.get("RequestId")}')
+
+        return api_response.json()['value']
@@ -32,6 +32,19 @@ class DataValidationService:
         else:
             self.validate_creds(data)
 
+    def validate_encrypt_cluster_data(self, data):
+        ''' Validates data for Encrypt credentials for gateway cluster functionality
+
+        Args:
+            data (dict): data
+        '''
+        cluster_id = data['clusterId']
+
+        if not cluster_id or cluster_id == '':
+            raise KeyError('Cluster ID')
+        else:
+            self.validate_creds(data)
+
     def validate_add_data_source(self, data):
         ''' Validates data for Add data source functionality
 
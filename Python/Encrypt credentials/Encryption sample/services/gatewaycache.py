@@ -0,0 +1,62 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import time
+from threading import Lock
+
+
+class GatewayCache:
+
+    # GET gateway API responses keyed by Power BI API URL and Gateway Id, along with their expiry time
+    entries = {}
+    lock = Lock()
+
+    def get(api_url, gateway_id):
+        ''' Returns the cached GET gateway API response if it has not expired
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+
+        Returns:
+            Response: Cached response from the API call or None
+        '''
+
+        with GatewayCache.lock:
+            entry = GatewayCache.entries.get((api_url, gateway_id))
+            if entry is None:
+                return None
+
+            api_response, expires_at = entry
+            if expires_at <= time.monotonic():
+                del GatewayCache.entries[(api_url, gateway_id)]
+                return None
+
+            return api_response
+
+    def set(api_url, gateway_id, api_response, ttl_seconds):
+        ''' Stores a GET gateway API response
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+            api_response (Response): Response from the API call
+            ttl_seconds (int): Number of seconds the response stays valid
+        '''
+
+        if ttl_seconds <= 0:
+            return
+
+        with GatewayCache.lock:
+            GatewayCache.entries[(api_url, gateway_id)] = (api_response, time.monotonic() + ttl_seconds)
+
+    def invalidate(api_url, gateway_id):
+        ''' Removes a gateway from the cache
+
+        Args:
+            api_url (str): Power BI API URL
+            gateway_id (str): Gateway Id
+        '''
+
+        with GatewayCache.lock:
+            GatewayCache.entries.pop((api_url, gateway_id), None)
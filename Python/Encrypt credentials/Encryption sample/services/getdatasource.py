@@ -3,6 +3,7 @@
 
 import requests
 from flask import current_app as app
+from services.gatewaycache import GatewayCache
 
 class GetDatasourceService:
 
@@ -29,8 +30,28 @@ class GetDatasourceService:
 
         return api_response
 
+    def get_gateway_datasources(self, access_token, gateway_id):
+        ''' Returns all the data sources of the given gateway
+
+        Args:
+            access_token (str): Access token to call API
+            gateway_id (str): Gateway Id
+
+        Returns:
+            Response: Response from the API call
+        '''
+
+        self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
+
+        # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/getdatasources
+        endpoint_url = f'{app.config["POWER_BI_API_URL"]}v1.0/myorg/gateways/{gateway_id}/datasources'
+
+        api_response = requests.get(endpoint_url, headers=self.headers)
+
+        return api_response
+
     def get_gateway(self, access_token, gateway_id):
-        ''' Returns the gateway information
+        ''' Returns the gateway information, served from the gateway cache when available
 
         Args:
             access_token (str): Access token to call API
@@ -40,10 +61,51 @@ class GetDatasourceService:
             Response: Response from the API call
         '''
 
+        api_url = app.config["POWER_BI_API_URL"]
+
+        api_response = GatewayCache.get(api_url, gateway_id)
+        if api_response is not None:
+            return api_response
+
         self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
 
-        endpoint_url = f'{app.config["POWER_BI_API_URL"]}v1.0/myorg/gateways/{gateway_id}'
+        endpoint_url = f'{api_url}v1.0/myorg/gateways/{gateway_id}'
 
         api_response = requests.get(endpoint_url, headers=self.headers)
 
+        if api_response.ok:
+            GatewayCache.set(api_url, gateway_id, api_response, app.config['GATEWAY_CACHE_TTL_SECONDS'])
+
+        # Cloud gateways are not returned by the API, remember that for a shorter time
+        elif api_response.status_code == 404:
+            GatewayCache.set(api_url, gateway_id, api_response, app.config['GATEWAY_NEGATIVE_CACHE_TTL_SECONDS'])
+
         return api_response
+
+    def refresh_gateway_after_rejection(self, access_token, gateway, api_response):
+        ''' Invalidates the cached gateway when a request with credentials encrypted for it was rejected
+
+        Args:
+            access_token (str): Access token to call API
+            gateway (dict): Gateway the credentials were encrypted for
+            api_response (Response): Response of the rejected request
+
+        Returns:
+            dict: Gateway with a new public key to retry the request with, None if the public key did not change
+        '''
+
+        # Only requests with credentials encrypted using the gateway public key can be rejected for a stale key
+        if api_response.status_code != 400 or 'name' not in gateway:
+            return None
+
+        GatewayCache.invalidate(app.config["POWER_BI_API_URL"], gateway['id'])
+
+        gateway_api_response = self.get_gateway(access_token, gateway['id'])
+        if not gateway_api_response.ok:
+            return None
+
+        refreshed_gateway = gateway_api_response.json()
+        if refreshed_gateway.get('publicKey') == gateway['publicKey']:
+            return None
+
+        return refreshed_gateway
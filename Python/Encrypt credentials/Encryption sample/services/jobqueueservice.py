@@ -0,0 +1,176 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app as app
+from flask import json
+from services.cloudprofileregistry import CloudProfileRegistry
+from threading import Condition
+
+job_statuses = {
+    'QUEUED': 'Queued',
+    'RUNNING': 'Running',
+    'SUCCEEDED': 'Succeeded',
+    'FAILED': 'Failed'
+}
+
+
+class JobQueueFullError(Exception):
+
+    # Raised when a job is submitted while the maximum number of jobs is already pending, so that it can be answered with 503
+
+    def __init__(self, retry_after_seconds):
+        super().__init__('Job queue is full, try again later')
+        self.retry_after_seconds = retry_after_seconds
+
+
+class JobQueueService:
+
+    # Jobs keyed by Job Id, waiting clients are notified through the condition whenever a job completes
+    jobs = {}
+    condition = Condition()
+
+    # Worker pool shared by all jobs, it caps the number of operations running against the Power BI API
+    executor = None
+
+    def submit(self, operation, operation_function, request_data):
+        ''' Queues the operation and returns right away
+
+        Args:
+            operation (str): Name of the operation, i.e. UpdateDatasource
+            operation_function (function): Function running the operation for the request data and returning the endpoint response
+            request_data (dict): Request data
+
+        Returns:
+            dict: Queued job
+
+        Raises:
+            JobQueueFullError: Maximum number of pending jobs is reached
+        '''
+
+        app_context = CloudProfileRegistry.copy_app_context()
+        now = time.time()
+
+        with JobQueueService.condition:
+            self.remove_expired_jobs(now)
+
+            pending_jobs = sum(1 for job in JobQueueService.jobs.values() if job['status'] in (job_statuses['QUEUED'], job_statuses['RUNNING']))
+            if pending_jobs >= app.config['JOB_QUEUE_MAX_PENDING_JOBS']:
+                raise JobQueueFullError(app.config['JOB_QUEUE_RETRY_AFTER_SECONDS'])
+
+            if JobQueueService.executor is None:
+                JobQueueService.executor = ThreadPoolExecutor(max_workers=app.config['JOB_QUEUE_MAX_WORKERS'])
+
+            job = {
+                'jobId': str(uuid.uuid4()),
+                'operation': operation,
+                'status': job_statuses['QUEUED'],
+                'statusCode': None,
+                'response': None,
+                'createdAt': now,
+                'completedAt': None
+            }
+            JobQueueService.jobs[job['jobId']] = job
+
+            JobQueueService.executor.submit(self.run_job, job['jobId'], operation_function, request_data, app_context)
+
+            return self.get_job_status(job)
+
+    def run_job(self, job_id, operation_function, request_data, app_context):
+        ''' Runs the operation of a job on a worker thread and stores the endpoint response
+
+        Args:
+            job_id (str): Job Id
+            operation_function (function): Function running the operation
+            request_data (dict): Request data
+            app_context (function): App context factory of the request which queued the job
+        '''
+
+        self.set_job(job_id, status=job_statuses['RUNNING'])
+
+        with app_context():
+            try:
+                response = app.make_response(operation_function(request_data))
+                status_code = response.status_code
+                response_text = response.get_data(as_text=True)
+            except Exception as ex:
+                status_code = 500
+                response_text = json.dumps({'errorMsg': str(ex)})
+
+        status = job_statuses['SUCCEEDED'] if status_code < 400 else job_statuses['FAILED']
+        self.set_job(job_id, status=status, statusCode=status_code, response=response_text, completedAt=time.time())
+
+    def set_job(self, job_id, **values):
+        ''' Updates a job and wakes up the clients waiting for it
+
+        Args:
+            job_id (str): Job Id
+            values (dict): Job values to update
+        '''
+
+        with JobQueueService.condition:
+            JobQueueService.jobs[job_id].update(values)
+            JobQueueService.condition.notify_all()
+
+    def get_job(self, job_id, wait_seconds=0):
+        ''' Returns the status of a job, waiting for it to complete for up to the given time
+
+        Args:
+            job_id (str): Job Id
+            wait_seconds (float, optional): Number of seconds to wait for the job to complete. Defaults to 0.
+
+        Returns:
+            dict: Job status, None if the job does not exist or has expired
+        '''
+
+        wait_seconds = min(max(wait_seconds, 0), app.config['JOB_QUEUE_MAX_WAIT_SECONDS'])
+
+        with JobQueueService.condition:
+            job = JobQueueService.jobs.get(job_id)
+            if job is None:
+                return None
+
+            JobQueueService.condition.wait_for(lambda: job['completedAt'] is not None, timeout=wait_seconds)
+
+            return self.get_job_status(job)
+
+    def get_job_status(self, job):
+        ''' Returns the job as returned to the client
+
+        Args:
+            job (dict): Job
+
+        Returns:
+            dict: Job status
+        '''
+
+        job_status = dict(job)
+        job_status['createdAt'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['createdAt']))
+
+        if job['completedAt'] is not None:
+            job_status['completedAt'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['completedAt']))
+
+        # Return the endpoint response as JSON when it is one
+        if job['response']:
+            try:
+                job_status['response'] = json.loads(job['response'])
+            except ValueError:
+                pass
+
+        return job_status
+
+    def remove_expired_jobs(self, now):
+        ''' Removes the jobs completed longer ago than the retention time, must be called holding the condition
+
+        Args:
+            now (float): Current time
+        '''
+
+        completed_before = now - app.config['JOB_QUEUE_RETENTION_SECONDS']
+        expired_job_ids = [job_id for job_id, job in JobQueueService.jobs.items()
+                           if job['completedAt'] is not None and job['completedAt'] < completed_before]
+
+        for job_id in expired_job_ids:
+            del JobQueueService.jobs[job_id]
@@ -0,0 +1,109 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import random
+import requests
+import time
+from email.utils import parsedate_to_datetime
+from flask import current_app as app
+from flask import json
+from requests.adapters import HTTPAdapter
+from threading import Lock
+
+
+class RestClient:
+
+    # Throttled and transient server errors are retried, any other response is returned as it is
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    # Pooled HTTP sessions keyed by Power BI API URL, shared by all the requests to the same cloud
+    sessions = {}
+    lock = Lock()
+
+    def get_session():
+        ''' Returns the HTTP session of the Power BI API URL, creating it on first use
+
+        Returns:
+            Session: HTTP session
+        '''
+
+        api_url = app.config['POWER_BI_API_URL']
+
+        with RestClient.lock:
+            if api_url not in RestClient.sessions:
+                pool_size = app.config['REST_CLIENT_POOL_SIZE']
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+                session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+                RestClient.sessions[api_url] = session
+
+            return RestClient.sessions[api_url]
+
+    def execute(method, endpoint_url, access_token, request_body=None, before_retry=None):
+        ''' Makes the API call, retrying throttled requests, transient server errors and connection failures with backoff
+
+        Args:
+            method (str): HTTP method
+            endpoint_url (str): API endpoint URL
+            access_token (str): Access token to call API
+            request_body (dict, optional): API request body. Defaults to None.
+            before_retry (function, optional): Called before each retry with the failed response, None if the request failed
+                without a response. Returning a response stops retrying and returns it. Defaults to None.
+
+        Returns:
+            Response: Response from the API call
+        '''
+
+        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
+        data = json.dumps(request_body) if request_body is not None else None
+        timeout = (app.config['REST_CLIENT_CONNECT_TIMEOUT_SECONDS'], app.config['REST_CLIENT_READ_TIMEOUT_SECONDS'])
+        max_retries = app.config['REST_CLIENT_MAX_RETRIES']
+        session = RestClient.get_session()
+
+        for attempt in range(max_retries + 1):
+            try:
+                api_response = session.request(method, endpoint_url, data=data, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == max_retries:
+                    raise
+                api_response = None
+            else:
+                if api_response.status_code not in RestClient.RETRY_STATUS_CODES or attempt == max_retries:
+                    return api_response
+
+            time.sleep(RestClient.get_retry_delay(attempt, api_response))
+
+            if before_retry is not None:
+                previous_api_response = before_retry(api_response)
+                if previous_api_response is not None:
+                    return previous_api_response
+
+    def get_retry_delay(attempt, api_response):
+        ''' Returns the number of seconds to wait before retrying, as requested by the Retry-After header or else with exponential backoff
+
+        Args:
+            attempt (int): Number of the failed attempt, starting from 0
+            api_response (Response): Failed response, None if the request failed without a response
+
+        Returns:
+            float: Delay in seconds
+        '''
+
+        max_delay = app.config['REST_CLIENT_MAX_BACKOFF_SECONDS']
+
+        retry_after = api_response.headers.get('Retry-After') if api_response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                # Retry-After can also be an HTTP date
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+
+            if delay is not None:
+                return min(max(delay, 0), max_delay)
+
+        # Full jitter keeps concurrent clients from retrying in lockstep
+        return random.uniform(0, min(max_delay, app.config['REST_CLIENT_BACKOFF_BASE_SECONDS'] * 2 ** attempt))
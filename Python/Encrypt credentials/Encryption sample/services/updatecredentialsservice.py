@@ -1,19 +1,16 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import requests
 from flask import current_app as app
-from flask import json
 from models.credentialsdetails import CredentialsDetails
 from models.credentialsdetailsrequest import CredentialsDetailsRequest
 from services.asymmetrickeyencryptor import AsymmetricKeyEncryptor
+from services.restclient import RestClient
 from utils import Utils
 
 
 class UpdateCredentialsService:
 
-    headers = None
-
     def update_datasource(self, access_token, cred_type, privacy_level, credentials_array, gateway, datasource_id):
         ''' Updates data source with encrypted credentials
 
@@ -28,7 +25,24 @@ class UpdateCredentialsService:
         Returns:
             Response: Response from the API call
         '''
-        gateway_id = gateway['id']
+
+        credentials_details_req = self.get_credentials_details_request(cred_type, privacy_level, credentials_array, gateway)
+
+        return self.make_update_datasource_patch_request(credentials_details_req, gateway['id'], datasource_id, access_token)
+
+    def get_credentials_details_request(self, cred_type, privacy_level, credentials_array, gateway):
+        ''' Returns the request body with credentials encrypted for the gateway
+
+        Args:
+            cred_type (str): Type of the credentials (i.e. Basic, Windows, OAuth2)
+            privacy_level (str): Privacy level
+            credentials_array (dict): Credentials based on the user input of the credentials type
+            gateway (Gateway): Gateway response
+
+        Returns:
+            CredentialsDetailsRequest: Credentials update request body
+        '''
+
         public_key = gateway['publicKey']
 
         # Serialize credentials for encryption
@@ -52,9 +66,7 @@ class UpdateCredentialsService:
         credentials_details = CredentialsDetails(cred_type, encrypted_data, encrypted_connection, privacy_level)
 
         # Converting CredentialDetails class object to json string
-        credentials_details_req = CredentialsDetailsRequest(credentials_details.__dict__)
-
-        return self.make_update_datasource_patch_request(credentials_details_req, gateway_id, datasource_id, access_token)
+        return CredentialsDetailsRequest(credentials_details.__dict__)
 
     def make_update_datasource_patch_request(self, credentials_details_req, gateway_id, datasource_id, access_token):
         ''' Makes API call
@@ -69,12 +81,11 @@ class UpdateCredentialsService:
             Response: Response from the API call
         '''
 
-        self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + access_token}
-
         # Gateways - Update Datasource Power BI REST API
         # https://docs.microsoft.com/en-us/rest/api/power-bi/gateways/updatedatasource
         endpoint_url = f'{app.config["POWER_BI_API_URL"]}v1.0/myorg/gateways/{gateway_id}/datasources/{datasource_id}'
 
-        api_response = requests.patch(endpoint_url, data=json.dumps(credentials_details_req.__dict__), headers=self.headers)
+        # Updating the credentials is idempotent, it is safe to retry
+        api_response = RestClient.execute('PATCH', endpoint_url, access_token, credentials_details_req.__dict__)
 
         return api_response
@@ -49,6 +49,8 @@ class Utils:
             return 'Scope base is not provided in config.py file'
         if authority == '':
             return 'Authority URL is not provided in config.py file'
+        if app.config['TOKEN_CACHE_FILE'] != '' and app.config['TOKEN_CACHE_ENCRYPTION_KEY'] == '':
+            return 'Token cache encryption key is not provided in config.py file'
 
     def serialize_credentials(credentials_arr, cred_type):
         ''' Returns serialized credentials
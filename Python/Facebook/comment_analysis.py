@@ -0,0 +1,284 @@
+import asyncio
+import pandas as pd
+import json
+import llm_executor as le
+import comment_sentiment as cs
+import comment_message_categorization as cmt
+from openai import AsyncOpenAI
+from typing import Dict, List
+
+
+class CommentAnalyzer:
+    # Change the version whenever the prompt changes, so that results cached for the previous prompt are not reused
+    PROMPT_VERSION = "comment-analysis-v1"
+
+    # Keys of the sentiment analysis and categorization results, mapped to the keys of the combined result
+    SENTIMENT_KEYS = {
+        "sentiment": "sentiment",
+        "confidence_score": "sentiment_confidence_score",
+        "key_emotions": "key_emotions",
+        "reasoning": "sentiment_reasoning"
+    }
+    CATEGORIZATION_KEYS = {
+        "primary_category": "primary_category",
+        "secondary_categories": "secondary_categories",
+        "confidence_score": "category_confidence_score",
+        "keywords": "keywords",
+        "reasoning": "categorization_reasoning"
+    }
+
+    def __init__(self, api_key: str = None, executor: le.LlmExecutor = None):
+        """
+        Initialize the comment analyzer, which assesses the sentiment of a comment and categorizes it in a single request.
+
+        Args:
+            api_key (str, optional): OpenAI API key. If None, reads from environment.
+            executor (le.LlmExecutor, optional): Executor shared with other analyzers. If None, one is created with the default limits.
+        """
+        self.executor = executor or le.LlmExecutor(api_key=api_key)
+
+        # The results are validated the same way as in the two-pass analysis
+        self.sentiment_analyzer = cs.SentimentAnalyzer(executor=self.executor)
+        self.categorizer = cmt.ContentCategorizer(executor=self.executor)
+
+    def build_messages(self, comments: List[str]) -> List[Dict]:
+        """
+        Build the chat messages analyzing one or more comments, each tagged with its position as ID.
+
+        Args:
+            comments (List[str]): The social media comments to analyze
+
+        Returns:
+            List[Dict]: Chat messages
+        """
+        # Create a description of categories for the prompt
+        categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categorizer.categories.items()])
+        tagged_comments = json.dumps([{"id": str(i), "text": comment} for i, comment in enumerate(comments)], ensure_ascii=False)
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an AI specialized in analyzing Davis & Shirtliff's social media content. "
+                "Assess the sentiment of comments on Davis & Shirtliff products or services and categorize them based on predefined categories."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze each of the following comments. Assess its sentiment and categorize it according to these categories:
+
+{categories_desc}
+
+Comments, as a JSON array of objects with an id and a text:
+{tagged_comments}
+
+Provide a JSON response with a "results" key holding an array with one object per comment, each with these keys:
+- id: The id of the comment
+- sentiment: Overall sentiment (Positive/Negative/Neutral)
+- sentiment_confidence_score: Confidence level of the sentiment (0-1)
+- key_emotions: Array of detected emotions
+- sentiment_reasoning: Brief explanation of sentiment classification
+- primary_category: Main category the comment belongs to
+- secondary_categories: Array of other relevant categories (if any)
+- category_confidence_score: Confidence level of the categorization (0-1)
+- keywords: Array of key terms that influenced the categorization
+- categorization_reasoning: Brief explanation of the categorization
+
+Ensure the response is a valid JSON object."""
+            }
+        ]
+
+    def parse_result(self, result: Dict) -> Dict:
+        """
+        Split a combined result into a sentiment analysis result and a categorization result and validate them.
+
+        Args:
+            result (Dict): Result returned by the model
+
+        Returns:
+            Dict: Sentiment analysis result under "sentiment" and categorization result under "categorization"
+
+        Raises:
+            ValueError: If a key is missing or holds a value out of the expected ones
+        """
+        missing = [key for key in self.SENTIMENT_KEYS.values() if key not in result]
+        missing += [key for key in self.CATEGORIZATION_KEYS.values() if key not in result]
+        if missing:
+            raise ValueError(f"Comment analysis result without {', '.join(missing)}")
+
+        return {
+            "sentiment": self.sentiment_analyzer.parse_result({key: result[fused_key] for key, fused_key in self.SENTIMENT_KEYS.items()}),
+            "categorization": self.categorizer.parse_result({key: result[fused_key] for key, fused_key in self.CATEGORIZATION_KEYS.items()})
+        }
+
+    def build_request(self, comments: List[str]) -> Dict:
+        """
+        Build the chat completion parameters analyzing one or more comments.
+
+        Args:
+            comments (List[str]): The social media comments to analyze
+
+        Returns:
+            Dict: Chat completion parameters
+        """
+        return {
+            "messages": self.build_messages(comments),
+            "max_tokens": 500 * len(comments),
+            "response_format": {"type": "json_object"},
+            "temperature": 0.3
+        }
+
+    def parse_response(self, content: str, comments: List[str]) -> Dict[int, Dict]:
+        """
+        Map the response to a request built by build_request back to the comments.
+
+        Args:
+            content (str): Content of the completion
+            comments (List[str]): The social media comments of the request
+
+        Returns:
+            Dict[int, Dict]: Combined results keyed by position of the comment, without the comments missing from the response
+                or with an invalid result
+        """
+        # Map the results back to the comments by ID
+        results = {}
+        for item in json.loads(content).get('results', []):
+            try:
+                position = int(item.pop('id'))
+                if 0 <= position < len(comments):
+                    results[position] = self.parse_result(item)
+            except Exception:
+                continue
+
+        return results
+
+    async def analyze_batch_async(self, comments: List[str], client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> List[Dict]:
+        """
+        Assess the sentiment of several comments and categorize them in one request. The comments missing from the response or
+        with an invalid result are analyzed on their own.
+
+        Args:
+            comments (List[str]): The social media comments to analyze
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            List[Dict]: Combined result of each comment
+        """
+        results = {}
+        error = "No valid result returned"
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request(comments))
+            results = self.parse_response(content, comments)
+
+        except Exception as e:
+            error = str(e)
+            if len(comments) > 1:
+                print(f"Batch comment analysis error, analyzing the comments one by one: {error}")
+
+        if len(comments) == 1:
+            return [results.get(0) or self.get_error_result(error)]
+
+        missing = [i for i in range(len(comments)) if i not in results]
+        missing_results = await asyncio.gather(*[self.analyze_batch_async([comments[i]], client, semaphore) for i in missing])
+        for i, result in zip(missing, missing_results):
+            results[i] = result[0]
+
+        return [results[i] for i in range(len(comments))]
+
+    def get_error_result(self, error: str) -> Dict:
+        """
+        Get the fallback result of a comment which could not be analyzed.
+
+        Args:
+            error (str): Error details
+
+        Returns:
+            Dict: Combined fallback result
+        """
+        return {
+            "sentiment": {
+                "sentiment": "Neutral",
+                "confidence_score": 0.5,
+                "key_emotions": [],
+                "reasoning": f"Error in analysis: {error}"
+            },
+            "categorization": {
+                "primary_category": "Uncategorized",
+                "secondary_categories": [],
+                "confidence_score": 0.5,
+                "keywords": [],
+                "reasoning": f"Error in categorization: {error}"
+            },
+            "error": error
+        }
+
+    def batch_analysis(
+        self,
+        df: pd.DataFrame,
+        comment_column: str,
+        items_per_request: int = 1
+    ) -> pd.DataFrame:
+        """
+        Assess the sentiment of all the comments and categorize them concurrently, within the rate limits of the executor.
+        The DataFrame gets the same columns as from batch_sentiment_analysis followed by batch_categorization.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame
+            comment_column (str): Name of the column containing comments
+            items_per_request (int): Number of comments analyzed in each request
+
+        Returns:
+            pd.DataFrame: DataFrame with added sentiment analysis and categorization columns
+        """
+        result_df = df.copy()
+
+        # Prepare columns for sentiment analysis results
+        result_df['Sentiment'] = 'Neutral'
+        result_df['Confidence_Score'] = 0.5
+        result_df['Key_Emotions'] = None
+        result_df['Reasoning'] = ''
+
+        # Prepare columns for categorization results
+        result_df['Primary_Category'] = 'Uncategorized'
+        result_df['Secondary_Categories'] = None
+        result_df['Cat_confidence_Score'] = 0.5
+        result_df['Keywords'] = None
+        result_df['Categorization_Reasoning'] = ''
+
+        # Skip processing for non-string or empty comments
+        comments = [(idx, comment) for idx, comment in result_df[comment_column].items() if isinstance(comment, str) and comment.strip()]
+
+        # Analyze all the comments at once
+        results = self.executor.analyze_texts(
+            self.analyze_batch_async,
+            [comment for _, comment in comments],
+            items_per_request,
+            self.PROMPT_VERSION,
+            self.categorizer.categories,
+            self.build_request,
+            self.parse_response
+        )
+
+        for (idx, _), result in zip(comments, results):
+            try:
+                # Update DataFrame with results
+                sentiment = result['sentiment']
+                result_df.at[idx, 'Sentiment'] = sentiment['sentiment']
+                result_df.at[idx, 'Confidence_Score'] = sentiment['confidence_score']
+                result_df.at[idx, 'Key_Emotions'] = ', '.join(sentiment['key_emotions'])
+                result_df.at[idx, 'Reasoning'] = sentiment['reasoning']
+
+                categorization = result['categorization']
+                result_df.at[idx, 'Primary_Category'] = categorization['primary_category']
+                result_df.at[idx, 'Secondary_Categories'] = ', '.join(categorization['secondary_categories'])
+                result_df.at[idx, 'Cat_confidence_Score'] = categorization['confidence_score']
+                result_df.at[idx, 'Keywords'] = ', '.join(categorization['keywords'])
+                result_df.at[idx, 'Categorization_Reasoning'] = categorization['reasoning']
+
+            except Exception as comment_error:
+                result_df.at[idx, 'Reasoning'] = f"Individual comment analysis error: {str(comment_error)}"
+
+        return result_df
+
+
+if __name__ == "__main__":
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
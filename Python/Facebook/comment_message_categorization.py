@@ -1,21 +1,24 @@
-import os
-import time
-import random
+import asyncio
 import pandas as pd
 import json
-from openai import OpenAI
+import llm_executor as le
+from openai import AsyncOpenAI
 from typing import Dict, List
 
 class ContentCategorizer:
-    def __init__(self, api_key: str = None):
+    # Change the version whenever the prompts change, so that results cached for the previous prompts are not reused
+    PROMPT_VERSION = "comment-categorization-v1"
+
+    def __init__(self, api_key: str = None, executor: le.LlmExecutor = None):
         """
-        Initialize the content categorizer with OpenAI client.
-        
+        Initialize the content categorizer with a rate-limited OpenAI executor.
+
         Args:
             api_key (str, optional): OpenAI API key. If None, reads from environment.
+            executor (le.LlmExecutor, optional): Executor shared with other analyzers. If None, one is created with the default limits.
         """
-        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
-        
+        self.executor = executor or le.LlmExecutor(api_key=api_key)
+
         # Define categories and their descriptions
         self.categories = {
             "Price Inquiry": "Comments about cost or discounts",
@@ -25,33 +28,29 @@ class ContentCategorizer:
             "Comparison": "Comments comparing with competitors or other products",
             "Order Inquiry": "Comments about purchases or delivery"
         }
-    
-    def categorize_content(self, comment: str) -> Dict:
+
+    def build_messages(self, comment: str) -> List[Dict]:
         """
-        Categorize a comment into predefined categories using GPT-4 Omni.
-        
+        Build the chat messages categorizing a comment.
+
         Args:
             comment (str): The social media comment to categorize
-        
+
         Returns:
-            Dict: Structured categorization result
+            List[Dict]: Chat messages
         """
-        try:
-            # Create a description of categories for the prompt
-            categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini-2024-07-18",
-                response_format={"type": "json_object"},
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
-                        "Analyze comments and categorize them based on predefined categories."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"""Analyze the following comment and categorize it according to these categories:
+        # Create a description of categories for the prompt
+        categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
+                "Analyze comments and categorize them based on predefined categories."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze the following comment and categorize it according to these categories:
 
 {categories_desc}
 
@@ -65,96 +64,250 @@ Provide a JSON response with these keys:
 - reasoning: Brief explanation of the categorization
 
 Ensure the response is a valid JSON object."""
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
+            }
+        ]
+
+    def build_batch_messages(self, comments: List[str]) -> List[Dict]:
+        """
+        Build the chat messages categorizing several comments in one request, each tagged with its position as ID.
+
+        Args:
+            comments (List[str]): The social media comments to categorize
+
+        Returns:
+            List[Dict]: Chat messages
+        """
+        # Create a description of categories for the prompt
+        categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
+        tagged_comments = json.dumps([{"id": str(i), "text": comment} for i, comment in enumerate(comments)], ensure_ascii=False)
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
+                "Analyze comments and categorize them based on predefined categories."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze each of the following comments and categorize it according to these categories:
+
+{categories_desc}
+
+Comments, as a JSON array of objects with an id and a text:
+{tagged_comments}
+
+Provide a JSON response with a "results" key holding an array with one object per comment, each with these keys:
+- id: The id of the comment
+- primary_category: Main category the comment belongs to
+- secondary_categories: Array of other relevant categories (if any)
+- confidence_score: Confidence level (0-1)
+- keywords: Array of key terms that influenced the categorization
+- reasoning: Brief explanation of the categorization
+
+Ensure the response is a valid JSON object."""
+            }
+        ]
+
+    def parse_result(self, result: Dict) -> Dict:
+        """
+        Validate the structure of a categorization result.
+
+        Args:
+            result (Dict): Result returned by the model
+
+        Returns:
+            Dict: Structured categorization result
+
+        Raises:
+            ValueError: If a key is missing or holds a value out of the expected ones
+        """
+        missing = [key for key in ('primary_category', 'secondary_categories', 'confidence_score', 'keywords', 'reasoning') if key not in result]
+        if missing:
+            raise ValueError(f"Categorization result without {', '.join(missing)}")
+
+        if result['primary_category'] not in self.categories:
+            raise ValueError(f"Unexpected primary category: {result['primary_category']}")
+
+        confidence_score = result['confidence_score']
+        if isinstance(confidence_score, bool) or not isinstance(confidence_score, (int, float)) or not 0 <= confidence_score <= 1:
+            raise ValueError(f"Confidence score out of 0-1: {confidence_score}")
+
+        if not isinstance(result['secondary_categories'], list) or not isinstance(result['keywords'], list):
+            raise ValueError("Secondary categories or keywords are not an array")
+
+        result['confidence_score'] = float(confidence_score)
+
+        return result
+
+    def build_request(self, comments: List[str]) -> Dict:
+        """
+        Build the chat completion parameters categorizing one or more comments.
+
+        Args:
+            comments (List[str]): The social media comments to categorize
+
+        Returns:
+            Dict: Chat completion parameters
+        """
+        return {
+            "messages": self.build_messages(comments[0]) if len(comments) == 1 else self.build_batch_messages(comments),
+            "max_tokens": 300 * len(comments),
+            "response_format": {"type": "json_object"},
+            "temperature": 0.3
+        }
+
+    def parse_response(self, content: str, comments: List[str]) -> Dict[int, Dict]:
+        """
+        Map the response to a request built by build_request back to the comments.
+
+        Args:
+            content (str): Content of the completion
+            comments (List[str]): The social media comments of the request
+
+        Returns:
+            Dict[int, Dict]: Structured categorization results keyed by position of the comment, without the comments missing
+                from the response or with an invalid result
+        """
+        if len(comments) == 1:
+            return {0: self.parse_result(json.loads(content))}
+
+        # Map the results back to the comments by ID
+        results = {}
+        for item in json.loads(content).get('results', []):
+            try:
+                position = int(item.pop('id'))
+                if 0 <= position < len(comments):
+                    results[position] = self.parse_result(item)
+            except Exception:
+                continue
+
+        return results
+
+    async def categorize_async(self, comment: str, client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> Dict:
+        """
+        Categorize a comment into predefined categories using GPT-4 Omni within the rate limits of the executor.
+
+        Args:
+            comment (str): The social media comment to categorize
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            Dict: Structured categorization result
+        """
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request([comment]))
+
             # Parse the response
-            result = json.loads(response.choices[0].message.content)
-            
-            # Validate the result structure
-            result['primary_category'] = result.get('primary_category', 'Uncategorized')
-            result['secondary_categories'] = result.get('secondary_categories', [])
-            result['confidence_score'] = float(result.get('confidence_score', 0.5))
-            result['keywords'] = result.get('keywords', [])
-            result['reasoning'] = result.get('reasoning', 'No specific reasoning provided')
-            
-            return result
-        
+            return self.parse_response(content, [comment])[0]
+
         except Exception as e:
             return {
                 "primary_category": "Uncategorized",
                 "secondary_categories": [],
                 "confidence_score": 0.5,
                 "keywords": [],
-                "reasoning": f"Error in categorization: {str(e)}"
+                "reasoning": f"Error in categorization: {str(e)}",
+                "error": str(e)
             }
-    
+
+    async def categorize_batch_async(self, comments: List[str], client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> List[Dict]:
+        """
+        Categorize several comments in one request. The comments missing from the response or with an invalid result are
+        categorized on their own.
+
+        Args:
+            comments (List[str]): The social media comments to categorize
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            List[Dict]: Structured categorization result of each comment
+        """
+        if len(comments) == 1:
+            return [await self.categorize_async(comments[0], client, semaphore)]
+
+        results = {}
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request(comments))
+            results = self.parse_response(content, comments)
+
+        except Exception as e:
+            print(f"Batch categorization error, categorizing the comments one by one: {str(e)}")
+
+        missing = [i for i in range(len(comments)) if i not in results]
+        missing_results = await asyncio.gather(*[self.categorize_async(comments[i], client, semaphore) for i in missing])
+        for i, result in zip(missing, missing_results):
+            results[i] = result
+
+        return [results[i] for i in range(len(comments))]
+
+    def categorize_content(self, comment: str) -> Dict:
+        """
+        Categorize a comment into predefined categories using GPT-4 Omni.
+
+        Args:
+            comment (str): The social media comment to categorize
+
+        Returns:
+            Dict: Structured categorization result
+        """
+        return self.executor.analyze_texts(self.categorize_batch_async, [comment], 1, self.PROMPT_VERSION, self.categories)[0]
+
     def batch_categorization(
-        self, 
-        df: pd.DataFrame, 
-        comment_column: str, 
-        batch_size: int = 10, 
-        delay_range: tuple = (1, 3)
+        self,
+        df: pd.DataFrame,
+        comment_column: str,
+        items_per_request: int = 1
     ) -> pd.DataFrame:
         """
-        Perform batch categorization with rate limiting and error handling.
-        
+        Categorize all the comments concurrently, within the rate limits of the executor.
+
         Args:
             df (pd.DataFrame): Input DataFrame
             comment_column (str): Name of the column containing comments
-            batch_size (int): Number of comments to process in each batch
-            delay_range (tuple): Range of random delay between batches (min, max)
-        
+            items_per_request (int): Number of comments categorized in each request
+
         Returns:
             pd.DataFrame: DataFrame with added categorization columns
         """
         result_df = df.copy()
-        
+
         # Prepare columns for categorization results
         result_df['Primary_Category'] = 'Uncategorized'
         result_df['Secondary_Categories'] = None
         result_df['Cat_confidence_Score'] = 0.5
         result_df['Keywords'] = None
         result_df['Categorization_Reasoning'] = ''
-        
-        # Process comments in batches
-        for i in range(0, len(result_df), batch_size):
+
+        comments = [(idx, comment) for idx, comment in result_df[comment_column].items() if isinstance(comment, str) and comment.strip()]
+
+        # Perform categorization for all the comments at once
+        results = self.executor.analyze_texts(
+            self.categorize_batch_async,
+            [comment for _, comment in comments],
+            items_per_request,
+            self.PROMPT_VERSION,
+            self.categories,
+            self.build_request,
+            self.parse_response
+        )
+
+        for (idx, _), result in zip(comments, results):
             try:
-                batch = result_df.iloc[i:i+batch_size]
-                
-                for idx, row in batch.iterrows():
-                    try:
-                        comment = row[comment_column]
-                        
-                        if not isinstance(comment, str) or not comment.strip():
-                            continue
-                        
-                        # Perform categorization
-                        result = self.categorize_content(comment)
-                        
-                        # Update DataFrame with results
-                        result_df.at[idx, 'Primary_Category'] = result['primary_category']
-                        result_df.at[idx, 'Secondary_Categories'] = ', '.join(result['secondary_categories'])
-                        result_df.at[idx, 'Cat_confidence_Score'] = result['confidence_score']
-                        result_df.at[idx, 'Keywords'] = ', '.join(result['keywords'])
-                        result_df.at[idx, 'Categorization_Reasoning'] = result['reasoning']
-                    
-                    except Exception as comment_error:
-                        result_df.at[idx, 'Categorization_Reasoning'] = f"Individual comment categorization error: {str(comment_error)}"
-                
-                # Random delay between batches
-                delay = random.uniform(delay_range[0], delay_range[1])
-                time.sleep(delay)
-            
-            except Exception as batch_error:
-                print(f"Batch processing error at index {i}: {str(batch_error)}")
-        
+                # Update DataFrame with results
+                result_df.at[idx, 'Primary_Category'] = result['primary_category']
+                result_df.at[idx, 'Secondary_Categories'] = ', '.join(result['secondary_categories'])
+                result_df.at[idx, 'Cat_confidence_Score'] = result['confidence_score']
+                result_df.at[idx, 'Keywords'] = ', '.join(result['keywords'])
+                result_df.at[idx, 'Categorization_Reasoning'] = result['reasoning']
+
+            except Exception as comment_error:
+                result_df.at[idx, 'Categorization_Reasoning'] = f"Individual comment categorization error: {str(comment_error)}"
+
         return result_df
-    
+
 
 
 if __name__ == "__main__":
-    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
\ No newline at end of file
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
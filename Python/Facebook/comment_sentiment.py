@@ -1,47 +1,48 @@
-import os
-import time
-import random
+import asyncio
 import pandas as pd
 import json
-from openai import OpenAI
+import llm_executor as le
+from openai import AsyncOpenAI
 from typing import Dict, List
 
 
 
 class SentimentAnalyzer:
-    def __init__(self, api_key: str = None):
+    # Change the version whenever the prompts change, so that results cached for the previous prompts are not reused
+    PROMPT_VERSION = "sentiment-v1"
+
+    SENTIMENTS = ("Positive", "Negative", "Neutral")
+
+    def __init__(self, api_key: str = None, executor: le.LlmExecutor = None):
         """
-        Initialize the sentiment analyzer with OpenAI client.
-        
+        Initialize the sentiment analyzer with a rate-limited OpenAI executor.
+
         Args:
             api_key (str, optional): OpenAI API key. If None, reads from environment.
+            executor (le.LlmExecutor, optional): Executor shared with other analyzers. If None, one is created with the default limits.
         """
         # Use environment variable if no API key provided
-        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
-    
-    def advanced_sentiment_analysis(self, comment: str) -> Dict:
+        self.executor = executor or le.LlmExecutor(api_key=api_key)
+
+    def build_messages(self, comment: str) -> List[Dict]:
         """
-        Perform advanced sentiment analysis using GPT-4 Omni.
-        
+        Build the chat messages analyzing a comment.
+
         Args:
             comment (str): The text comment to analyze
-        
+
         Returns:
-            Dict: Structured sentiment analysis result
+            List[Dict]: Chat messages
         """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini-2024-07-18",
-                response_format={"type": "json_object"},
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are an advanced sentiment analysis AI reviewing sentiments made on Davis & Shirtliff products. "
-                        "Provide a structured JSON response analyzing the sentiment of a given text."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"""Analyze the following comment and provide a detailed sentiment assessment on comments that relate to Davis & Shirtliff products or services:
+        return [
+            {
+                "role": "system",
+                "content": "You are an advanced sentiment analysis AI reviewing sentiments made on Davis & Shirtliff products. "
+                "Provide a structured JSON response analyzing the sentiment of a given text."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze the following comment and provide a detailed sentiment assessment on comments that relate to Davis & Shirtliff products or services:
 
 Comment: {comment}
 
@@ -52,97 +53,244 @@ Provide a JSON response with these keys:
 - reasoning: Brief explanation of sentiment classification
 
 Ensure the response is a valid JSON object."""
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
+            }
+        ]
+
+    def build_batch_messages(self, comments: List[str]) -> List[Dict]:
+        """
+        Build the chat messages analyzing several comments in one request, each tagged with its position as ID.
+
+        Args:
+            comments (List[str]): The text comments to analyze
+
+        Returns:
+            List[Dict]: Chat messages
+        """
+        tagged_comments = json.dumps([{"id": str(i), "text": comment} for i, comment in enumerate(comments)], ensure_ascii=False)
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an advanced sentiment analysis AI reviewing sentiments made on Davis & Shirtliff products. "
+                "Provide a structured JSON response analyzing the sentiment of each given text."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze each of the following comments and provide a detailed sentiment assessment on comments that relate to Davis & Shirtliff products or services.
+
+Comments, as a JSON array of objects with an id and a text:
+{tagged_comments}
+
+Provide a JSON response with a "results" key holding an array with one object per comment, each with these keys:
+- id: The id of the comment
+- sentiment: Overall sentiment (Positive/Negative/Neutral)
+- confidence_score: Confidence level (0-1)
+- key_emotions: Array of detected emotions
+- reasoning: Brief explanation of sentiment classification
+
+Ensure the response is a valid JSON object."""
+            }
+        ]
+
+    def parse_result(self, result: Dict) -> Dict:
+        """
+        Validate the structure of a sentiment analysis result.
+
+        Args:
+            result (Dict): Result returned by the model
+
+        Returns:
+            Dict: Structured sentiment analysis result
+
+        Raises:
+            ValueError: If a key is missing or holds a value out of the expected ones
+        """
+        missing = [key for key in ('sentiment', 'confidence_score', 'key_emotions', 'reasoning') if key not in result]
+        if missing:
+            raise ValueError(f"Sentiment analysis result without {', '.join(missing)}")
+
+        if result['sentiment'] not in self.SENTIMENTS:
+            raise ValueError(f"Unexpected sentiment: {result['sentiment']}")
+
+        confidence_score = result['confidence_score']
+        if isinstance(confidence_score, bool) or not isinstance(confidence_score, (int, float)) or not 0 <= confidence_score <= 1:
+            raise ValueError(f"Confidence score out of 0-1: {confidence_score}")
+
+        if not isinstance(result['key_emotions'], list):
+            raise ValueError("Key emotions are not an array")
+
+        result['confidence_score'] = float(confidence_score)
+
+        return result
+
+    def build_request(self, comments: List[str]) -> Dict:
+        """
+        Build the chat completion parameters analyzing one or more comments.
+
+        Args:
+            comments (List[str]): The text comments to analyze
+
+        Returns:
+            Dict: Chat completion parameters
+        """
+        return {
+            "messages": self.build_messages(comments[0]) if len(comments) == 1 else self.build_batch_messages(comments),
+            "max_tokens": 300 * len(comments),
+            "response_format": {"type": "json_object"},
+            "temperature": 0.3
+        }
+
+    def parse_response(self, content: str, comments: List[str]) -> Dict[int, Dict]:
+        """
+        Map the response to a request built by build_request back to the comments.
+
+        Args:
+            content (str): Content of the completion
+            comments (List[str]): The text comments of the request
+
+        Returns:
+            Dict[int, Dict]: Structured sentiment analysis results keyed by position of the comment, without the comments
+                missing from the response or with an invalid result
+        """
+        if len(comments) == 1:
+            return {0: self.parse_result(json.loads(content))}
+
+        # Map the results back to the comments by ID
+        results = {}
+        for item in json.loads(content).get('results', []):
+            try:
+                position = int(item.pop('id'))
+                if 0 <= position < len(comments):
+                    results[position] = self.parse_result(item)
+            except Exception:
+                continue
+
+        return results
+
+    async def analyze_async(self, comment: str, client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> Dict:
+        """
+        Perform advanced sentiment analysis using GPT-4 Omni within the rate limits of the executor.
+
+        Args:
+            comment (str): The text comment to analyze
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            Dict: Structured sentiment analysis result
+        """
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request([comment]))
+
             # Parse the response
-            result = json.loads(response.choices[0].message.content)
-            
-            # Validate the result structure
-            result['sentiment'] = result.get('sentiment', 'Neutral')
-            result['confidence_score'] = float(result.get('confidence_score', 0.5))
-            result['key_emotions'] = result.get('key_emotions', [])
-            result['reasoning'] = result.get('reasoning', 'No specific reasoning provided')
-            
-            return result
-        
+            return self.parse_response(content, [comment])[0]
+
         except Exception as e:
             # Fallback error handling
             return {
                 "sentiment": "Neutral",
                 "confidence_score": 0.5,
                 "key_emotions": [],
-                "reasoning": f"Error in analysis: {str(e)}"
+                "reasoning": f"Error in analysis: {str(e)}",
+                "error": str(e)
             }
-    
+
+    async def analyze_batch_async(self, comments: List[str], client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> List[Dict]:
+        """
+        Perform advanced sentiment analysis of several comments in one request. The comments missing from the response or with
+        an invalid result are analyzed on their own.
+
+        Args:
+            comments (List[str]): The text comments to analyze
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            List[Dict]: Structured sentiment analysis result of each comment
+        """
+        if len(comments) == 1:
+            return [await self.analyze_async(comments[0], client, semaphore)]
+
+        results = {}
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request(comments))
+            results = self.parse_response(content, comments)
+
+        except Exception as e:
+            print(f"Batch sentiment analysis error, analyzing the comments one by one: {str(e)}")
+
+        missing = [i for i in range(len(comments)) if i not in results]
+        missing_results = await asyncio.gather(*[self.analyze_async(comments[i], client, semaphore) for i in missing])
+        for i, result in zip(missing, missing_results):
+            results[i] = result
+
+        return [results[i] for i in range(len(comments))]
+
+    def advanced_sentiment_analysis(self, comment: str) -> Dict:
+        """
+        Perform advanced sentiment analysis using GPT-4 Omni.
+
+        Args:
+            comment (str): The text comment to analyze
+
+        Returns:
+            Dict: Structured sentiment analysis result
+        """
+        return self.executor.analyze_texts(self.analyze_batch_async, [comment], 1, self.PROMPT_VERSION)[0]
+
     def batch_sentiment_analysis(
-        self, 
-        df: pd.DataFrame, 
-        comment_column: str, 
-        batch_size: int = 10, 
-        delay_range: tuple = (1, 3)
+        self,
+        df: pd.DataFrame,
+        comment_column: str,
+        items_per_request: int = 1
     ) -> pd.DataFrame:
         """
-        Perform batch sentiment analysis with rate limiting and error handling.
-        
+        Perform sentiment analysis on all the comments concurrently, within the rate limits of the executor.
+
         Args:
             df (pd.DataFrame): Input DataFrame
             comment_column (str): Name of the column containing comments
-            batch_size (int): Number of comments to process in each batch
-            delay_range (tuple): Range of random delay between batches (min, max)
-        
+            items_per_request (int): Number of comments analyzed in each request
+
         Returns:
             pd.DataFrame: DataFrame with added sentiment analysis columns
         """
         # Create a copy of the DataFrame to avoid modifying the original
         result_df = df.copy()
-        
+
         # Prepare columns for sentiment analysis results
         result_df['Sentiment'] = 'Neutral'
         result_df['Confidence_Score'] = 0.5
         result_df['Key_Emotions'] = None
         result_df['Reasoning'] = ''
-        
-        # Process comments in batches
-        for i in range(0, len(result_df), batch_size):
+
+        # Skip processing for non-string or empty comments
+        comments = [(idx, comment) for idx, comment in result_df[comment_column].items() if isinstance(comment, str) and comment.strip()]
+
+        # Perform sentiment analysis for all the comments at once
+        results = self.executor.analyze_texts(
+            self.analyze_batch_async,
+            [comment for _, comment in comments],
+            items_per_request,
+            self.PROMPT_VERSION,
+            build_request=self.build_request,
+            parse_response=self.parse_response
+        )
+
+        for (idx, _), result in zip(comments, results):
             try:
-                # Select batch of comments
-                batch = result_df.iloc[i:i+batch_size]
-                
-                # Perform sentiment analysis for each comment in the batch
-                for idx, row in batch.iterrows():
-                    try:
-                        comment = row[comment_column]
-                        
-                        # Skip processing for non-string or empty comments
-                        if not isinstance(comment, str) or not comment.strip():
-                            continue
-                        
-                        # Perform sentiment analysis
-                        result = self.advanced_sentiment_analysis(comment)
-                        
-                        # Update DataFrame with results
-                        result_df.at[idx, 'Sentiment'] = result['sentiment']
-                        result_df.at[idx, 'Confidence_Score'] = result['confidence_score']
-                        result_df.at[idx, 'Key_Emotions'] = ', '.join(result['key_emotions'])
-                        result_df.at[idx, 'Reasoning'] = result['reasoning']
-                    
-                    except Exception as comment_error:
-                        # Log individual comment processing errors
-                        result_df.at[idx, 'Reasoning'] = f"Individual comment analysis error: {str(comment_error)}"
-                
-                # Random delay between batches to avoid rate limiting
-                delay = random.uniform(delay_range[0], delay_range[1])
-                time.sleep(delay)
-            
-            except Exception as batch_error:
-                print(f"Batch processing error at index {i}: {str(batch_error)}")
-        
+                # Update DataFrame with results
+                result_df.at[idx, 'Sentiment'] = result['sentiment']
+                result_df.at[idx, 'Confidence_Score'] = result['confidence_score']
+                result_df.at[idx, 'Key_Emotions'] = ', '.join(result['key_emotions'])
+                result_df.at[idx, 'Reasoning'] = result['reasoning']
+
+            except Exception as comment_error:
+                # Log individual comment processing errors
+                result_df.at[idx, 'Reasoning'] = f"Individual comment analysis error: {str(comment_error)}"
+
         return result_df
-    
+
 
 if __name__ == "__main__":
     print("This is a module and cannot be run directly. Please import it and use the methods directly.")
@@ -7,6 +7,11 @@ from sqlalchemy import create_engine
 import post_message_categorization as pmc
 import comment_sentiment as cs
 import comment_message_categorization as cmt
+import comment_analysis as ca
+import graph_api_fetcher as gaf
+import llm_executor as le
+import llm_cache as lc
+import llm_batch as lb
 import ast
 import os
 from dotenv import load_dotenv
@@ -21,6 +26,31 @@ database = os.getenv('database')
 META_TOKEN = os.getenv('META_TOKEN')
 API_KEY = os.getenv('API_KEY')
 
+# Maximum number of Graph API requests sent concurrently
+GRAPH_MAX_WORKERS = int(os.getenv('GRAPH_MAX_WORKERS', 8))
+
+# Pack up to GRAPH_BATCH_SIZE Graph API calls into each batch request
+GRAPH_BATCH_MODE = os.getenv('GRAPH_BATCH_MODE', 'true').lower() == 'true'
+GRAPH_BATCH_SIZE = int(os.getenv('GRAPH_BATCH_SIZE', 50))
+
+# OpenAI limits of the account, shared by the post and comment analyzers
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 200000))
+
+# Number of posts or comments analyzed in each OpenAI request, 1 to analyze them one by one
+LLM_ITEMS_PER_REQUEST = int(os.getenv('LLM_ITEMS_PER_REQUEST', 20))
+
+# Assess the sentiment of the comments and categorize them in a single request, false to run two passes
+LLM_FUSED_ANALYSIS = os.getenv('LLM_FUSED_ANALYSIS', 'true').lower() == 'true'
+
+# Persistent cache of the analysis results, empty to analyze every text
+LLM_CACHE_DATABASE = os.getenv('LLM_CACHE_DATABASE', 'llm_cache.db')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 100000))
+
+# Run the analyses as offline OpenAI batch jobs, i.e. for nightly backfills where cost matters more than latency
+LLM_BATCH_JOB_MODE = os.getenv('LLM_BATCH_JOB_MODE', 'false').lower() == 'true'
+
 # Establish the database connection
 conn_str = (f'Driver={{ODBC Driver 17 for SQL Server}};Server={server};Database={database};UID={username};PWD={password}')
 conn = pyodbc.connect(conn_str)
@@ -29,6 +59,11 @@ cursor = conn.cursor()
 # Create SQLAlchemy engine to connect to SQL Server
 engine = create_engine('mssql+pyodbc:///?odbc_connect={}'.format(conn_str))
 
+# Run the OpenAI requests concurrently within the rate limits, skipping the texts analyzed before
+llm_cache = lc.AnalysisCache(LLM_CACHE_DATABASE, max_entries=LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_DATABASE else None
+llm_batch_runner = lb.BatchJobRunner(api_key=API_KEY) if LLM_BATCH_JOB_MODE else None
+llm = le.LlmExecutor(api_key=API_KEY, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE, cache=llm_cache, batch_runner=llm_batch_runner)
+
 FACEBOOK_ACCOUNT_ID = "466901410034470"
 
 # Execute the query
@@ -56,46 +91,30 @@ def fetch_page(url):
     print("Process completed...")
     return data
 
-# Function to get post Ids
-def get_ids(query):
-    # Execute the query
-    post_id_tuples = cursor.execute(query)
-
-    # Convert the result into a list of strings
-    post_id = [row[0] for row in post_id_tuples]
-    return post_id
-
-# Function to get post insights
-def get_post_insights(post_id, access_token):
-    insights_url = f"https://graph.facebook.com/v20.0/{post_id}/insights"
-    params = {
-        "metric": "post_impressions,post_impressions_unique",
-        "access_token": access_token
-    }
-
-    try:
-        # Fetch insights data
-        response = requests.get(insights_url, params=params)
-        response.raise_for_status()
-        insights_data = response.json().get("data", [])
-        
-        # Process data into a DataFrame
-        insights_list = []
-        for insight in insights_data:
-            insight_name = insight.get("name")
-            for value_item in insight.get("values", []):
-                insights_list.append({
-                    "InsightName": insight_name,
-                    "InsightValue": value_item.get("value")
-                })
-        
-        # Convert to DataFrame
-        insights_df = pd.DataFrame(insights_list)
-        return insights_df
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching insights: {e}")
-        return pd.DataFrame()
+# Function to flag the ids which are already saved in the database
+def get_exists_flags(ids, table, id_column, page_id):
+    fetched_ids = ids.dropna().astype(str).unique().tolist()
+    existing_ids = set()
+
+    if fetched_ids:
+        # Load the fetched ids into a temp table and let the server match them against the table, so only the matches are returned
+        dedup_cursor = conn.cursor()
+        dedup_cursor.execute("IF OBJECT_ID('tempdb..#fetched_ids') IS NOT NULL DROP TABLE #fetched_ids")
+        # Match the VARCHAR id columns created by to_sql, in the collation of the database rather than the one of tempdb,
+        # so that the join compares the ids as they are without an implicit conversion of the table column
+        dedup_cursor.execute("CREATE TABLE #fetched_ids ([id] VARCHAR(450) COLLATE DATABASE_DEFAULT NOT NULL PRIMARY KEY)")
+        dedup_cursor.fast_executemany = True
+        dedup_cursor.setinputsizes([(pyodbc.SQL_VARCHAR, 450, 0)])
+        dedup_cursor.executemany("INSERT INTO #fetched_ids ([id]) VALUES (?)", [(fetched_id,) for fetched_id in fetched_ids])
+
+        existing_tuples = dedup_cursor.execute(f"SELECT f.[id] FROM #fetched_ids f WHERE EXISTS (SELECT 1 FROM [dbo].[{table}] t WHERE t.[{id_column}] = f.[id] AND t.[Page_ID] = {page_id})")
+        existing_ids = {row[0] for row in existing_tuples}
+
+        dedup_cursor.execute("DROP TABLE #fetched_ids")
+        dedup_cursor.close()
+
+    # Flag each row on its own
+    return ids.astype(str).isin(existing_ids).astype(int)
 
 # Retrieve all posts
 print("Retrieving posts...")
@@ -109,37 +128,23 @@ posts_df = pd.json_normalize(posts_data)
 posts_df = posts_df.loc[:, ['message', 'created_time', 'likes.summary.total_count', 'permalink_url', 'id', 'comments.data', 'comments.summary.total_count']]
 # posts_df.rename(columns={"likes.summary.total_count": "likes_summary_total_count","comments.data": "comments_data","comments.summary.total_count": "comments_summary_total_count"}, inplace=True)
 posts_df.rename(columns={"message": "post_message","created_time": "post_created_time","likes.summary.total_count": "post_like_count","permalink_url": "post_url","id": "post_id","comments.data": "comments_data","comments.summary.total_count": "comments_summary_total_count"}, inplace=True)
-posts_df['exists'] = 0
-
-# Get post Ids from the database
-post_id = get_ids(f"SELECT [post_id] FROM [dbo].[tbl_facebook_posts] WHERE [Page_ID] = {FACEBOOK_ACCOUNT_ID}")
 
-# Check if the post exists
-for index, row in posts_df.iterrows():
-     if row.post_id in post_id:
-          posts_df['exists'] = 1
-     else:
-          continue
+# Check which posts are already saved in the database
+posts_df['exists'] = get_exists_flags(posts_df['post_id'], "tbl_facebook_posts", "post_id", FACEBOOK_ACCOUNT_ID)
      
 # Categorize posts
 print("Starting post categorization...")
-categorizer = pmc.ContentCategorizer(api_key=API_KEY)
-categorized_df = categorizer.batch_categorization(posts_df[posts_df['exists'] == 0],post_column = "post_message")
+categorizer = pmc.ContentCategorizer(executor=llm)
+categorized_df = categorizer.batch_categorization(posts_df[posts_df['exists'] == 0],post_column = "post_message", items_per_request=LLM_ITEMS_PER_REQUEST)
 print("Post categorization completed...")
 
 # Get post insights
 print("Getting post insights...")
-categorized_df['post_impressions'] = ''
-categorized_df['post_impressions_unique'] = ''
-for index, row in categorized_df[categorized_df['exists'] == 0].iterrows():
-     if row.post_id in post_id:
-         continue
-        #   posts_df['exists'] = 1
-     else:
-        insights_df = get_post_insights(row.post_id, META_TOKEN)
-        transformed_df = insights_df.pivot(columns="InsightName", values="InsightValue")
-        categorized_df.loc[categorized_df['post_id'] == row.post_id, 'post_impressions'] = transformed_df[["post_impressions", "post_impressions_unique"]].max().to_frame().T['post_impressions'][0]
-        categorized_df.loc[categorized_df['post_id'] == row.post_id, 'post_impressions_unique'] = transformed_df[["post_impressions", "post_impressions_unique"]].max().to_frame().T['post_impressions_unique'][0]
+fetcher = gaf.GraphApiFetcher(META_TOKEN, max_workers=GRAPH_MAX_WORKERS, use_batch=GRAPH_BATCH_MODE, batch_size=GRAPH_BATCH_SIZE)
+insights_df = fetcher.fetch_insights(categorized_df.loc[categorized_df['exists'] == 0, 'post_id'], "post_impressions,post_impressions_unique")
+post_insights = gaf.GraphApiFetcher.pivot_insights(insights_df, "InsightName").reindex(columns=["post_impressions", "post_impressions_unique"])
+categorized_df['post_impressions'] = categorized_df['post_id'].map(post_insights['post_impressions']).fillna('')
+categorized_df['post_impressions_unique'] = categorized_df['post_id'].map(post_insights['post_impressions_unique']).fillna('')
 print("Post insights retrieved...")
 
 # Save to database
@@ -163,41 +168,39 @@ df_comments = categorized_df.loc[:, ['post_id','comments_data','Page_ID']]
 df_comments = df_comments[(df_comments['comments_data'] != '[]') & (df_comments['comments_data'] != '')]
 # df_comments['comments_data'] = df_comments['comments_data'].apply(ast.literal_eval)
 
-# Flatten the JSON objects
-df_comments_flattened = pd.DataFrame(columns=['post_id', 'Page_ID', 'created_time', 'message', 'id'])
-for index, row in df_comments.iterrows():
-    df8 = pd.DataFrame(row.comments_data)
-    df8['post_id'] = row.post_id
-    df8['Page_ID'] = row.Page_ID
-    df_comments_flattened = pd.concat([df_comments_flattened, df8],ignore_index=True)
+# Flatten the JSON objects of all the posts in one pass
+comment_records = df_comments[df_comments['comments_data'].apply(lambda comments_data: isinstance(comments_data, list))].to_dict('records')
+df_comments_flattened = pd.json_normalize(comment_records, record_path='comments_data', meta=['post_id', 'Page_ID']).reindex(columns=['post_id', 'Page_ID', 'created_time', 'message', 'id'])
 
 # Clean
 df_comments_flattened.rename(columns={"created_time": "comments_created_time","message": "comments_message","id": "comments_id"}, inplace=True)
 df_comments_flattened = df_comments_flattened[['comments_created_time', 'comments_message', 'comments_id', 'post_id','Page_ID']]
 df_comments_flattened = df_comments_flattened[df_comments_flattened['comments_message'] != '']
 
-# Get comment Ids
-Comment_id = get_ids(f"SELECT [comments_id] FROM [dbo].[tbl_facebook_comments] WHERE [Page_ID] = {FACEBOOK_ACCOUNT_ID}")
-
-# Check if the comment exists
-df_comments_flattened['exists'] = 0
-for index, row in df_comments_flattened.iterrows():
-     if row.comments_id in Comment_id:
-          df_comments_flattened['exists'] = 1
-     else:
-          continue
+# Check which comments are already saved in the database
+df_comments_flattened['exists'] = get_exists_flags(df_comments_flattened['comments_id'], "tbl_facebook_comments", "comments_id", FACEBOOK_ACCOUNT_ID)
      
-# Perform batch sentiment analysis
-print("Performing sentiment analysis...")
-analyzer = cs.SentimentAnalyzer(api_key=API_KEY)
-processed_df = analyzer.batch_sentiment_analysis(df_comments_flattened[df_comments_flattened['exists'] == 0], comment_column='comments_message')
-print("Sentiment analysis completed...")
-
-# Categorize comments
-print("Starting comment categorization...")
-categorizer = cmt.ContentCategorizer(api_key=API_KEY)
-processed_df = categorizer.batch_categorization(processed_df[processed_df['exists'] == 0],comment_column = "comments_message")
-print("comment categorization completed...")
+if LLM_FUSED_ANALYSIS:
+    # Perform sentiment analysis and categorization together
+    print("Performing comment analysis...")
+    analyzer = ca.CommentAnalyzer(executor=llm)
+    processed_df = analyzer.batch_analysis(df_comments_flattened[df_comments_flattened['exists'] == 0], comment_column='comments_message', items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("Comment analysis completed...")
+else:
+    # Perform batch sentiment analysis
+    print("Performing sentiment analysis...")
+    analyzer = cs.SentimentAnalyzer(executor=llm)
+    processed_df = analyzer.batch_sentiment_analysis(df_comments_flattened[df_comments_flattened['exists'] == 0], comment_column='comments_message', items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("Sentiment analysis completed...")
+
+    # Categorize comments
+    print("Starting comment categorization...")
+    categorizer = cmt.ContentCategorizer(executor=llm)
+    processed_df = categorizer.batch_categorization(processed_df[processed_df['exists'] == 0],comment_column = "comments_message", items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("comment categorization completed...")
+
+if llm_cache is not None:
+    print(f"Analysis cache: {llm_cache.stats()}")
 
 
 # Save to database
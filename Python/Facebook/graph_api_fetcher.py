@@ -0,0 +1,257 @@
+import requests
+import pandas as pd
+import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, List, Optional
+
+
+class GraphApiFetcher:
+    # Maximum number of requests the Graph API accepts in a single batch request
+    MAX_BATCH_SIZE = 50
+
+    def __init__(
+        self,
+        access_token: str,
+        api_version: str = "v20.0",
+        max_workers: int = 8,
+        timeout: float = 30,
+        use_batch: bool = False,
+        batch_size: int = 50
+    ):
+        """
+        Initialize the Graph API fetcher with a pooled HTTP session.
+
+        Args:
+            access_token (str): Meta access token
+            api_version (str): Graph API version
+            max_workers (int): Maximum number of requests sent concurrently
+            timeout (float): Number of seconds to wait for each response
+            use_batch (bool): Pack the calls into Graph API batch requests
+            batch_size (int): Number of calls per batch request, at most 50
+        """
+        self.access_token = access_token
+        self.graph_url = "https://graph.facebook.com"
+        self.api_version = api_version
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.use_batch = use_batch
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+
+        # Keep one connection per worker open across requests
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+    def get(self, relative_url: str) -> Optional[Dict]:
+        """
+        Fetch a single Graph API path.
+
+        Args:
+            relative_url (str): Path relative to the Graph API host, including the version and query
+
+        Returns:
+            Optional[Dict]: Response body, None if the request failed
+        """
+        try:
+            response = self.session.get(f"{self.graph_url}/{relative_url}", params={"access_token": self.access_token}, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching {relative_url}: {e}")
+            return None
+
+    def execute_batch(self, relative_urls: List[str]) -> List[Optional[Dict]]:
+        """
+        Fetch many Graph API paths in a single batch request.
+
+        A batch which times out or fails with a server error is split in halves and retried, a batch rejected with a client
+        error is reported and skipped as a whole, items which the batch did not complete are retried in a smaller batch and
+        items which failed on their own are reported and skipped.
+
+        Args:
+            relative_urls (List[str]): Paths relative to the Graph API host, including the version and query
+
+        Returns:
+            List[Optional[Dict]]: Response body of each path, None for the paths which failed
+        """
+        batch = [{"method": "GET", "relative_url": relative_url} for relative_url in relative_urls]
+
+        try:
+            response = self.session.post(
+                self.graph_url,
+                data={"access_token": self.access_token, "batch": json.dumps(batch), "include_headers": "false"},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            items = response.json()
+
+            if not isinstance(items, list) or len(items) != len(relative_urls):
+                raise ValueError("Unexpected batch response")
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Only a timeout or a server error can be caused by the size of the batch. Client errors, i.e. an expired token
+            # (OAuth code 190) or throttling (codes 4, 17, 32 and 613), would fail every half again and use up more of the rate limit.
+            status_code = e.response.status_code if isinstance(e, requests.exceptions.HTTPError) and e.response is not None else None
+            splittable = isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)) or (status_code is not None and status_code >= 500)
+
+            if len(relative_urls) == 1 or not splittable:
+                print(f"Error fetching a batch of {len(relative_urls)} paths starting with {relative_urls[0]}: {e} {self.get_error_details(e)}")
+                return [None] * len(relative_urls)
+
+            # Split the failed batch in halves and retry each of them
+            middle = len(relative_urls) // 2
+            return self.execute_batch(relative_urls[:middle]) + self.execute_batch(relative_urls[middle:])
+
+        results = []
+        incomplete_indexes = []
+        for index, item in enumerate(items):
+            # Items the batch did not complete in time are returned as null
+            if item is None:
+                incomplete_indexes.append(index)
+                results.append(None)
+                continue
+
+            try:
+                body = json.loads(item.get("body") or "{}")
+            except ValueError:
+                body = {}
+
+            if item.get("code") == 200:
+                results.append(body)
+            else:
+                error = body.get("error", {}) if isinstance(body, dict) else {}
+                print(f"Error fetching {relative_urls[index]}: {item.get('code')} {error.get('message', '')}")
+                results.append(None)
+
+        if incomplete_indexes:
+            if len(incomplete_indexes) == len(relative_urls):
+                if len(relative_urls) == 1:
+                    print(f"Error fetching {relative_urls[0]}: request was not completed")
+                    return [None]
+
+                middle = len(relative_urls) // 2
+                return self.execute_batch(relative_urls[:middle]) + self.execute_batch(relative_urls[middle:])
+
+            retried = self.execute_batch([relative_urls[index] for index in incomplete_indexes])
+            for index, body in zip(incomplete_indexes, retried):
+                results[index] = body
+
+        return results
+
+    @staticmethod
+    def get_error_details(error: Exception) -> str:
+        """
+        Get the Graph API error code and message of a failed request.
+
+        Args:
+            error (Exception): Error raised by the request
+
+        Returns:
+            str: Error code and message, empty if the response holds no Graph API error
+        """
+        response = getattr(error, "response", None)
+        try:
+            graph_error = response.json().get("error", {})
+        except (AttributeError, ValueError):
+            return ""
+
+        return f"(code {graph_error.get('code')}: {graph_error.get('message', '')})" if graph_error else ""
+
+    def fetch_all(self, relative_urls: List[str]) -> List[Optional[Dict]]:
+        """
+        Fetch many Graph API paths concurrently, packed into batch requests in batch mode.
+
+        Args:
+            relative_urls (List[str]): Paths relative to the Graph API host, including the version and query
+
+        Returns:
+            List[Optional[Dict]]: Response body of each path in order, None for the paths which failed
+        """
+        # Bound the number of requests in flight, results come back in the order of the paths
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if not self.use_batch:
+                return list(executor.map(self.get, relative_urls))
+
+            chunks = [relative_urls[i:i + self.batch_size] for i in range(0, len(relative_urls), self.batch_size)]
+            return [body for chunk_results in executor.map(self.execute_batch, chunks) for body in chunk_results]
+
+    def flatten_insights(self, post_id: str, insights_data: List[Dict]) -> List[Dict]:
+        """
+        Flatten the insights returned for a post into records.
+
+        Args:
+            post_id (str): Post or media ID
+            insights_data (List[Dict]): "data" of the insights response
+
+        Returns:
+            List[Dict]: One record per insight value
+        """
+        insights_list = []
+        for insight in insights_data:
+            for value_item in insight.get("values", []):
+                insights_list.append({
+                    "post_id": post_id,
+                    "InsightName": insight.get("name"),
+                    "InsightTitle": insight.get("title"),
+                    "InsightValue": value_item.get("value")
+                })
+
+        return insights_list
+
+    def fetch_insights(self, post_ids: Iterable[str], metrics: str) -> pd.DataFrame:
+        """
+        Fetch the insights of many posts concurrently.
+
+        Args:
+            post_ids (Iterable[str]): Post or media IDs
+            metrics (str): Comma separated insight metrics
+
+        Returns:
+            pd.DataFrame: Tidy DataFrame with post_id, InsightName, InsightTitle and InsightValue columns
+        """
+        post_ids = list(dict.fromkeys(post_ids))
+        bodies = self.fetch_all([f"{self.api_version}/{post_id}/insights?metric={metrics}" for post_id in post_ids])
+
+        records = []
+        for post_id, body in zip(post_ids, bodies):
+            if body is not None:
+                records.extend(self.flatten_insights(post_id, body.get("data", [])))
+
+        # Build the frame once from all the records
+        return pd.DataFrame.from_records(records, columns=["post_id", "InsightName", "InsightTitle", "InsightValue"])
+
+    def fetch_comments(self, post_ids: Iterable[str], fields: str) -> Dict[str, List[Dict]]:
+        """
+        Fetch the comments of many posts concurrently.
+
+        Args:
+            post_ids (Iterable[str]): Post or media IDs
+            fields (str): Comma separated comment fields
+
+        Returns:
+            Dict[str, List[Dict]]: Comments keyed by post ID, empty for the posts whose request failed
+        """
+        post_ids = list(dict.fromkeys(post_ids))
+        bodies = self.fetch_all([f"{self.api_version}/{post_id}/comments?fields={fields}" for post_id in post_ids])
+
+        return {post_id: (body or {}).get("data", []) for post_id, body in zip(post_ids, bodies)}
+
+    @staticmethod
+    def pivot_insights(insights_df: pd.DataFrame, column: str = "InsightName") -> pd.DataFrame:
+        """
+        Pivot tidy insights into one row per post, keeping the highest value of each insight.
+
+        Args:
+            insights_df (pd.DataFrame): Insights returned by fetch_insights
+            column (str): Column naming the insights, InsightName or InsightTitle
+
+        Returns:
+            pd.DataFrame: DataFrame indexed by post_id with one column per insight
+        """
+        # Keep the values as objects, so that counts stay integers when some posts have no insights
+        return insights_df.groupby(["post_id", column])["InsightValue"].max().astype(object).unstack()
+
+
+if __name__ == "__main__":
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
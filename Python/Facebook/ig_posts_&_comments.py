@@ -7,6 +7,11 @@ from sqlalchemy import create_engine
 import post_message_categorization as pmc
 import comment_sentiment as cs
 import comment_message_categorization as cmt
+import comment_analysis as ca
+import graph_api_fetcher as gaf
+import llm_executor as le
+import llm_cache as lc
+import llm_batch as lb
 import ast
 import os
 from dotenv import load_dotenv
@@ -21,6 +26,31 @@ database = os.getenv('database')
 META_TOKEN = os.getenv('META_TOKEN')
 API_KEY = os.getenv('API_KEY')
 
+# Maximum number of Graph API requests sent concurrently
+GRAPH_MAX_WORKERS = int(os.getenv('GRAPH_MAX_WORKERS', 8))
+
+# Pack up to GRAPH_BATCH_SIZE Graph API calls into each batch request
+GRAPH_BATCH_MODE = os.getenv('GRAPH_BATCH_MODE', 'true').lower() == 'true'
+GRAPH_BATCH_SIZE = int(os.getenv('GRAPH_BATCH_SIZE', 50))
+
+# OpenAI limits of the account, shared by the post and comment analyzers
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 200000))
+
+# Number of posts or comments analyzed in each OpenAI request, 1 to analyze them one by one
+LLM_ITEMS_PER_REQUEST = int(os.getenv('LLM_ITEMS_PER_REQUEST', 20))
+
+# Assess the sentiment of the comments and categorize them in a single request, false to run two passes
+LLM_FUSED_ANALYSIS = os.getenv('LLM_FUSED_ANALYSIS', 'true').lower() == 'true'
+
+# Persistent cache of the analysis results, empty to analyze every text
+LLM_CACHE_DATABASE = os.getenv('LLM_CACHE_DATABASE', 'llm_cache.db')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 100000))
+
+# Run the analyses as offline OpenAI batch jobs, i.e. for nightly backfills where cost matters more than latency
+LLM_BATCH_JOB_MODE = os.getenv('LLM_BATCH_JOB_MODE', 'false').lower() == 'true'
+
 INSTAGRAM_ACCOUNT_ID = "17841402337256516"
 
 
@@ -32,6 +62,11 @@ cursor = conn.cursor()
 # Create SQLAlchemy engine to connect to SQL Server
 engine = create_engine('mssql+pyodbc:///?odbc_connect={}'.format(conn_str))
 
+# Run the OpenAI requests concurrently within the rate limits, skipping the texts analyzed before
+llm_cache = lc.AnalysisCache(LLM_CACHE_DATABASE, max_entries=LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_DATABASE else None
+llm_batch_runner = lb.BatchJobRunner(api_key=API_KEY) if LLM_BATCH_JOB_MODE else None
+llm = le.LlmExecutor(api_key=API_KEY, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE, cache=llm_cache, batch_runner=llm_batch_runner)
+
 
 # Base URL for posts
 BASE_POSTS_URL = f"https://graph.facebook.com/v20.0/{INSTAGRAM_ACCOUNT_ID}/media?fields=caption,like_count,comments_count,permalink,timestamp&access_token={META_TOKEN}"
@@ -46,44 +81,30 @@ def fetch_page(url):
         url = response.get("paging", {}).get("next")
     return data
 
-# Function to get post Ids
-def get_ids(query):
-    # Execute the query
-    post_id_tuples = cursor.execute(query)
-
-    # Convert the result into a list of strings
-    post_id = [row[0] for row in post_id_tuples]
-    return post_id
-
-# Function to get post insights
-def get_post_insights(post_id, meta_token):
-    insights_url = f"https://graph.facebook.com/v20.0/{post_id}/insights?metric=impressions,reach,saved&access_token={meta_token}"
-    response = requests.get(insights_url)
-    response.raise_for_status()
-    insights_data = response.json().get("data", [])
-
-    insights_list = []
-    for insight in insights_data:
-        insight_title = insight.get("title")
-        for value in insight.get("values", []):
-            insights_list.append({
-                "InsightTitle": insight_title,
-                "InsightValue": value.get("value")
-            })
-
-    insights_df = pd.DataFrame(insights_list)
-    return insights_df
-
-# Function to get comments
-def get_comments(post_id,META_TOKEN):
-    comments_url = f"https://graph.facebook.com/v20.0/{post_id}/comments?fields=text,like_count,timestamp&access_token={META_TOKEN}"
-    try:
-        response = requests.get(comments_url)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-    except requests.exceptions.RequestException:
-        data = []
-    return data
+# Function to flag the ids which are already saved in the database
+def get_exists_flags(ids, table, id_column, page_id):
+    fetched_ids = ids.dropna().astype(str).unique().tolist()
+    existing_ids = set()
+
+    if fetched_ids:
+        # Load the fetched ids into a temp table and let the server match them against the table, so only the matches are returned
+        dedup_cursor = conn.cursor()
+        dedup_cursor.execute("IF OBJECT_ID('tempdb..#fetched_ids') IS NOT NULL DROP TABLE #fetched_ids")
+        # Match the VARCHAR id columns created by to_sql, in the collation of the database rather than the one of tempdb,
+        # so that the join compares the ids as they are without an implicit conversion of the table column
+        dedup_cursor.execute("CREATE TABLE #fetched_ids ([id] VARCHAR(450) COLLATE DATABASE_DEFAULT NOT NULL PRIMARY KEY)")
+        dedup_cursor.fast_executemany = True
+        dedup_cursor.setinputsizes([(pyodbc.SQL_VARCHAR, 450, 0)])
+        dedup_cursor.executemany("INSERT INTO #fetched_ids ([id]) VALUES (?)", [(fetched_id,) for fetched_id in fetched_ids])
+
+        existing_tuples = dedup_cursor.execute(f"SELECT f.[id] FROM #fetched_ids f WHERE EXISTS (SELECT 1 FROM [dbo].[{table}] t WHERE t.[{id_column}] = f.[id] AND t.[Page_ID] = {page_id})")
+        existing_ids = {row[0] for row in existing_tuples}
+
+        dedup_cursor.execute("DROP TABLE #fetched_ids")
+        dedup_cursor.close()
+
+    # Flag each row on its own
+    return ids.astype(str).isin(existing_ids).astype(int)
 
 # Retrieve all posts
 print("Retrieving posts...")
@@ -97,38 +118,27 @@ posts_df = pd.json_normalize(posts_data)
 # Select relevant columns
 posts_df = posts_df.loc[:, ['id', 'caption', 'like_count', 'comments_count', 'permalink', 'timestamp']]
 posts_df.rename(columns={"id": "post_id","caption": "post_message","like_count": "post_like_count","permalink": "post_url","timestamp": "post_created_time"}, inplace=True)
-posts_df['exists'] = 0
-
 
-# Get post Ids from the database
-post_id = get_ids(f"SELECT [post_id] FROM [dbo].[tbl_instagram_posts] WHERE [Page_ID] = {INSTAGRAM_ACCOUNT_ID}")
 
-# Check if the post exists
-for index, row in posts_df.iterrows():
-     if row.post_id in post_id:
-          posts_df['exists'] = 1
-     else:
-          continue
+# Check which posts are already saved in the database
+posts_df['exists'] = get_exists_flags(posts_df['post_id'], "tbl_instagram_posts", "post_id", INSTAGRAM_ACCOUNT_ID)
      
 
 
 # Categorize posts
 print("Starting post categorization...")
-categorizer = pmc.ContentCategorizer(api_key=API_KEY)
-categorized_df = categorizer.batch_categorization(posts_df[posts_df['exists'] == 0],post_column = "post_message")
+categorizer = pmc.ContentCategorizer(executor=llm)
+categorized_df = categorizer.batch_categorization(posts_df[posts_df['exists'] == 0],post_column = "post_message", items_per_request=LLM_ITEMS_PER_REQUEST)
 print("Post categorization completed...")
 
 # Get post insights
 print("Getting post insights...")
-for index, row in categorized_df[categorized_df['exists'] == 0].iterrows():
-     try:
-          insights_df = get_post_insights(row.post_id, META_TOKEN)
-     except requests.exceptions.HTTPError:
-          continue
-     transformed_df = insights_df.pivot(columns="InsightTitle", values="InsightValue")
-     categorized_df.loc[categorized_df['post_id'] == row.post_id, 'post_impressions'] = transformed_df[["Impressions", "Accounts reached", "Saved"]].max().to_frame().T['Impressions'][0]
-     categorized_df.loc[categorized_df['post_id'] == row.post_id, 'post_reach'] = transformed_df[["Impressions", "Accounts reached", "Saved"]].max().to_frame().T['Accounts reached'][0]
-     categorized_df.loc[categorized_df['post_id'] == row.post_id, 'post_saved'] = transformed_df[["Impressions", "Accounts reached", "Saved"]].max().to_frame().T['Saved'][0]
+fetcher = gaf.GraphApiFetcher(META_TOKEN, max_workers=GRAPH_MAX_WORKERS, use_batch=GRAPH_BATCH_MODE, batch_size=GRAPH_BATCH_SIZE)
+insights_df = fetcher.fetch_insights(categorized_df.loc[categorized_df['exists'] == 0, 'post_id'], "impressions,reach,saved")
+post_insights = gaf.GraphApiFetcher.pivot_insights(insights_df, "InsightTitle").reindex(columns=["Impressions", "Accounts reached", "Saved"])
+categorized_df['post_impressions'] = categorized_df['post_id'].map(post_insights['Impressions'])
+categorized_df['post_reach'] = categorized_df['post_id'].map(post_insights['Accounts reached'])
+categorized_df['post_saved'] = categorized_df['post_id'].map(post_insights['Saved'])
 print("Post insights retrieved...")
 
 categorized_df['Page_ID'] = INSTAGRAM_ACCOUNT_ID
@@ -149,40 +159,40 @@ print("Saved posts to database...")
 # Get comments
 df3 = categorized_df[['post_id','Page_ID']][categorized_df['comments_count']>0]
 
-df_comments = pd.DataFrame(columns=['post_id','text','like_count','timestamp','id','Page_ID'])
-for index, row in df3.iterrows():
-    comnts = pd.DataFrame(get_comments(row.post_id,META_TOKEN))
-    comnts['post_id'] = row.post_id
-    comnts['Page_ID'] = row.Page_ID
-    df_comments = pd.concat([df_comments, comnts],ignore_index=True)
+comments = fetcher.fetch_comments(df3['post_id'], "text,like_count,timestamp")
 
-df_comments.rename(columns={"text": "comments_message","timestamp":"comments_created_time","id":"comments_id"},inplace=True)
+# Collect the comments of all the posts and build the frame once
+comment_records = [dict(comment, post_id=row.post_id, Page_ID=row.Page_ID) for row in df3.itertuples() for comment in comments[row.post_id]]
+df_comments = pd.DataFrame.from_records(comment_records).reindex(columns=['post_id','text','like_count','timestamp','id','Page_ID'])
 
-# Get comment Ids
-Comment_id = get_ids(f"SELECT [comments_id] FROM [dbo].[tbl_instagram_comments] WHERE [Page_ID] = {INSTAGRAM_ACCOUNT_ID}")
+df_comments.rename(columns={"text": "comments_message","timestamp":"comments_created_time","id":"comments_id"},inplace=True)
 
 
-# Check if the comment exists
-df_comments['exists'] = 0
-for index, row in df_comments.iterrows():
-     if row.comments_id in Comment_id:
-          df_comments['exists'] = 1
-     else:
-          continue
+# Check which comments are already saved in the database
+df_comments['exists'] = get_exists_flags(df_comments['comments_id'], "tbl_instagram_comments", "comments_id", INSTAGRAM_ACCOUNT_ID)
 
 
-# Perform batch sentiment analysis
-print("Performing sentiment analysis...")
-analyzer = cs.SentimentAnalyzer(api_key=API_KEY)
-processed_df = analyzer.batch_sentiment_analysis(df_comments[df_comments['exists'] == 0], comment_column='comments_message')
-print("Sentiment analysis completed...")
+if LLM_FUSED_ANALYSIS:
+    # Perform sentiment analysis and categorization together
+    print("Performing comment analysis...")
+    analyzer = ca.CommentAnalyzer(executor=llm)
+    processed_df = analyzer.batch_analysis(df_comments[df_comments['exists'] == 0], comment_column='comments_message', items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("Comment analysis completed...")
+else:
+    # Perform batch sentiment analysis
+    print("Performing sentiment analysis...")
+    analyzer = cs.SentimentAnalyzer(executor=llm)
+    processed_df = analyzer.batch_sentiment_analysis(df_comments[df_comments['exists'] == 0], comment_column='comments_message', items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("Sentiment analysis completed...")
 
+    # Categorize comments
+    print("Starting comment categorization...")
+    categorizer = cmt.ContentCategorizer(executor=llm)
+    processed_df = categorizer.batch_categorization(processed_df[processed_df['exists'] == 0],comment_column = "comments_message", items_per_request=LLM_ITEMS_PER_REQUEST)
+    print("comment categorization completed...")
 
-# Categorize comments
-print("Starting comment categorization...")
-categorizer = cmt.ContentCategorizer(api_key=API_KEY)
-processed_df = categorizer.batch_categorization(processed_df[processed_df['exists'] == 0],comment_column = "comments_message")
-print("comment categorization completed...")
+if llm_cache is not None:
+    print(f"Analysis cache: {llm_cache.stats()}")
 
 
 # Save to database
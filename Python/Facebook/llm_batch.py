@@ -0,0 +1,244 @@
+import os
+import time
+import json
+import uuid
+from openai import OpenAI
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, Optional
+
+
+class BatchJobRunner:
+    # Statuses after which a batch no longer changes
+    TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+    # Maximum number of requests the Batch API accepts in a single batch
+    MAX_REQUESTS_PER_BATCH = 50000
+
+    def __init__(
+        self,
+        api_key: str = None,
+        client=None,
+        work_directory: str = "llm_batches",
+        completion_window: str = "24h",
+        poll_interval: float = 30,
+        max_poll_interval: float = 600
+    ):
+        """
+        Initialize the runner of offline chat completion jobs on the OpenAI Batch API.
+
+        Args:
+            api_key (str, optional): OpenAI API key. If None, reads from environment.
+            client (optional): Client with the files and batches endpoints, i.e. a LocalBatchClient. If None, an OpenAI client is created.
+            work_directory (str): Folder the JSONL request files are written to
+            completion_window (str): Time frame within which the batches should be processed
+            poll_interval (float): Number of seconds to wait before the first status check
+            max_poll_interval (float): Maximum number of seconds between status checks
+        """
+        self.client = client or OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
+        self.work_directory = work_directory
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+    def run(self, requests: Dict[str, Dict]) -> Dict[str, str]:
+        """
+        Run chat completions as batch jobs and wait for them to complete.
+
+        Args:
+            requests (Dict[str, Dict]): Chat completion parameters keyed by custom ID
+
+        Returns:
+            Dict[str, str]: Content of each completion keyed by custom ID, without the requests which failed
+        """
+        custom_ids = list(requests)
+        batch_ids = [
+            self.submit({custom_id: requests[custom_id] for custom_id in custom_ids[i:i + self.MAX_REQUESTS_PER_BATCH]})
+            for i in range(0, len(custom_ids), self.MAX_REQUESTS_PER_BATCH)
+        ]
+
+        contents = {}
+        for batch_id in batch_ids:
+            batch = self.wait(batch_id)
+            contents.update(self.read_contents(batch))
+
+        return contents
+
+    def submit(self, requests: Dict[str, Dict]) -> str:
+        """
+        Write the requests to a JSONL file, upload it and create a batch from it.
+
+        Args:
+            requests (Dict[str, Dict]): Chat completion parameters keyed by custom ID
+
+        Returns:
+            str: Batch ID
+        """
+        os.makedirs(self.work_directory, exist_ok=True)
+        path = os.path.join(self.work_directory, f"requests-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl")
+
+        with open(path, "w", encoding="utf-8") as requests_file:
+            for custom_id, body in requests.items():
+                requests_file.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}, ensure_ascii=False) + "\n")
+
+        with open(path, "rb") as requests_file:
+            input_file = self.client.files.create(file=requests_file, purpose="batch")
+
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window=self.completion_window)
+        print(f"Submitted batch {batch.id} with {len(requests)} requests from {path}")
+
+        return batch.id
+
+    def wait(self, batch_id: str):
+        """
+        Poll the status of a batch with backoff until it no longer changes.
+
+        Args:
+            batch_id (str): Batch ID
+
+        Returns:
+            Batch: Completed, failed, expired or cancelled batch
+        """
+        delay = self.poll_interval
+        batch = self.client.batches.retrieve(batch_id)
+
+        while batch.status not in self.TERMINAL_STATUSES:
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+            batch = self.client.batches.retrieve(batch_id)
+
+        print(f"Batch {batch_id} {batch.status}")
+        return batch
+
+    def read_contents(self, batch) -> Dict[str, str]:
+        """
+        Read the completions of a batch line by line. Expired and cancelled batches can still hold the completed part.
+
+        Args:
+            batch (Batch): Batch which no longer changes
+
+        Returns:
+            Dict[str, str]: Content of each completion keyed by custom ID, without the requests which failed
+        """
+        contents = {}
+        failed = 0
+
+        if batch.output_file_id:
+            for line in self.iter_lines(batch.output_file_id):
+                output = json.loads(line)
+                response = output.get("response") or {}
+
+                if response.get("status_code") == 200:
+                    contents[output["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+                else:
+                    failed += 1
+
+        if batch.error_file_id:
+            failed += sum(1 for _ in self.iter_lines(batch.error_file_id))
+
+        if failed:
+            print(f"Batch {batch.id}: {failed} requests failed")
+
+        return contents
+
+    def iter_lines(self, file_id: str) -> Iterable[str]:
+        """
+        Iterate over the non-empty lines of a batch file.
+
+        Args:
+            file_id (str): File ID
+
+        Returns:
+            Iterable[str]: Lines of the file
+        """
+        for line in self.client.files.content(file_id).iter_lines():
+            if line.strip():
+                yield line
+
+
+class LocalBatchClient:
+    def __init__(self, respond: Callable[[Dict], str]):
+        """
+        Initialize a local stand-in for the files and batches endpoints of the OpenAI client, i.e. to test the batch job mode
+        without an API key. A batch moves one status forward on each retrieval and its requests are answered locally once it runs.
+
+        Args:
+            respond (Callable[[Dict], str]): Function returning the completion content of the body of a request, raising an
+                exception to fail the request
+        """
+        self.respond = respond
+        self.stored_files = {}
+        self.stored_batches = {}
+
+        self.files = SimpleNamespace(create=self.create_file, content=self.get_file_content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+    def create_file(self, file, purpose: str):
+        file_id = f"file-{uuid.uuid4().hex}"
+        content = file.read()
+        self.stored_files[file_id] = content.decode("utf-8") if isinstance(content, bytes) else content
+
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def get_file_content(self, file_id: str):
+        text = self.stored_files[file_id]
+        return SimpleNamespace(text=text, iter_lines=lambda: iter(text.splitlines()))
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str, metadata: Optional[Dict] = None):
+        batch = SimpleNamespace(
+            id=f"batch-{uuid.uuid4().hex}",
+            status="validating",
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            output_file_id=None,
+            error_file_id=None
+        )
+        self.stored_batches[batch.id] = batch
+
+        return batch
+
+    def retrieve_batch(self, batch_id: str):
+        batch = self.stored_batches[batch_id]
+
+        if batch.status == "validating":
+            batch.status = "in_progress"
+        elif batch.status == "in_progress":
+            self.run_batch(batch)
+
+        return batch
+
+    def run_batch(self, batch):
+        outputs = []
+        errors = []
+
+        for line in self.stored_files[batch.input_file_id].splitlines():
+            request = json.loads(line)
+            try:
+                content = self.respond(request["body"])
+                outputs.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"model": request["body"].get("model"), "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+                    },
+                    "error": None
+                })
+            except Exception as e:
+                errors.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": None,
+                    "error": {"code": "local_error", "message": str(e)}
+                })
+
+        for attribute, lines in [("output_file_id", outputs), ("error_file_id", errors)]:
+            if lines:
+                file_id = f"file-{uuid.uuid4().hex}"
+                self.stored_files[file_id] = "".join(json.dumps(line) + "\n" for line in lines)
+                setattr(batch, attribute, file_id)
+
+        batch.status = "completed"
+
+
+if __name__ == "__main__":
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
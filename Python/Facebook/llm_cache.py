@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import unicodedata
+from contextlib import closing
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class AnalysisCache:
+    # SQLite limits the number of parameters of a statement
+    MAX_PARAMETERS = 900
+
+    def __init__(self, path: str = "llm_cache.db", max_entries: int = 100000):
+        """
+        Initialize the persistent cache of LLM analysis results, keyed by a hash of the normalized text and of the analysis settings.
+
+        Args:
+            path (str): Path of the SQLite database
+            max_entries (int): Maximum number of cached results, the least recently used results are evicted beyond it
+        """
+        self.path = path
+        self.max_entries = max_entries
+
+        # Statistics of this run
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with closing(self.connect()) as connection, connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    prompt_version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS analysis_cache_accessed_at ON analysis_cache (accessed_at);
+                CREATE INDEX IF NOT EXISTS analysis_cache_prompt_version ON analysis_cache (prompt_version);
+            """)
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        Normalize a text so that copies differing only in Unicode form, case or whitespace share a cache entry.
+
+        Args:
+            text (str): Text to normalize
+
+        Returns:
+            str: Normalized text
+        """
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+    @classmethod
+    def make_key(cls, text: str, model: str, prompt_version: str, categories: Optional[Dict] = None) -> str:
+        """
+        Get the cache key of an analysis.
+
+        Args:
+            text (str): Analyzed text
+            model (str): Chat completion model
+            prompt_version (str): Version of the prompt of the analysis
+            categories (Optional[Dict]): Categories offered to the model, None if the analysis has no categories
+
+        Returns:
+            str: SHA-256 hash of the normalized text and the analysis settings
+        """
+        settings = json.dumps([model, prompt_version, categories], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(f"{cls.normalize_text(text)}\x1f{settings}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Get the cached results of many keys and mark them as recently used.
+
+        Args:
+            keys (Iterable[str]): Cache keys
+
+        Returns:
+            Dict[str, Dict]: Cached results keyed by cache key, without the keys which are not cached
+        """
+        keys = list(dict.fromkeys(keys))
+        results = {}
+
+        with closing(self.connect()) as connection, connection:
+            for i in range(0, len(keys), self.MAX_PARAMETERS):
+                chunk = keys[i:i + self.MAX_PARAMETERS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(f"SELECT cache_key, result FROM analysis_cache WHERE cache_key IN ({placeholders})", chunk).fetchall()
+                results.update({key: json.loads(result) for key, result in rows})
+
+                connection.execute(f"UPDATE analysis_cache SET accessed_at = ? WHERE cache_key IN ({placeholders})", [time.time()] + chunk)
+
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+
+        return results
+
+    def set_many(self, results: Dict[str, Dict], prompt_version: str):
+        """
+        Store many results and evict the least recently used results beyond the maximum number of entries.
+
+        Args:
+            results (Dict[str, Dict]): Results keyed by cache key
+            prompt_version (str): Version of the prompt the results were produced with
+        """
+        if not results:
+            return
+
+        now = time.time()
+        with closing(self.connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, prompt_version, result, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, prompt_version, json.dumps(result, ensure_ascii=False), now, now) for key, result in results.items()]
+            )
+
+            excess = connection.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM analysis_cache WHERE cache_key IN (SELECT cache_key FROM analysis_cache ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+
+    def read_through(self, texts: List[str], analyze: Callable[[List[str]], List[Dict]], model: str, prompt_version: str, categories: Optional[Dict] = None) -> List[Dict]:
+        """
+        Get the results of many texts from the cache, analyzing each distinct text missing from it once and caching its result.
+        The analysis validates the results it returns, falling back for the texts without a valid result. Fallback results,
+        which carry an "error" key, are returned but not cached.
+
+        Args:
+            texts (List[str]): Texts to analyze
+            analyze (Callable[[List[str]], List[Dict]]): Function analyzing the texts missing from the cache
+            model (str): Chat completion model
+            prompt_version (str): Version of the prompt of the analysis
+            categories (Optional[Dict]): Categories offered to the model, None if the analysis has no categories
+
+        Returns:
+            List[Dict]: Result of each text, in the order of the texts
+        """
+        keys = [self.make_key(text, model, prompt_version, categories) for text in texts]
+        results = self.get_many(keys)
+
+        # Identical texts are analyzed only once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in results and key not in missing:
+                missing[key] = text
+
+        if missing:
+            analyzed = dict(zip(missing.keys(), analyze(list(missing.values()))))
+            self.set_many({key: result for key, result in analyzed.items() if "error" not in result}, prompt_version)
+            results.update(analyzed)
+
+        return [results[key] for key in keys]
+
+    def invalidate(self, prompt_version: str) -> int:
+        """
+        Remove the results of a prompt version, i.e. after the prompt was changed without changing its version.
+
+        Args:
+            prompt_version (str): Version of the prompt
+
+        Returns:
+            int: Number of removed results
+        """
+        with closing(self.connect()) as connection, connection:
+            return connection.execute("DELETE FROM analysis_cache WHERE prompt_version = ?", (prompt_version,)).rowcount
+
+    def stats(self) -> Dict:
+        """
+        Get the statistics of the cache.
+
+        Returns:
+            Dict: Hits, misses and evictions of this run, hit rate and number of cached results
+        """
+        with closing(self.connect()) as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+            "entries": entries
+        }
+
+
+if __name__ == "__main__":
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
@@ -0,0 +1,380 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+import llm_cache as lc
+import llm_batch as lb
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class TokenBucket:
+    def __init__(self, capacity_per_minute: float):
+        """
+        Initialize a token bucket refilled continuously up to its capacity every minute.
+
+        Args:
+            capacity_per_minute (float): Number of tokens available per minute, 0 for no limit
+        """
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.refill_rate = self.capacity / 60
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        """
+        Add the tokens earned since the last update.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float):
+        """
+        Wait until the amount of tokens is available and take it.
+
+        Args:
+            amount (float): Number of tokens to take, capped to the capacity of the bucket
+        """
+        if self.capacity <= 0:
+            return
+
+        amount = min(amount, self.capacity)
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+
+            await asyncio.sleep((amount - self.tokens) / self.refill_rate)
+
+    def adjust(self, amount: float):
+        """
+        Give back or take more tokens once the actual usage is known.
+
+        Args:
+            amount (float): Number of tokens to give back, negative to take more
+        """
+        if self.capacity <= 0:
+            return
+
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds: float):
+        """
+        Empty the bucket so that no request is sent for the given time, i.e. after the API reported a rate limit.
+
+        Args:
+            seconds (float): Number of seconds to wait
+        """
+        if self.capacity <= 0:
+            return
+
+        self.refill()
+        self.tokens = min(self.tokens, -seconds * self.refill_rate)
+
+
+class LlmExecutor:
+    # Throttled and transient server errors are retried, any other error is raised
+    RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = "gpt-4o-mini-2024-07-18",
+        max_concurrency: int = 16,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200000,
+        max_retries: int = 6,
+        max_backoff: float = 60,
+        cache: lc.AnalysisCache = None,
+        batch_runner: lb.BatchJobRunner = None
+    ):
+        """
+        Initialize the executor running chat completions concurrently within the rate limits of the account.
+
+        Args:
+            api_key (str, optional): OpenAI API key. If None, reads from environment.
+            model (str): Chat completion model
+            max_concurrency (int): Maximum number of requests in flight
+            requests_per_minute (int): Requests per minute limit, 0 for no limit
+            tokens_per_minute (int): Tokens per minute limit, 0 for no limit
+            max_retries (int): Number of retries of throttled or failed requests
+            max_backoff (float): Maximum number of seconds to wait between retries
+            cache (lc.AnalysisCache, optional): Persistent cache of the analysis results. If None, every text is analyzed.
+            batch_runner (lb.BatchJobRunner, optional): Runner of offline batch jobs. If set, the analyses run as batch jobs
+                instead of concurrent requests.
+        """
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.batch_runner = batch_runner
+
+        # The buckets are shared by all the analyzers using this executor
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+    async def complete(self, client: AsyncOpenAI, semaphore: asyncio.Semaphore, messages: List[Dict], max_tokens: int = 300, **kwargs) -> str:
+        """
+        Run a chat completion within the rate limits, retrying throttled and failed requests.
+
+        Args:
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+            messages (List[Dict]): Chat messages
+            max_tokens (int): Maximum number of completion tokens
+            **kwargs: Other chat completion parameters
+
+        Returns:
+            str: Content of the completion
+        """
+        # Roughly 4 characters per token, the bucket is corrected with the actual usage afterwards
+        estimated_tokens = sum(len(message["content"]) for message in messages) // 4 + max_tokens
+
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimated_tokens)
+
+            try:
+                async with semaphore:
+                    response = await client.chat.completions.create(model=self.model, messages=messages, max_tokens=max_tokens, **kwargs)
+
+                if response.usage is not None:
+                    self.token_bucket.adjust(estimated_tokens - response.usage.total_tokens)
+
+                return response.choices[0].message.content
+
+            except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                status_code = getattr(e, "status_code", None)
+                if attempt == self.max_retries or (status_code is not None and status_code not in self.RETRY_STATUS_CODES):
+                    raise
+
+                delay = self.get_retry_delay(attempt, getattr(e, "response", None))
+                if status_code == 429:
+                    # Hold back every request, not only the throttled one
+                    self.request_bucket.pause(delay)
+
+                await asyncio.sleep(delay)
+
+    def get_retry_delay(self, attempt: int, response: Any) -> float:
+        """
+        Get the number of seconds to wait before retrying, as requested by the rate limit headers or else with exponential backoff.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting from 0
+            response (Any): Failed HTTP response, None if the request failed without a response
+
+        Returns:
+            float: Delay in seconds
+        """
+        headers = response.headers if response is not None else {}
+
+        delays = []
+        if headers.get("retry-after-ms"):
+            delays.append(self.parse_duration(headers["retry-after-ms"] + "ms"))
+        elif headers.get("retry-after"):
+            delays.append(self.parse_duration(headers["retry-after"]))
+
+        # Reset times of the exhausted limits, i.e. "1s", "6m0s" or "250ms"
+        for limit in ["requests", "tokens"]:
+            if headers.get(f"x-ratelimit-remaining-{limit}") == "0" and headers.get(f"x-ratelimit-reset-{limit}"):
+                delays.append(self.parse_duration(headers[f"x-ratelimit-reset-{limit}"]))
+
+        delays = [delay for delay in delays if delay is not None]
+        if delays:
+            return min(max(delays), self.max_backoff)
+
+        # Full jitter keeps concurrent requests from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, 2 ** attempt))
+
+    @staticmethod
+    def parse_duration(value: str) -> Optional[float]:
+        """
+        Parse a rate limit duration, either a number of seconds or a duration such as "1m30.5s".
+
+        Args:
+            value (str): Header value
+
+        Returns:
+            Optional[float]: Number of seconds, None if the value is not a duration
+        """
+        try:
+            return float(value)
+        except ValueError:
+            pass
+
+        parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+        if not parts:
+            return None
+
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * units[unit] for number, unit in parts)
+
+    def map(self, function: Callable[..., Awaitable], items: Iterable) -> List:
+        """
+        Run an async analysis over many items concurrently.
+
+        Args:
+            function (Callable[..., Awaitable]): Async function called with each item, the OpenAI client and the concurrency limit
+            items (Iterable): Items to analyze
+
+        Returns:
+            List: Result of each item, in the order of the items
+        """
+        items = list(items)
+
+        async def run_all():
+            # The client and the semaphore belong to the event loop they are created in
+            async with AsyncOpenAI(api_key=self.api_key, max_retries=0) as client:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                return await asyncio.gather(*[function(item, client, semaphore) for item in items])
+
+        return self.run(run_all())
+
+    def map_chunks(self, function: Callable[..., Awaitable], items: Iterable, chunk_size: int) -> List:
+        """
+        Run an async analysis over chunks of many items concurrently, i.e. to analyze several items in one request.
+
+        Args:
+            function (Callable[..., Awaitable]): Async function called with each chunk, the OpenAI client and the concurrency limit,
+                returning a result per item of the chunk
+            items (Iterable): Items to analyze
+            chunk_size (int): Number of items per chunk
+
+        Returns:
+            List: Result of each item, in the order of the items
+        """
+        items = list(items)
+        chunk_size = max(1, chunk_size)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        return [result for chunk_results in self.map(function, chunks) for result in chunk_results]
+
+    def analyze_texts(
+        self,
+        function: Callable[..., Awaitable],
+        texts: List[str],
+        chunk_size: int,
+        prompt_version: str,
+        categories: Optional[Dict] = None,
+        build_request: Callable[[List[str]], Dict] = None,
+        parse_response: Callable[[str, List[str]], Dict[int, Dict]] = None
+    ) -> List[Dict]:
+        """
+        Analyze many texts in chunks, reading the results through the cache when there is one.
+
+        Args:
+            function (Callable[..., Awaitable]): Async function called with each chunk, the OpenAI client and the concurrency limit,
+                returning a result per text of the chunk
+            texts (List[str]): Texts to analyze
+            chunk_size (int): Number of texts per chunk
+            prompt_version (str): Version of the prompt of the analysis
+            categories (Optional[Dict]): Categories offered to the model, None if the analysis has no categories
+            build_request (Callable[[List[str]], Dict], optional): Function building the chat completion parameters of a chunk,
+                required to run the analysis as a batch job
+            parse_response (Callable[[str, List[str]], Dict[int, Dict]], optional): Function mapping the completion content of a
+                chunk to the results keyed by position in the chunk, required to run the analysis as a batch job
+
+        Returns:
+            List[Dict]: Result of each text, in the order of the texts
+        """
+        if self.batch_runner is not None and build_request is not None and parse_response is not None:
+            analyze = lambda missing_texts: self.run_batch_job(function, missing_texts, chunk_size, build_request, parse_response)
+        else:
+            analyze = lambda missing_texts: self.map_chunks(function, missing_texts, chunk_size)
+
+        if self.cache is None:
+            return analyze(texts)
+
+        return self.cache.read_through(texts, analyze, self.model, prompt_version, categories)
+
+    def run_batch_job(
+        self,
+        function: Callable[..., Awaitable],
+        texts: List[str],
+        chunk_size: int,
+        build_request: Callable[[List[str]], Dict],
+        parse_response: Callable[[str, List[str]], Dict[int, Dict]]
+    ) -> List[Dict]:
+        """
+        Analyze many texts in chunks as an offline batch job. The texts the job returned no valid result for are analyzed
+        in chunks of the same size with concurrent requests afterwards.
+
+        Args:
+            function (Callable[..., Awaitable]): Async function analyzing a chunk with concurrent requests
+            texts (List[str]): Texts to analyze
+            chunk_size (int): Number of texts per chunk
+            build_request (Callable[[List[str]], Dict]): Function building the chat completion parameters of a chunk
+            parse_response (Callable[[str, List[str]], Dict[int, Dict]]): Function mapping the completion content of a chunk
+                to the results keyed by position in the chunk
+
+        Returns:
+            List[Dict]: Result of each text, in the order of the texts
+        """
+        chunk_size = max(1, chunk_size)
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+        contents = self.batch_runner.run({f"chunk-{i}": dict(model=self.model, **build_request(chunk)) for i, chunk in enumerate(chunks)})
+
+        results = [None] * len(texts)
+        for i, chunk in enumerate(chunks):
+            parsed = {}
+            if f"chunk-{i}" in contents:
+                try:
+                    parsed = parse_response(contents[f"chunk-{i}"], chunk)
+                except Exception:
+                    parsed = {}
+
+            for position, result in parsed.items():
+                results[i * chunk_size + position] = result
+
+        missing = [position for position, result in enumerate(results) if result is None]
+        if missing:
+            print(f"Analyzing {len(missing)} texts without a valid batch result with concurrent requests...")
+            for position, result in zip(missing, self.map_chunks(function, [texts[position] for position in missing], chunk_size)):
+                results[position] = result
+
+        return results
+
+    @staticmethod
+    def run(coroutine: Awaitable) -> Any:
+        """
+        Run a coroutine to completion, in a separate thread when an event loop is already running, i.e. in a notebook.
+
+        Args:
+            coroutine (Awaitable): Coroutine to run
+
+        Returns:
+            Any: Result of the coroutine
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+
+        result = {}
+
+        def run_in_thread():
+            try:
+                result["value"] = asyncio.run(coroutine)
+            except BaseException as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run_in_thread)
+        thread.start()
+        thread.join()
+
+        if "error" in result:
+            raise result["error"]
+
+        return result["value"]
+
+
+if __name__ == "__main__":
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
@@ -1,21 +1,24 @@
-import os
-import time
-import random
+import asyncio
 import pandas as pd
 import json
-from openai import OpenAI
+import llm_executor as le
+from openai import AsyncOpenAI
 from typing import Dict, List
 
 class ContentCategorizer:
-    def __init__(self, api_key: str = None):
+    # Change the version whenever the prompts change, so that results cached for the previous prompts are not reused
+    PROMPT_VERSION = "post-categorization-v1"
+
+    def __init__(self, api_key: str = None, executor: le.LlmExecutor = None):
         """
-        Initialize the content categorizer with OpenAI client.
-        
+        Initialize the content categorizer with a rate-limited OpenAI executor.
+
         Args:
             api_key (str, optional): OpenAI API key. If None, reads from environment.
+            executor (le.LlmExecutor, optional): Executor shared with other analyzers. If None, one is created with the default limits.
         """
-        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
-        
+        self.executor = executor or le.LlmExecutor(api_key=api_key)
+
         # Define categories and their descriptions
         self.categories = {
             "Sustainability": "Posts about eco-friendly products, green initiatives, or energy-efficient solutions",
@@ -25,33 +28,29 @@ class ContentCategorizer:
             "Customer_Engagement": "Posts containing user testimonials, reviews, and customer stories",
             "Promotions": "Posts announcing discounts, special deals, and seasonal campaigns"
         }
-    
-    def categorize_content(self, post: str) -> Dict:
+
+    def build_messages(self, post: str) -> List[Dict]:
         """
-        Categorize a post into predefined categories using GPT-4 Omni.
-        
+        Build the chat messages categorizing a post.
+
         Args:
             post (str): The social media post to categorize
-        
+
         Returns:
-            Dict: Structured categorization result
+            List[Dict]: Chat messages
         """
-        try:
-            # Create a description of categories for the prompt
-            categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini-2024-07-18",
-                response_format={"type": "json_object"},
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
-                        "Analyze posts and categorize them based on predefined categories."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"""Analyze the following post and categorize it according to these categories:
+        # Create a description of categories for the prompt
+        categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
+                "Analyze posts and categorize them based on predefined categories."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze the following post and categorize it according to these categories:
 
 {categories_desc}
 
@@ -65,96 +64,250 @@ Provide a JSON response with these keys:
 - reasoning: Brief explanation of the categorization
 
 Ensure the response is a valid JSON object."""
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
+            }
+        ]
+
+    def build_batch_messages(self, posts: List[str]) -> List[Dict]:
+        """
+        Build the chat messages categorizing several posts in one request, each tagged with its position as ID.
+
+        Args:
+            posts (List[str]): The social media posts to categorize
+
+        Returns:
+            List[Dict]: Chat messages
+        """
+        # Create a description of categories for the prompt
+        categories_desc = "\n".join([f"- {k}: {v}" for k, v in self.categories.items()])
+        tagged_posts = json.dumps([{"id": str(i), "text": post} for i, post in enumerate(posts)], ensure_ascii=False)
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an AI specialized in categorizing Davis & Shirtliff's social media content. "
+                "Analyze posts and categorize them based on predefined categories."
+            },
+            {
+                "role": "user",
+                "content": f"""Analyze each of the following posts and categorize it according to these categories:
+
+{categories_desc}
+
+Posts, as a JSON array of objects with an id and a text:
+{tagged_posts}
+
+Provide a JSON response with a "results" key holding an array with one object per post, each with these keys:
+- id: The id of the post
+- primary_category: Main category the post belongs to
+- secondary_categories: Array of other relevant categories (if any)
+- confidence_score: Confidence level (0-1)
+- keywords: Array of key terms that influenced the categorization
+- reasoning: Brief explanation of the categorization
+
+Ensure the response is a valid JSON object."""
+            }
+        ]
+
+    def parse_result(self, result: Dict) -> Dict:
+        """
+        Validate the structure of a categorization result.
+
+        Args:
+            result (Dict): Result returned by the model
+
+        Returns:
+            Dict: Structured categorization result
+
+        Raises:
+            ValueError: If a key is missing or holds a value out of the expected ones
+        """
+        missing = [key for key in ('primary_category', 'secondary_categories', 'confidence_score', 'keywords', 'reasoning') if key not in result]
+        if missing:
+            raise ValueError(f"Categorization result without {', '.join(missing)}")
+
+        if result['primary_category'] not in self.categories:
+            raise ValueError(f"Unexpected primary category: {result['primary_category']}")
+
+        confidence_score = result['confidence_score']
+        if isinstance(confidence_score, bool) or not isinstance(confidence_score, (int, float)) or not 0 <= confidence_score <= 1:
+            raise ValueError(f"Confidence score out of 0-1: {confidence_score}")
+
+        if not isinstance(result['secondary_categories'], list) or not isinstance(result['keywords'], list):
+            raise ValueError("Secondary categories or keywords are not an array")
+
+        result['confidence_score'] = float(confidence_score)
+
+        return result
+
+    def build_request(self, posts: List[str]) -> Dict:
+        """
+        Build the chat completion parameters categorizing one or more posts.
+
+        Args:
+            posts (List[str]): The social media posts to categorize
+
+        Returns:
+            Dict: Chat completion parameters
+        """
+        return {
+            "messages": self.build_messages(posts[0]) if len(posts) == 1 else self.build_batch_messages(posts),
+            "max_tokens": 300 * len(posts),
+            "response_format": {"type": "json_object"},
+            "temperature": 0.3
+        }
+
+    def parse_response(self, content: str, posts: List[str]) -> Dict[int, Dict]:
+        """
+        Map the response to a request built by build_request back to the posts.
+
+        Args:
+            content (str): Content of the completion
+            posts (List[str]): The social media posts of the request
+
+        Returns:
+            Dict[int, Dict]: Structured categorization results keyed by position of the post, without the posts missing
+                from the response or with an invalid result
+        """
+        if len(posts) == 1:
+            return {0: self.parse_result(json.loads(content))}
+
+        # Map the results back to the posts by ID
+        results = {}
+        for item in json.loads(content).get('results', []):
+            try:
+                position = int(item.pop('id'))
+                if 0 <= position < len(posts):
+                    results[position] = self.parse_result(item)
+            except Exception:
+                continue
+
+        return results
+
+    async def categorize_async(self, post: str, client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> Dict:
+        """
+        Categorize a post into predefined categories using GPT-4 Omni within the rate limits of the executor.
+
+        Args:
+            post (str): The social media post to categorize
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            Dict: Structured categorization result
+        """
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request([post]))
+
             # Parse the response
-            result = json.loads(response.choices[0].message.content)
-            
-            # Validate the result structure
-            result['primary_category'] = result.get('primary_category', 'Uncategorized')
-            result['secondary_categories'] = result.get('secondary_categories', [])
-            result['confidence_score'] = float(result.get('confidence_score', 0.5))
-            result['keywords'] = result.get('keywords', [])
-            result['reasoning'] = result.get('reasoning', 'No specific reasoning provided')
-            
-            return result
-        
+            return self.parse_response(content, [post])[0]
+
         except Exception as e:
             return {
                 "primary_category": "Uncategorized",
                 "secondary_categories": [],
                 "confidence_score": 0.5,
                 "keywords": [],
-                "reasoning": f"Error in categorization: {str(e)}"
+                "reasoning": f"Error in categorization: {str(e)}",
+                "error": str(e)
             }
-    
+
+    async def categorize_batch_async(self, posts: List[str], client: AsyncOpenAI, semaphore: asyncio.Semaphore) -> List[Dict]:
+        """
+        Categorize several posts in one request. The posts missing from the response or with an invalid result are
+        categorized on their own.
+
+        Args:
+            posts (List[str]): The social media posts to categorize
+            client (AsyncOpenAI): OpenAI client of the running event loop
+            semaphore (asyncio.Semaphore): Concurrency limit of the running event loop
+
+        Returns:
+            List[Dict]: Structured categorization result of each post
+        """
+        if len(posts) == 1:
+            return [await self.categorize_async(posts[0], client, semaphore)]
+
+        results = {}
+        try:
+            content = await self.executor.complete(client, semaphore, **self.build_request(posts))
+            results = self.parse_response(content, posts)
+
+        except Exception as e:
+            print(f"Batch categorization error, categorizing the posts one by one: {str(e)}")
+
+        missing = [i for i in range(len(posts)) if i not in results]
+        missing_results = await asyncio.gather(*[self.categorize_async(posts[i], client, semaphore) for i in missing])
+        for i, result in zip(missing, missing_results):
+            results[i] = result
+
+        return [results[i] for i in range(len(posts))]
+
+    def categorize_content(self, post: str) -> Dict:
+        """
+        Categorize a post into predefined categories using GPT-4 Omni.
+
+        Args:
+            post (str): The social media post to categorize
+
+        Returns:
+            Dict: Structured categorization result
+        """
+        return self.executor.analyze_texts(self.categorize_batch_async, [post], 1, self.PROMPT_VERSION, self.categories)[0]
+
     def batch_categorization(
-        self, 
-        df: pd.DataFrame, 
-        post_column: str, 
-        batch_size: int = 10, 
-        delay_range: tuple = (1, 3)
+        self,
+        df: pd.DataFrame,
+        post_column: str,
+        items_per_request: int = 1
     ) -> pd.DataFrame:
         """
-        Perform batch categorization with rate limiting and error handling.
-        
+        Categorize all the posts concurrently, within the rate limits of the executor.
+
         Args:
             df (pd.DataFrame): Input DataFrame
             post_column (str): Name of the column containing posts
-            batch_size (int): Number of posts to process in each batch
-            delay_range (tuple): Range of random delay between batches (min, max)
-        
+            items_per_request (int): Number of posts categorized in each request
+
         Returns:
             pd.DataFrame: DataFrame with added categorization columns
         """
         result_df = df.copy()
-        
+
         # Prepare columns for categorization results
         result_df['Primary_Category'] = 'Uncategorized'
         result_df['Secondary_Categories'] = None
         result_df['Confidence_Score'] = 0.5
         result_df['Keywords'] = None
         result_df['Categorization_Reasoning'] = ''
-        
-        # Process posts in batches
-        for i in range(0, len(result_df), batch_size):
+
+        posts = [(idx, post) for idx, post in result_df[post_column].items() if isinstance(post, str) and post.strip()]
+
+        # Perform categorization for all the posts at once
+        results = self.executor.analyze_texts(
+            self.categorize_batch_async,
+            [post for _, post in posts],
+            items_per_request,
+            self.PROMPT_VERSION,
+            self.categories,
+            self.build_request,
+            self.parse_response
+        )
+
+        for (idx, _), result in zip(posts, results):
             try:
-                batch = result_df.iloc[i:i+batch_size]
-                
-                for idx, row in batch.iterrows():
-                    try:
-                        post = row[post_column]
-                        
-                        if not isinstance(post, str) or not post.strip():
-                            continue
-                        
-                        # Perform categorization
-                        result = self.categorize_content(post)
-                        
-                        # Update DataFrame with results
-                        result_df.at[idx, 'Primary_Category'] = result['primary_category']
-                        result_df.at[idx, 'Secondary_Categories'] = ', '.join(result['secondary_categories'])
-                        result_df.at[idx, 'Confidence_Score'] = result['confidence_score']
-                        result_df.at[idx, 'Keywords'] = ', '.join(result['keywords'])
-                        result_df.at[idx, 'Categorization_Reasoning'] = result['reasoning']
-                    
-                    except Exception as post_error:
-                        result_df.at[idx, 'Categorization_Reasoning'] = f"Individual post categorization error: {str(post_error)}"
-                
-                # Random delay between batches
-                delay = random.uniform(delay_range[0], delay_range[1])
-                time.sleep(delay)
-            
-            except Exception as batch_error:
-                print(f"Batch processing error at index {i}: {str(batch_error)}")
-        
+                # Update DataFrame with results
+                result_df.at[idx, 'Primary_Category'] = result['primary_category']
+                result_df.at[idx, 'Secondary_Categories'] = ', '.join(result['secondary_categories'])
+                result_df.at[idx, 'Confidence_Score'] = result['confidence_score']
+                result_df.at[idx, 'Keywords'] = ', '.join(result['keywords'])
+                result_df.at[idx, 'Categorization_Reasoning'] = result['reasoning']
+
+            except Exception as post_error:
+                result_df.at[idx, 'Categorization_Reasoning'] = f"Individual post categorization error: {str(post_error)}"
+
         return result_df
-    
+
 
 
 if __name__ == "__main__":
-    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
\ No newline at end of file
+    print("This is a module and cannot be run directly. Please import it and use the methods directly.")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Facebook modules import each other by file name, as the scripts are run from this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
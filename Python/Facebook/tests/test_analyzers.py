@@ -0,0 +1,136 @@
+import asyncio
+import json
+import pytest
+import comment_analysis as ca
+import comment_sentiment as cs
+import comment_message_categorization as cmt
+import llm_cache as lc
+import llm_executor as le
+import post_message_categorization as pmc
+
+
+class StubExecutor:
+    def __init__(self, outcomes):
+        """
+        Stand-in for LlmExecutor answering the completions with the given contents in order.
+
+        Args:
+            outcomes (list): Completion content of each call
+        """
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    async def complete(self, client, semaphore, messages, **kwargs):
+        self.calls.append(messages)
+        return self.outcomes.pop(0)
+
+
+def sentiment(**overrides) -> dict:
+    return {"sentiment": "Positive", "confidence_score": 0.9, "key_emotions": ["joy"], "reasoning": "Praise", **overrides}
+
+
+def categorization(primary_category: str, **overrides) -> dict:
+    return {
+        "primary_category": primary_category,
+        "secondary_categories": [],
+        "confidence_score": 0.8,
+        "keywords": ["pump"],
+        "reasoning": "Asks about a pump",
+        **overrides
+    }
+
+
+@pytest.mark.parametrize("result", [
+    {"sentiment": "Positive"},
+    sentiment(sentiment="Happy"),
+    sentiment(confidence_score=1.5),
+    sentiment(confidence_score="0.9"),
+    sentiment(key_emotions="joy")
+])
+def test_invalid_sentiment_results_are_rejected(result):
+    with pytest.raises(ValueError):
+        cs.SentimentAnalyzer(executor=StubExecutor([])).parse_result(result)
+
+
+@pytest.mark.parametrize("analyzer, result", [
+    (cmt.ContentCategorizer, {"primary_category": "Product Inquiry"}),
+    (cmt.ContentCategorizer, categorization("Uncategorized")),
+    (cmt.ContentCategorizer, categorization("Product Inquiry", confidence_score=-0.1)),
+    (pmc.ContentCategorizer, categorization("Product Inquiry")),
+    (pmc.ContentCategorizer, categorization("Products", keywords=None))
+])
+def test_invalid_categorization_results_are_rejected(analyzer, result):
+    with pytest.raises(ValueError):
+        analyzer(executor=StubExecutor([])).parse_result(result)
+
+
+def test_partial_items_of_a_batch_are_analyzed_on_their_own():
+    executor = StubExecutor([
+        json.dumps({"results": [{"id": "0", **sentiment()}, {"id": "1", "sentiment": "Negative"}]}),
+        json.dumps(sentiment(sentiment="Negative", confidence_score=0.7))
+    ])
+    analyzer = cs.SentimentAnalyzer(executor=executor)
+
+    results = asyncio.run(analyzer.analyze_batch_async(["Great pump", "Broke in a week"], None, None))
+
+    assert [(result["sentiment"], result["confidence_score"]) for result in results] == [("Positive", 0.9), ("Negative", 0.7)]
+    assert "Broke in a week" in executor.calls[1][-1]["content"]
+    assert "Great pump" not in executor.calls[1][-1]["content"]
+
+
+def test_partial_item_answered_alone_gets_the_error_result():
+    executor = StubExecutor([json.dumps({"primary_category": "Product Inquiry"})])
+    categorizer = cmt.ContentCategorizer(executor=executor)
+
+    results = asyncio.run(categorizer.categorize_batch_async(["Is the pump in stock?"], None, None))
+
+    assert results[0]["primary_category"] == "Uncategorized"
+    assert "error" in results[0]
+
+
+def analysis(**overrides) -> dict:
+    return {
+        "sentiment": "Neutral",
+        "sentiment_confidence_score": 0.6,
+        "key_emotions": [],
+        "sentiment_reasoning": "A question",
+        "primary_category": "Product Inquiry",
+        "secondary_categories": [],
+        "category_confidence_score": 0.8,
+        "keywords": ["pump"],
+        "categorization_reasoning": "Asks about a pump",
+        **overrides
+    }
+
+
+@pytest.mark.parametrize("item", [
+    {key: value for key, value in analysis().items() if key != "category_confidence_score"},
+    analysis(sentiment="Curious"),
+    analysis(primary_category="Uncategorized")
+])
+def test_invalid_half_of_a_combined_item_is_analyzed_again(item):
+    executor = StubExecutor([
+        json.dumps({"results": [{"id": "0", **analysis()}, {"id": "1", **item}]}),
+        json.dumps({"results": [{"id": "0", **analysis(sentiment="Positive")}]})
+    ])
+    analyzer = ca.CommentAnalyzer(executor=executor)
+
+    results = asyncio.run(analyzer.analyze_batch_async(["Is the pump in stock?", "Love the new pump"], None, None))
+
+    assert [result["sentiment"]["sentiment"] for result in results] == ["Neutral", "Positive"]
+    assert all("error" not in result for result in results)
+    assert len(executor.calls) == 2
+
+
+def test_partial_answer_is_not_cached(tmp_path):
+    executor = le.LlmExecutor(api_key="test", cache=lc.AnalysisCache(str(tmp_path / "cache.db")))
+    stub = StubExecutor([json.dumps({"sentiment": "Positive"}), json.dumps(sentiment())])
+    executor.complete = stub.complete
+    analyzer = cs.SentimentAnalyzer(executor=executor)
+
+    assert "error" in analyzer.advanced_sentiment_analysis("Great pump")
+    assert executor.cache.get_many([lc.AnalysisCache.make_key("Great pump", executor.model, analyzer.PROMPT_VERSION)]) == {}
+
+    # The comment is analyzed again rather than read back with defaults
+    assert analyzer.advanced_sentiment_analysis("Great pump")["confidence_score"] == 0.9
+    assert len(stub.calls) == 2
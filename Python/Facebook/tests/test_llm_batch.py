@@ -0,0 +1,78 @@
+import json
+import pytest
+import llm_batch as lb
+import llm_cache as lc
+import llm_executor as le
+
+
+def build_request(texts: list) -> dict:
+    return {"messages": [{"role": "user", "content": json.dumps(texts)}], "max_tokens": 10}
+
+
+def parse_response(content: str, texts: list) -> dict:
+    return {int(item["id"]): {"value": item["value"]} for item in json.loads(content)["results"] if 0 <= int(item["id"]) < len(texts)}
+
+
+def respond(body: dict) -> str:
+    """
+    Answer a chunk with the upper cased texts, leaving out the texts containing "drop" and failing the chunks containing "fail".
+    """
+    texts = json.loads(body["messages"][0]["content"])
+    if any("fail" in text for text in texts):
+        raise ValueError("Chunk rejected")
+
+    return json.dumps({"results": [{"id": str(i), "value": text.upper()} for i, text in enumerate(texts) if "drop" not in text]})
+
+
+class FallbackAnalysis:
+    def __init__(self):
+        self.chunks = []
+
+    async def __call__(self, texts, client, semaphore):
+        self.chunks.append(list(texts))
+        return [{"value": "fallback", "error": "No valid result returned"} for _ in texts]
+
+
+@pytest.fixture
+def fallback():
+    return FallbackAnalysis()
+
+
+@pytest.fixture
+def executor(tmp_path):
+    runner = lb.BatchJobRunner(client=lb.LocalBatchClient(respond), work_directory=str(tmp_path / "batches"), poll_interval=0)
+    return le.LlmExecutor(api_key="test", batch_runner=runner)
+
+
+def test_batch_results_map_back_to_the_texts_by_chunk_and_position(executor, fallback):
+    texts = [f"text {i}" for i in range(7)]
+
+    results = executor.run_batch_job(fallback, texts, 3, build_request, parse_response)
+
+    assert results == [{"value": f"TEXT {i}"} for i in range(7)]
+    assert fallback.chunks == []
+
+
+def test_texts_without_a_batch_result_fall_back_in_chunks(executor, fallback):
+    texts = ["a", "drop b", "c", "fail d", "e", "f", "drop g"]
+
+    results = executor.run_batch_job(fallback, texts, 3, build_request, parse_response)
+
+    assert [result["value"] for result in results] == ["A", "fallback", "C", "fallback", "fallback", "fallback", "fallback"]
+    assert fallback.chunks == [["drop b", "fail d", "e"], ["f", "drop g"]]
+
+
+def test_fallback_results_are_not_cached(executor, fallback, tmp_path):
+    executor.cache = lc.AnalysisCache(str(tmp_path / "cache.db"))
+    texts = ["a", "drop b", "c"]
+
+    executor.analyze_texts(fallback, texts, 3, "test-v1", build_request=build_request, parse_response=parse_response)
+
+    cached = executor.cache.get_many([lc.AnalysisCache.make_key(text, executor.model, "test-v1") for text in texts])
+    assert sorted(result["value"] for result in cached.values()) == ["A", "C"]
+
+    # The text which fell back is analyzed again, the others are read from the cache
+    results = executor.analyze_texts(fallback, texts, 3, "test-v1", build_request=build_request, parse_response=parse_response)
+
+    assert [result["value"] for result in results] == ["A", "fallback", "C"]
+    assert fallback.chunks == [["drop b"], ["drop b"]]
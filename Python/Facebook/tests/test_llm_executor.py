@@ -0,0 +1,219 @@
+import asyncio
+import pytest
+import llm_executor as le
+from openai import APIStatusError
+from types import SimpleNamespace
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubAsyncOpenAI:
+    def __init__(self, outcomes):
+        """
+        Stand-in for AsyncOpenAI returning or raising the given outcomes in order.
+
+        Args:
+            outcomes (list): Completion content or exception of each call
+        """
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __call__(self, api_key=None, max_retries=None):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))], usage=None)
+
+
+def status_error(status_code: int, headers: dict = None) -> APIStatusError:
+    response = SimpleNamespace(status_code=status_code, headers=headers or {}, request=None)
+    return APIStatusError(f"Error code: {status_code}", response=response, body=None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(le, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(le.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def complete_all(executor: le.LlmExecutor, texts: list) -> list:
+    return executor.map(lambda text, client, semaphore: executor.complete(client, semaphore, [{"role": "user", "content": text}]), texts)
+
+
+def test_acquire_takes_available_tokens_without_waiting(clock):
+    bucket = le.TokenBucket(60)
+
+    asyncio.run(bucket.acquire(60))
+
+    assert clock.sleeps == []
+    assert bucket.tokens == 0
+
+
+def test_acquire_waits_for_the_refill(clock):
+    bucket = le.TokenBucket(60)
+    asyncio.run(bucket.acquire(60))
+
+    asyncio.run(bucket.acquire(30))
+
+    assert clock.sleeps == [pytest.approx(30)]
+    assert bucket.tokens == pytest.approx(0)
+
+
+def test_acquire_caps_the_amount_to_the_capacity(clock):
+    bucket = le.TokenBucket(60)
+
+    asyncio.run(bucket.acquire(1000))
+
+    assert clock.sleeps == []
+    assert bucket.tokens == 0
+
+
+def test_acquire_without_limit_never_waits(clock):
+    bucket = le.TokenBucket(0)
+
+    asyncio.run(bucket.acquire(10 ** 9))
+
+    assert clock.sleeps == []
+
+
+def test_pause_holds_back_the_next_acquire(clock):
+    bucket = le.TokenBucket(60)
+
+    bucket.pause(10)
+    asyncio.run(bucket.acquire(1))
+
+    assert bucket.tokens == pytest.approx(0)
+    assert sum(clock.sleeps) == pytest.approx(11)
+
+
+def test_pause_keeps_a_longer_debt(clock):
+    bucket = le.TokenBucket(60)
+    bucket.pause(10)
+
+    bucket.pause(5)
+
+    assert bucket.tokens == pytest.approx(-10)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1.5", 1.5),
+    ("250ms", 0.25),
+    ("1s", 1),
+    ("6m0s", 360),
+    ("1m30.5s", 90.5),
+    ("1h", 3600)
+])
+def test_parse_duration(value, seconds):
+    assert le.LlmExecutor.parse_duration(value) == pytest.approx(seconds)
+
+
+def test_parse_duration_of_an_invalid_value():
+    assert le.LlmExecutor.parse_duration("soon") is None
+
+
+def test_retry_after_ms_wins_over_retry_after():
+    executor = le.LlmExecutor(api_key="test")
+
+    delay = executor.get_retry_delay(0, SimpleNamespace(headers={"retry-after-ms": "1500", "retry-after": "10"}))
+
+    assert delay == pytest.approx(1.5)
+
+
+def test_retry_after_in_seconds():
+    executor = le.LlmExecutor(api_key="test")
+
+    assert executor.get_retry_delay(0, SimpleNamespace(headers={"retry-after": "2"})) == pytest.approx(2)
+
+
+def test_reset_of_an_exhausted_limit_is_waited_for():
+    executor = le.LlmExecutor(api_key="test", max_backoff=600)
+    headers = {
+        "retry-after": "2",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "20s",
+        "x-ratelimit-remaining-tokens": "0",
+        "x-ratelimit-reset-tokens": "6m0s"
+    }
+
+    assert executor.get_retry_delay(0, SimpleNamespace(headers=headers)) == pytest.approx(360)
+
+
+def test_reset_of_a_limit_which_is_not_exhausted_is_ignored():
+    executor = le.LlmExecutor(api_key="test")
+    headers = {"retry-after": "2", "x-ratelimit-remaining-tokens": "1000", "x-ratelimit-reset-tokens": "6m0s"}
+
+    assert executor.get_retry_delay(0, SimpleNamespace(headers=headers)) == pytest.approx(2)
+
+
+def test_requested_delay_is_capped_to_the_max_backoff():
+    executor = le.LlmExecutor(api_key="test", max_backoff=60)
+    headers = {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s"}
+
+    assert executor.get_retry_delay(0, SimpleNamespace(headers=headers)) == 60
+
+
+def test_backoff_without_headers_is_jittered_within_the_attempt_window():
+    executor = le.LlmExecutor(api_key="test", max_backoff=60)
+
+    delays = [executor.get_retry_delay(3, None) for _ in range(100)]
+
+    assert all(0 <= delay <= 8 for delay in delays)
+
+
+def test_non_retryable_status_is_raised_without_retrying(monkeypatch, clock):
+    client = StubAsyncOpenAI([status_error(400), "unused"])
+    monkeypatch.setattr(le, "AsyncOpenAI", client)
+    executor = le.LlmExecutor(api_key="test", requests_per_minute=0, tokens_per_minute=0)
+
+    with pytest.raises(APIStatusError) as error:
+        complete_all(executor, ["comment"])
+
+    assert error.value.status_code == 400
+    assert len(client.calls) == 1
+    assert clock.sleeps == []
+
+
+def test_throttled_request_is_retried_after_the_requested_delay(monkeypatch, clock):
+    client = StubAsyncOpenAI([status_error(429, {"retry-after": "2"}), "ok"])
+    monkeypatch.setattr(le, "AsyncOpenAI", client)
+    executor = le.LlmExecutor(api_key="test", requests_per_minute=0, tokens_per_minute=0)
+
+    assert complete_all(executor, ["comment"]) == ["ok"]
+    assert len(client.calls) == 2
+    assert clock.sleeps == [pytest.approx(2)]
+
+
+def test_retryable_status_is_raised_once_the_retries_are_used_up(monkeypatch, clock):
+    client = StubAsyncOpenAI([status_error(503, {"retry-after": "1"})] * 3)
+    monkeypatch.setattr(le, "AsyncOpenAI", client)
+    executor = le.LlmExecutor(api_key="test", requests_per_minute=0, tokens_per_minute=0, max_retries=2)
+
+    with pytest.raises(APIStatusError):
+        complete_all(executor, ["comment"])
+
+    assert len(client.calls) == 3